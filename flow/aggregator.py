@@ -8,6 +8,7 @@ from argparse import RawTextHelpFormatter
 from argparse import FileType
 from flow import pluginloader
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 from flow.buildconfig import BuildConfig
 from flow.cloud.cloudfoundry.cloudfoundry import CloudFoundry
 from flow.cloud.gcappengine.gcappengine import GCAppEngine
@@ -80,6 +81,8 @@ def main():
 
     connect_error_dispatcher()
 
+    httpclient.log_stats_at_exit()
+
     github = None
 
     # TODO check if there are any registered metrics endpoints defined in settings.ini. This is optional.
@@ -181,6 +184,9 @@ def main():
         elif args.action == 'download':
             create_deployment_directory()
             artifactory.download_and_extract_artifacts_locally(BuildConfig.push_location + '/', extract=args.extract in ['y','yes','true'] or args.extract is None)
+        elif args.action == 'promote':
+            artifactory.promote_build_artifact()
+            metrics.write_metric(task, args.action)
     elif task == 'cf':
         if BuildConfig.build_env_info['cf']:
             if 'version' not in args:
@@ -336,7 +342,10 @@ def load_task_parsers(subparsers):
     artifactory_parser = subparsers.add_parser("artifactory", help="Artifactory task",
                                                formatter_class=RawTextHelpFormatter)
     artifactory_parser.add_argument('action', help='Used to interact with and upload to Artifactory. Possible values: '
-                                                   '\n upload - upload an artifact to artifactory')
+                                                   '\n upload - upload an artifact to artifactory'
+                                                   '\n download - download an artifact from artifactory'
+                                                   '\n promote - copy a snapshot artifact to the release repo '
+                                                   'inside artifactory')
     artifactory_parser.add_argument('-x', '--extract', help='(optional) Only used for download action. Specifies whether the downloaded artifact should be extracted (only '
                                                         'applies to .tar .tar.gz .zip file formats). Default True.')
     artifactory_parser.add_argument('-v', '--version', help='(optional) If manually versioning, this is passed in by the '
@@ -1,17 +1,26 @@
 #!/usr/bin/python
 # artifactory.py
 
+import fnmatch
+import hashlib
 import json
+import mmap
 import os
 import os.path
+import shutil
 import tarfile
+import tempfile
+import threading
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 from flow.artifactstorage.artifact_storage_abc import Artifact_Storage
 from flow.buildconfig import BuildConfig
 
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 
 
 class ArtifactDownloadException(Exception): pass
@@ -20,18 +29,43 @@ class ArtifactDownloadException(Exception): pass
 class ArtifactException(Exception): pass
 
 
+class _ChecksumReader:
+    # hands a download to tarfile while hashing it and copying it into the cache on the way through
+    def __init__(self, raw, copy_to=None):
+        self.raw = raw
+        self.copy_to = copy_to
+        self.sha1 = hashlib.sha1()
+
+    def read(self, size=-1):
+        block = self.raw.read(size)
+        self.sha1.update(block)
+        if self.copy_to is not None:
+            self.copy_to.write(block)
+        return block
+
+    def drain(self, block_size):
+        while self.read(block_size):
+            pass
+
+
 class ArtiFactory(Artifact_Storage):
     clazz = 'ArtiFactory'
 
     repo_key = None
+    release_repo_key = None
+    snapshot_repo_key = None
     artifactory_domain = None
     artifactory_group = None
     artifactory_files = []
     artifactory_extensions = []
     pom_filename = None
     pom_file = None
+    extract_paths = None
     config = BuildConfig
     http_timeout = 30
+    checksum_block_size = 1024 * 1024
+    part_retries = 3
+    retry_sleep = time.sleep
 
     def __init__(self, config_override=None):
         method = '__init__'
@@ -40,6 +74,8 @@ class ArtiFactory(Artifact_Storage):
         if config_override is not None:
             self.config = config_override
 
+        self.storage_listings = {}
+
         try:
             # below line is to maintain backwards compatibility since stanza was renamed
             if 'artifactoryConfig' in self.config.json_config:
@@ -50,6 +86,12 @@ class ArtiFactory(Artifact_Storage):
             ArtiFactory.artifactory_domain = artifactory_json_config['artifactoryDomain']
             ArtiFactory.artifactory_group = artifactory_json_config['artifactoryGroup']
 
+            # only these paths are written when an artifact is extracted, everything by default
+            ArtiFactory.extract_paths = artifactory_json_config.get('extractPaths')
+
+            ArtiFactory.release_repo_key = artifactory_json_config.get('artifactoryRepoKey')
+            ArtiFactory.snapshot_repo_key = artifactory_json_config.get('artifactoryRepoKeySnapshot')
+
             if self.config.build_env_info['artifactCategory'] == 'release':
                 ArtiFactory.repo_key = artifactory_json_config['artifactoryRepoKey']
             else:
@@ -73,85 +115,176 @@ class ArtiFactory(Artifact_Storage):
         method = 'publish'
         commons.printMSG(ArtiFactory.clazz, method, 'begin')
 
-        headers = {'Content-type': commons.content_oct_stream, 'Accept': commons.content_json}
+        try:
+            self._publish(file, file_name)
+        except ArtifactException as ex:
+            commons.printMSG(ArtiFactory.clazz, method, str(ex), 'ERROR')
+            exit(1)
+
+        commons.printMSG(ArtiFactory.clazz, method, 'end')
+
+    def publish_stream(self, chunks, file_name):
+        method = 'publish_stream'
+        commons.printMSG(ArtiFactory.clazz, method, 'begin')
 
         try:
-            with open(file, 'rb') as zip_file:
-                file_url = "{artifact_home}/{file}".format(artifact_home=self.get_artifact_home_url(), file=file_name)
-                commons.printMSG(ArtiFactory.clazz, method, "Publishing to {}".format(file_url))
-
-                # token and user env variables
-                if os.getenv('ARTIFACTORY_TOKEN') and os.getenv('ARTIFACTORY_USER'):
-                    commons.printMSG(ArtiFactory.clazz, method, 'Found artifactory token and user.')
-                    resp = requests.put(file_url,
-                                        auth=(os.getenv('ARTIFACTORY_USER'), os.getenv('ARTIFACTORY_TOKEN')),
-                                        headers=headers,
-                                        data=zip_file,
-                                        timeout=self.http_timeout)
-
-                # token environment var and user defined in settings.ini
-                elif os.getenv('ARTIFACTORY_TOKEN') and BuildConfig.settings.has_section('artifactory') and \
-                        BuildConfig.settings.has_option('artifactory', 'user'):
-                    commons.printMSG(ArtiFactory.clazz, method, 'Found artifactory token.  Using default user '
-                                                                'specified in settings.ini.')
-                    resp = requests.put(file_url,
-                                        auth=(BuildConfig.settings.get('artifactory', 'user'),
-                                              os.getenv('ARTIFACTORY_TOKEN')),
-                                        headers=headers,
-                                        data=zip_file,
-                                        timeout=self.http_timeout)
-
-                # token only and assumed to be api key
-                elif os.getenv('ARTIFACTORY_TOKEN'):
-                    commons.printMSG(ArtiFactory.clazz, method, 'Found artifactory token.  Assuming it\'s API key.')
-
-                    headers = {'X-Api-Key': os.getenv('ARTIFACTORY_TOKEN'),
-                               'Content-type': commons.content_oct_stream,
-                               'Accept': commons.content_json}
-
-                    resp = requests.put(file_url,
-                                        headers=headers,
-                                        data=zip_file,
-                                        timeout=self.http_timeout)
+            self._publish_stream(chunks, file_name)
+        except ArtifactException as ex:
+            commons.printMSG(ArtiFactory.clazz, method, str(ex), 'ERROR')
+            exit(1)
 
-                else:
-                    commons.printMSG(ArtiFactory.clazz, method, 'No artifactory user specified.  This operation may '
-                                                                'fail if anonymous access is not allowed. To specify '
-                                                                'user, set environment variable \'ARTIFACTORY_TOKEN\' '
-                                                                'and \'ARTIFACTORY_USER\'.',
-                                     'WARN')
-                    resp = requests.put(file_url, headers=headers, data=zip_file, timeout=self.http_timeout)
+        commons.printMSG(ArtiFactory.clazz, method, 'end')
+
+    def _publish_stream(self, chunks, file_name):
+        method = 'publish_stream'
+
+        sha1 = hashlib.sha1()
+        size = [0]
+
+        def hashed_chunks():
+            for chunk in chunks:
+                sha1.update(chunk)
+                size[0] += len(chunk)
+                yield chunk
+
+        try:
+            file_url = "{artifact_home}/{file}".format(artifact_home=self.get_artifact_home_url(), file=file_name)
+            commons.printMSG(ArtiFactory.clazz, method, "Streaming to {}".format(file_url))
+
+            # the checksum is only known once the last chunk is sent, so there is no checksum deploy to try first.
+            # a spent generator cannot be sent twice, so the session must not retry the PUT.
+            auth, headers = self._get_auth_and_headers()
+            resp = httpclient.put(file_url, auth=auth, headers=headers, data=hashed_chunks(), retry=False,
+                                  timeout=self.http_timeout)
         except requests.ConnectionError:
-            commons.printMSG(ArtiFactory.clazz, method, "Request to Artifactory timed out.", "ERROR")
-            exit(1)
+            raise ArtifactException("Request to Artifactory timed out.")
         except Exception as ex:
-            commons.printMSG(ArtiFactory.clazz, method, "Failed publishing to artifactory: {}. Sometimes this can be "
-                                                        "due to an invalid user name/password.".format(ex), 'ERROR')
+            raise ArtifactException("Failed streaming to artifactory: {}".format(ex))
 
-            exit(1)
+        commons.printMSG(ArtiFactory.clazz, method, "resp status code: {}".format(resp.status_code))
+
+        if resp.status_code != 201:
+            raise ArtifactException("Publish to artifactory failed to {url} Response: {response}".format(
+                url=file_url, response=resp.text))
+
+        # artifactory answers with the checksums of what it stored, which has to be what was sent
+        try:
+            stored_sha1 = resp.json().get('checksums', {}).get('sha1')
+        except ValueError:
+            stored_sha1 = None
+        if stored_sha1 is not None and stored_sha1 != sha1.hexdigest():
+            raise ArtifactException("Artifactory stored {url} with sha1 {stored} but {sent} was sent".format(
+                url=file_url, stored=stored_sha1, sent=sha1.hexdigest()))
+
+        commons.printMSG(ArtiFactory.clazz, method, "Streamed {size:.1f} MB with sha1 {sha1}".format(
+            size=size[0] / 1048576, sha1=sha1.hexdigest()))
+
+    def _get_auth_and_headers(self, content_type=commons.content_oct_stream):
+        method = '_get_auth_and_headers'
+
+        headers = {'Content-type': content_type, 'Accept': commons.content_json}
+
+        # token and user env variables
+        if os.getenv('ARTIFACTORY_TOKEN') and os.getenv('ARTIFACTORY_USER'):
+            commons.printMSG(ArtiFactory.clazz, method, 'Found artifactory token and user.')
+            return (os.getenv('ARTIFACTORY_USER'), os.getenv('ARTIFACTORY_TOKEN')), headers
+
+        # token environment var and user defined in settings.ini
+        if os.getenv('ARTIFACTORY_TOKEN') and BuildConfig.settings.has_section('artifactory') and \
+                BuildConfig.settings.has_option('artifactory', 'user'):
+            commons.printMSG(ArtiFactory.clazz, method, 'Found artifactory token.  Using default user '
+                                                        'specified in settings.ini.')
+            return (BuildConfig.settings.get('artifactory', 'user'), os.getenv('ARTIFACTORY_TOKEN')), headers
+
+        # token only and assumed to be api key
+        if os.getenv('ARTIFACTORY_TOKEN'):
+            commons.printMSG(ArtiFactory.clazz, method, 'Found artifactory token.  Assuming it\'s API key.')
+            headers['X-Api-Key'] = os.getenv('ARTIFACTORY_TOKEN')
+            return None, headers
+
+        commons.printMSG(ArtiFactory.clazz, method, 'No artifactory user specified.  This operation may '
+                                                    'fail if anonymous access is not allowed. To specify '
+                                                    'user, set environment variable \'ARTIFACTORY_TOKEN\' '
+                                                    'and \'ARTIFACTORY_USER\'.',
+                         'WARN')
+        return None, headers
+
+    def _get_file_checksums(self, file):
+        sha1 = hashlib.sha1()
+        sha256 = hashlib.sha256()
+
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(ArtiFactory.checksum_block_size), b''):
+                sha1.update(block)
+                sha256.update(block)
+
+        return sha1.hexdigest(), sha256.hexdigest()
+
+    def _get_artifactory_setting(self, option, default):
+        if BuildConfig.settings is not None and BuildConfig.settings.has_option('artifactory', option) and \
+                BuildConfig.settings.get('artifactory', option).strip():
+            return BuildConfig.settings.getfloat('artifactory', option)
+
+        return default
+
+    def _get_journal_file(self, file, kind):
+        # the journal sits next to the file so a re-run of the same build picks up where the last one stopped
+        return os.path.join(os.path.dirname(os.path.abspath(file)), '.' + os.path.basename(file) + '.' + kind + '.json')
+
+    def _put_file(self, file, file_url, auth, headers):
+        # the mapped file goes to the socket as one buffer, so the bytes are never copied into python objects
+        if os.path.getsize(file) == 0:
+            return httpclient.put(file_url, auth=auth, headers=headers, data=b'', timeout=self.http_timeout)
+
+        with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                return httpclient.put(file_url, auth=auth, headers=headers, data=view, timeout=self.http_timeout)
+
+    def _publish(self, file, file_name):
+        method = 'publish'
+
+        try:
+            file_url = "{artifact_home}/{file}".format(artifact_home=self.get_artifact_home_url(), file=file_name)
+            commons.printMSG(ArtiFactory.clazz, method, "Publishing to {}".format(file_url))
+
+            auth, headers = self._get_auth_and_headers()
+            sha1, sha256 = self._get_file_checksums(file)
+            headers['X-Checksum-Sha1'] = sha1
+            headers['X-Checksum-Sha256'] = sha256
+
+            # artifactory can deploy bytes it already holds from the checksum alone.  404 means it has never seen them.
+            resp = httpclient.put(file_url, auth=auth, headers=dict(headers, **{'X-Checksum-Deploy': 'true'}),
+                                  timeout=self.http_timeout)
+
+            if resp.status_code == 201:
+                commons.printMSG(ArtiFactory.clazz, method, "Deployed {} by checksum {}".format(file_name, sha1))
+            elif resp.status_code == 404:
+                commons.printMSG(ArtiFactory.clazz, method, "Checksum {} not in artifactory, uploading {}".format(
+                    sha1, file_name))
+                resp = self._put_file(file, file_url, auth, headers)
+        except requests.ConnectionError:
+            raise ArtifactException("Request to Artifactory timed out.")
+        except Exception as ex:
+            raise ArtifactException("Failed publishing to artifactory: {}. Sometimes this can be due to an invalid "
+                                    "user name/password.".format(ex))
 
         commons.printMSG(ArtiFactory.clazz, method, "resp status code: {}".format(resp.status_code))
         commons.printMSG(ArtiFactory.clazz, method, "response: {}".format(resp.text))
 
         if resp.status_code != 201:
-            commons.printMSG(ArtiFactory.clazz,
-                             method,
-                             "Publish to artifactory failed to {home}{fwdslash}{file} Response: {"
-                             "response}".format(home=self.get_artifact_home_url(), fwdslash=commons.forward_slash,
-                                                file=file_name, response=resp.text), 'ERROR')
-            exit(1)
-        else:
-            commons.printMSG(ArtiFactory.clazz, method, resp.text)
+            raise ArtifactException("Publish to artifactory failed to {home}{fwdslash}{file} Response: {"
+                                    "response}".format(home=self.get_artifact_home_url(),
+                                                       fwdslash=commons.forward_slash, file=file_name,
+                                                       response=resp.text))
 
-        commons.printMSG(ArtiFactory.clazz, method, 'end')
+        commons.printMSG(ArtiFactory.clazz, method, resp.text)
 
     def publish_build_artifact(self):
         method = 'publish_build_artifact'
         commons.printMSG(ArtiFactory.clazz, method, 'begin')
 
         self._get_artifactory_files_name_from_build_dir()
-        for file in ArtiFactory.artifactory_files:
-            self.publish(file["artifactory_file"], file["artifactory_filename"])
+        uploads = [(file["artifactory_file"], file["artifactory_filename"]) for file in ArtiFactory.artifactory_files]
 
         if 'artifactoryConfig' in self.config.json_config:
             artifactory_json_config = self.config.json_config['artifactoryConfig']
@@ -160,10 +293,106 @@ class ArtiFactory(Artifact_Storage):
 
         if 'includePom' in artifactory_json_config:
             commons.printMSG(ArtiFactory.clazz, method, 'POM needed, publishing to artifactory')
-            self.publish(ArtiFactory.pom_file, ArtiFactory.pom_filename)
+            uploads.append((ArtiFactory.pom_file, ArtiFactory.pom_filename))
+
+        # resolve the version before starting any uploads so a missing version fails here and not in a worker
+        self.get_artifact_home_url()
+
+        failures = []
+        workers = min(self._get_upload_workers(), max(len(uploads), 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._timed_publish, file, file_name): file_name for file, file_name in uploads}
+
+            for finished, future in enumerate(as_completed(futures), start=1):
+                try:
+                    size, seconds = future.result()
+                    commons.printMSG(ArtiFactory.clazz, method, "Uploaded {file} ({done}/{total}) {size:.1f} MB in "
+                                                                "{seconds:.1f}s".format(file=futures[future],
+                                                                                        done=finished,
+                                                                                        total=len(uploads),
+                                                                                        size=size / 1048576,
+                                                                                        seconds=seconds))
+                except ArtifactException as ex:
+                    commons.printMSG(ArtiFactory.clazz, method, "Failed uploading {file} ({done}/{total})".format(
+                        file=futures[future], done=finished, total=len(uploads)), 'WARN')
+                    failures.append("{file}: {error}".format(file=futures[future], error=ex))
+
+        if failures:
+            commons.printMSG(ArtiFactory.clazz, method, "{failed} of {total} uploads failed.\r\n{errors}".format(
+                failed=len(failures), total=len(uploads), errors='\r\n'.join(failures)), 'ERROR')
+            exit(1)
+
+        commons.printMSG(ArtiFactory.clazz, method, 'end')
+
+    def promote_build_artifact(self):
+        method = 'promote_build_artifact'
+        commons.printMSG(ArtiFactory.clazz, method, 'begin')
+
+        commons.verify_version(self.config)
+
+        if not ArtiFactory.snapshot_repo_key or not ArtiFactory.release_repo_key:
+            commons.printMSG(ArtiFactory.clazz, method, "Promoting needs both artifactoryRepoKeySnapshot and "
+                                                        "artifactoryRepoKey in the build config", 'ERROR')
+            exit(1)
+
+        # the whole version folder holds every extension and the pom, so one call promotes all of them
+        # without the bytes ever leaving artifactory
+        operation = 'move' if self._get_promote_operation() == 'move' else 'copy'
+        version_path = "{group}/{project}/{version}".format(group=ArtiFactory.artifactory_group,
+                                                            project=self.config.project_name,
+                                                            version=self.config.version_number)
+        promote_url = "{domain}/api/{operation}/{source}/{path}?to=/{target}/{path}&suppressLayouts=1&failFast=1" \
+            .format(domain=ArtiFactory.artifactory_domain, operation=operation, source=ArtiFactory.snapshot_repo_key,
+                    target=ArtiFactory.release_repo_key, path=version_path)
+
+        commons.printMSG(ArtiFactory.clazz, method, "Promoting {path} from {source} to {target} by {operation}".format(
+            path=version_path, source=ArtiFactory.snapshot_repo_key, target=ArtiFactory.release_repo_key,
+            operation=operation))
+
+        auth, headers = self._get_auth_and_headers(commons.content_json)
+
+        try:
+            resp = httpclient.post(promote_url, auth=auth, headers=headers, timeout=self.http_timeout)
+        except requests.Timeout:
+            commons.printMSG(ArtiFactory.clazz, method, "Request to Artifactory timed out.", 'ERROR')
+            exit(1)
+        except requests.ConnectionError as e:
+            commons.printMSG(ArtiFactory.clazz, method, "Failed connecting to Artifactory. {}".format(e), 'ERROR')
+            exit(1)
+        except Exception as e:
+            commons.printMSG(ArtiFactory.clazz, method, "Promoting {path} to {target} failed. {error}".format(
+                path=version_path, target=ArtiFactory.release_repo_key, error=e), 'ERROR')
+            exit(1)
+
+        commons.printMSG(ArtiFactory.clazz, method, "resp status code: {}".format(resp.status_code))
+        commons.printMSG(ArtiFactory.clazz, method, "response: {}".format(resp.text))
+
+        if resp.status_code != 200:
+            commons.printMSG(ArtiFactory.clazz, method, "Promoting {path} to {target} failed. Response: {"
+                                                        "response}".format(path=version_path,
+                                                                           target=ArtiFactory.release_repo_key,
+                                                                           response=resp.text), 'ERROR')
+            exit(1)
 
         commons.printMSG(ArtiFactory.clazz, method, 'end')
 
+    def _get_promote_operation(self):
+        if BuildConfig.settings is not None and BuildConfig.settings.has_option('artifactory', 'promote_operation'):
+            return BuildConfig.settings.get('artifactory', 'promote_operation').strip().lower()
+
+        return 'copy'
+
+    def _timed_publish(self, file, file_name):
+        start = time.time()
+        self._publish(file, file_name)
+        return os.path.getsize(file), time.time() - start
+
+    def _get_upload_workers(self):
+        if BuildConfig.settings is not None and BuildConfig.settings.has_option('artifactory', 'upload_workers'):
+            return max(1, BuildConfig.settings.getint('artifactory', 'upload_workers'))
+
+        return 1
+
     def _get_artifactory_files_name_from_build_dir(self):
         method = '_get_artifactory_files_name_from_build_dir'
         commons.printMSG(ArtiFactory.clazz, method, 'begin')
@@ -242,10 +471,72 @@ class ArtiFactory(Artifact_Storage):
             urls.append(self._get_artifact_url(extension))
         return urls
 
-    def _get_artifact_url(self, extension):
-        method = "get_artifact_url"
+    def resolve_artifacts(self, artifacts):
+        """
+        Resolve many artifacts with one AQL query instead of a storage listing per project.
+        :param artifacts: list of (project, version, extension)
+        :return: list of dicts with project, version, extension, url, size, sha1 and sha256 in the same order
+        """
+        method = "resolve_artifacts"
         commons.printMSG(ArtiFactory.clazz, method, "begin")
 
+        if not artifacts:
+            return []
+
+        paths = ["{group}/{project}/{version}".format(group=self.artifactory_group, project=project, version=version)
+                 for project, version, _ in artifacts]
+        criteria = [{"$and": [{"repo": self.repo_key}, {"path": path}, {"name": {"$match": "*." + extension}}]}
+                    for path, (_, _, extension) in zip(paths, artifacts)]
+        query = 'items.find({criteria}).include("repo","path","name","size","actual_sha1","sha256")'.format(
+            criteria=json.dumps({"$or": criteria}))
+
+        aql_url = self.artifactory_domain + "/api/search/aql"
+        auth, headers = self._get_auth_and_headers('text/plain')
+
+        try:
+            resp = httpclient.post(aql_url, auth=auth, headers=headers, data=query, timeout=self.http_timeout)
+        except requests.RequestException as e:
+            commons.printMSG(ArtiFactory.clazz, method, "AQL search failed. {}".format(e), "ERROR")
+            raise ArtifactException(e)
+
+        if resp.status_code != 200:
+            commons.printMSG(ArtiFactory.clazz, method, "AQL search failed. Response: {}".format(resp.text), "ERROR")
+            raise ArtifactException("AQL search failed. Response: {}".format(resp.text))
+
+        items_by_path = {}
+        for item in resp.json()['results']:
+            items_by_path.setdefault(item['path'], []).append(item)
+
+        resolved = []
+        for path, (project, version, extension) in zip(paths, artifacts):
+            matches = [item for item in items_by_path.get(path, []) if item['name'].endswith("." + extension)]
+
+            if len(matches) > 1:
+                commons.printMSG(ArtiFactory.clazz, method, "Found more than 1 artifact in {}".format(path), 'ERROR')
+                raise ArtifactException("Found more than 1 artifact in {}".format(path))
+            elif not matches:
+                commons.printMSG(ArtiFactory.clazz, method, "Could not locate artifact {path}/*.{extension}".format(
+                    path=path, extension=extension), "ERROR")
+                raise ArtifactException("Could not locate artifact {path}/*.{extension}".format(path=path,
+                                                                                               extension=extension))
+
+            resolved.append({'project': project,
+                             'version': version,
+                             'extension': extension,
+                             'url': "{domain}/{repo}/{path}/{name}".format(domain=self.artifactory_domain,
+                                                                           repo=matches[0]['repo'], path=path,
+                                                                           name=matches[0]['name']),
+                             'size': matches[0].get('size'),
+                             'sha1': matches[0].get('actual_sha1'),
+                             'sha256': matches[0].get('sha256')})
+
+        commons.printMSG(ArtiFactory.clazz, method, "Resolved {} artifacts".format(len(resolved)))
+        commons.printMSG(ArtiFactory.clazz, method, "end")
+        return resolved
+
+    def _get_storage_listing(self):
+        method = "get_artifact_url"
+
         arti_api_url = self.artifactory_domain + \
                        "/api/storage/" + \
                        self.repo_key + \
@@ -253,8 +544,12 @@ class ArtiFactory(Artifact_Storage):
                        "/" + self.config.project_name + \
                        "/" + self.config.version_number
 
+        # every extension lives in the same version folder, so it is listed once and shared
+        if arti_api_url in self.storage_listings:
+            return arti_api_url, self.storage_listings[arti_api_url]
+
         try:
-            resp = requests.get(arti_api_url, timeout=self.http_timeout)
+            resp = httpclient.get(arti_api_url, timeout=self.http_timeout)
         except requests.ConnectionError as e:
             commons.printMSG(ArtiFactory.clazz, method, "Request to Artifactory timed out.", "ERROR")
             raise ArtifactException(e)
@@ -274,23 +569,35 @@ class ArtiFactory(Artifact_Storage):
 
         json_data = json.loads(resp.text)
 
-        matching_file_count = 0
-
+        # children indexed by everything after each dot, so 'tar.gz' and 'gz' both find 'x-v1.0.0.tar.gz'
+        children_by_extension = {}
         for child in json_data['children']:
             child_uri = child['uri']
-            if child_uri.endswith("." + extension):
-                matching_file_count += 1
-                artifact_to_deploy = child['uri']
-                commons.printMSG(ArtiFactory.clazz, method, ("Found match ", artifact_to_deploy))
+            for position, character in enumerate(child_uri):
+                if character == '.':
+                    children_by_extension.setdefault(child_uri[position + 1:], []).append(child_uri)
+
+        self.storage_listings[arti_api_url] = children_by_extension
+        return arti_api_url, children_by_extension
+
+    def _get_artifact_url(self, extension):
+        method = "get_artifact_url"
+        commons.printMSG(ArtiFactory.clazz, method, "begin")
+
+        arti_api_url, children_by_extension = self._get_storage_listing()
+        matches = children_by_extension.get(extension, [])
 
-        if matching_file_count == 1:
+        for artifact_to_deploy in matches:
+            commons.printMSG(ArtiFactory.clazz, method, ("Found match ", artifact_to_deploy))
+
+        if len(matches) == 1:
             return "%s/%s/%s/%s/%s%s" % (self.artifactory_domain,
                                          self.repo_key,
                                          self.artifactory_group,
                                          self.config.project_name,
                                          self.config.version_number,
-                                         artifact_to_deploy)
-        elif matching_file_count > 1:
+                                         matches[0])
+        elif len(matches) > 1:
             commons.printMSG(ArtiFactory.clazz, method, "Found more than 1 artifact in {}".format(arti_api_url), 'ERROR')
             raise ArtifactException("Found more than 1 artifact in {}".format(arti_api_url))
 
@@ -304,24 +611,371 @@ class ArtiFactory(Artifact_Storage):
     def download_artifact(self, artifact_url, download_path):
         """
         Download the artifact from artifactory. Really just a save a url to a file method.
+        Big files are fetched in parallel byte ranges and resume if a previous download was interrupted.
         :param artifact_url: obviously, the artifact url
         :param download_path: Where you want the file to go
         :return: nothing, exceptions raised if it fails
         """
         method = "download_artifact"
         try:
-            with open(download_path, 'wb') as handle:
-                response = requests.get(artifact_url, stream=True)
-                if not response.ok:
-                    response.raise_for_status()
+            head = httpclient.head(artifact_url, allow_redirects=True, timeout=self.http_timeout)
+            size = int(head.headers.get('Content-Length', 0)) if head.ok else 0
+            sha1 = head.headers.get('X-Checksum-Sha1') if head.ok else None
+            part_size = max(1, int(self._get_artifactory_setting('download_part_size_mb', 16) * 1048576))
+
+            # identical bytes are stored once per agent under their sha1, whatever project or version they came from
+            cache_file = self._get_cached_artifact_file(sha1)
+            if cache_file is not None and os.path.isfile(cache_file) and \
+                    (size == 0 or os.path.getsize(cache_file) == size):
+                commons.printMSG(ArtiFactory.clazz, method, "Using cached {sha1} for {url}".format(sha1=sha1,
+                                                                                                 url=artifact_url))
+                os.utime(cache_file)
+                self._link_file(cache_file, download_path)
+                return
+
+            # never write through a link left by an earlier run, that would change the cached copy too
+            if os.path.isfile(download_path) and os.stat(download_path).st_nlink > 1:
+                os.remove(download_path)
+
+            if head.ok and head.headers.get('Accept-Ranges') == 'bytes' and size > part_size and hasattr(os, 'pwrite'):
+                self._download_in_parts(artifact_url, download_path, size, sha1, part_size)
+            else:
+                self._download_in_one_stream(artifact_url, download_path, sha1)
+
+            if cache_file is not None:
+                self._add_to_download_cache(download_path, cache_file)
+
+        except Exception as e:
+            commons.printMSG(ArtiFactory.clazz, method, 'Failed to download {url}. {error}'.format(url=artifact_url,
+                                                                                                   error=e), 'ERROR')
+            raise ArtifactDownloadException(str(e))
+
+    def _get_cached_artifact_file(self, sha1):
+        cache_dir = commons.get_cache_directory(BuildConfig.settings)
+
+        # artifacts can be large, so unlike the github lookups they are only cached when a size limit is set
+        if not cache_dir or not sha1 or self._get_artifactory_setting('download_cache_max_mb', 0) <= 0:
+            return None
+
+        return os.path.join(cache_dir, 'artifactory', sha1[:2], sha1)
+
+    def _link_file(self, source, destination):
+        if os.path.lexists(destination):
+            os.remove(destination)
+
+        # a hard link costs nothing, a copy is only needed when the cache sits on another file system
+        try:
+            os.link(source, destination)
+        except OSError:
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(destination)), suffix='.tmp')
+            os.close(fd)
+            shutil.copyfile(source, temp_path)
+            os.replace(temp_path, destination)
+
+    def _add_to_download_cache(self, download_path, cache_file):
+        method = '_add_to_download_cache'
+
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            # link to a temp name first so concurrent jobs on the same agent never see a half written entry
+            temp_path = cache_file + '.' + str(os.getpid()) + '.tmp'
+            self._link_file(download_path, temp_path)
+            os.replace(temp_path, cache_file)
+            self._evict_cached_artifacts(os.path.dirname(os.path.dirname(cache_file)))
+        except OSError as e:
+            commons.printMSG(ArtiFactory.clazz, method, "Failed caching {file}. {error}".format(file=download_path,
+                                                                                              error=e), 'WARN')
+
+    def _evict_cached_artifacts(self, artifact_cache_dir):
+        method = '_evict_cached_artifacts'
+
+        try:
+            entries = []
+            for root, _, names in os.walk(artifact_cache_dir):
+                for name in names:
+                    if not name.endswith('.tmp'):
+                        stat = os.stat(os.path.join(root, name))
+                        entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+
+            total_size = sum(size for _, size, _ in entries)
+            max_size = int(self._get_artifactory_setting('download_cache_max_mb', 0) * 1024 * 1024)
+
+            # least recently used first
+            for _, size, path in sorted(entries):
+                if total_size <= max_size:
+                    break
+                os.remove(path)
+                total_size -= size
+        except OSError as e:
+            commons.printMSG(ArtiFactory.clazz, method, "Failed trimming the artifact cache. {}".format(e), 'WARN')
+
+    def _download_in_one_stream(self, artifact_url, download_path, sha1):
+        checksum = hashlib.sha1()
+
+        with open(download_path, 'wb') as handle:
+            response = httpclient.get(artifact_url, stream=True)
+            if not response.ok:
+                response.raise_for_status()
+
+            for block in response.iter_content(ArtiFactory.checksum_block_size):
+                checksum.update(block)
+                handle.write(block)
+
+        self._verify_download(download_path, sha1, checksum.hexdigest())
+
+    def _download_in_parts(self, artifact_url, download_path, size, sha1, part_size):
+        method = '_download_in_parts'
+
+        workers = max(1, int(self._get_artifactory_setting('download_workers', 1)))
+        parts = list(range((size + part_size - 1) // part_size))
+
+        # only trust finished parts when they belong to the same bytes, otherwise start over
+        journal_file = self._get_journal_file(download_path, 'download')
+        journal = {'url': artifact_url, 'size': size, 'sha1': sha1, 'part_size': part_size}
+        previous = commons.read_json_file(journal_file)
+        done = set(previous['done']) if previous is not None and os.path.isfile(download_path) and \
+            os.path.getsize(download_path) == size and \
+            all(previous.get(key) == value for key, value in journal.items()) else set()
+
+        if done:
+            commons.printMSG(ArtiFactory.clazz, method, "Resuming download, {done} of {total} parts already "
+                                                        "fetched".format(done=len(done), total=len(parts)))
+
+        lock = threading.Lock()
+
+        def fetch_part(fd, part):
+            start = part * part_size
+            end = min(start + part_size, size) - 1
+
+            for attempt in range(self.part_retries + 1):
+                try:
+                    resp = httpclient.get(artifact_url, headers={'Range': "bytes={}-{}".format(start, end)},
+                                          stream=True, timeout=self.http_timeout)
+                    if resp.status_code == 206:
+                        offset = start
+                        for block in resp.iter_content(ArtiFactory.checksum_block_size):
+                            offset += os.pwrite(fd, block, offset)
+                        if offset == end + 1:
+                            break
+                        error = "Received {} of {} bytes".format(offset - start, end + 1 - start)
+                    else:
+                        error = "Response: {} {}".format(resp.status_code, resp.text)
+                except requests.RequestException as ex:
+                    error = str(ex)
+
+                if attempt == self.part_retries:
+                    raise ArtifactDownloadException("Failed downloading part {part} of {url}. {error}".format(
+                        part=part, url=artifact_url, error=error))
+                commons.printMSG(ArtiFactory.clazz, method, "Retrying part {} of {}".format(part, artifact_url), 'WARN')
+                ArtiFactory.retry_sleep(2 ** attempt)
+
+            with lock:
+                done.add(part)
+                commons.write_json_file(journal_file, dict(journal, done=sorted(done)))
+
+        fd = os.open(download_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(fetch_part, fd, part) for part in parts if part not in done]
+                for future in futures:
+                    future.result()
+        finally:
+            os.close(fd)
+
+        self._verify_download(download_path, sha1, self._get_file_checksums(download_path)[0])
+        if os.path.isfile(journal_file):
+            os.remove(journal_file)
+
+    def _verify_download(self, download_path, expected_sha1, actual_sha1):
+        # artifactory reports the sha1 of what it stored, so anything else is a corrupt download
+        if expected_sha1 is not None and expected_sha1 != actual_sha1:
+            os.remove(download_path)
+            journal_file = self._get_journal_file(download_path, 'download')
+            if os.path.isfile(journal_file):
+                os.remove(journal_file)
+            raise ArtifactDownloadException("Checksum mismatch for {path}, expected sha1 {expected} but got "
+                                            "{actual}".format(path=download_path, expected=expected_sha1,
+                                                              actual=actual_sha1))
+
+    def _stream_and_extract_tar(self, artifact_url, download_dir):
+        method = '_stream_and_extract_tar'
+
+        temp_path = None
+        # members land in a scratch directory next to the target and are only moved into place once the checksum
+        # of the whole archive checks out
+        extract_dir = tempfile.mkdtemp(dir=download_dir, prefix='.extract-')
+        try:
+            head = httpclient.head(artifact_url, allow_redirects=True, timeout=self.http_timeout)
+            sha1 = head.headers.get('X-Checksum-Sha1') if head.ok else None
+
+            size = int(head.headers.get('Content-Length', 0)) if head.ok else 0
+
+            cache_file = self._get_cached_artifact_file(sha1)
+            if cache_file is not None and os.path.isfile(cache_file):
+                if self._extract_cached_tar(cache_file, sha1, size, extract_dir):
+                    commons.printMSG(ArtiFactory.clazz, method, "Using cached {sha1} for {url}".format(
+                        sha1=sha1, url=artifact_url))
+                    self._move_tree(extract_dir, download_dir)
+                    return
+
+                # whatever the damaged entry left behind must not end up in the deploy
+                shutil.rmtree(extract_dir, ignore_errors=True)
+                extract_dir = tempfile.mkdtemp(dir=download_dir, prefix='.extract-')
+
+            resp = httpclient.get(artifact_url, stream=True, timeout=self.http_timeout)
+            if not resp.ok:
+                resp.raise_for_status()
+            sha1 = resp.headers.get('X-Checksum-Sha1', sha1)
+
+            copy_to = None
+            if cache_file is not None:
+                os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                temp_path = cache_file + '.' + str(os.getpid()) + '.tmp'
+                copy_to = open(temp_path, 'wb')
 
-                for block in response.iter_content(1024):
-                    handle.write(block)
+            try:
+                resp.raw.decode_content = True
+                reader = _ChecksumReader(resp.raw, copy_to)
+                with tarfile.open(fileobj=reader, mode='r|*') as tar:
+                    self._extract_tar(tar, extract_dir)
+                # the checksum covers the padding after the last member too
+                reader.drain(ArtiFactory.checksum_block_size)
+            finally:
+                if copy_to is not None:
+                    copy_to.close()
+
+            if sha1 is not None and sha1 != reader.sha1.hexdigest():
+                raise ArtifactDownloadException("Checksum mismatch for {url}, expected sha1 {expected} but got "
+                                                "{actual}".format(url=artifact_url, expected=sha1,
+                                                                  actual=reader.sha1.hexdigest()))
+
+            self._move_tree(extract_dir, download_dir)
+
+            if temp_path is not None:
+                os.replace(temp_path, cache_file)
+                temp_path = None
+                self._evict_cached_artifacts(os.path.dirname(os.path.dirname(cache_file)))
 
         except Exception as e:
-            commons.printMSG(ArtiFactory.clazz, method, 'Failed to download {}'.format(artifact_url), 'ERROR')
-            commons.printMSG("URLError is {msg}".format(msg=e.message))
-            raise ArtifactDownloadException(e.message)
+            commons.printMSG(ArtiFactory.clazz, method, 'Failed to extract {url}. {error}'.format(url=artifact_url,
+                                                                                                  error=e), 'ERROR')
+            raise ArtifactDownloadException(str(e))
+        finally:
+            shutil.rmtree(extract_dir, ignore_errors=True)
+            if temp_path is not None and os.path.isfile(temp_path):
+                os.remove(temp_path)
+
+    def _extract_cached_tar(self, cache_file, sha1, size, extract_dir):
+        method = '_extract_cached_tar'
+
+        # a cached tar is checked like a download, a damaged entry is evicted so the caller fetches it again
+        try:
+            if size and os.path.getsize(cache_file) != size:
+                raise ArtifactDownloadException("expected {expected} bytes but found {actual}".format(
+                    expected=size, actual=os.path.getsize(cache_file)))
+
+            os.utime(cache_file)
+            with open(cache_file, 'rb') as handle:
+                reader = _ChecksumReader(handle)
+                with tarfile.open(fileobj=reader, mode='r|*') as tar:
+                    self._extract_tar(tar, extract_dir)
+                reader.drain(ArtiFactory.checksum_block_size)
+
+            if reader.sha1.hexdigest() != sha1:
+                raise ArtifactDownloadException("expected sha1 {expected} but got {actual}".format(
+                    expected=sha1, actual=reader.sha1.hexdigest()))
+            return True
+        except Exception as e:
+            commons.printMSG(ArtiFactory.clazz, method, "Cached {file} is damaged, downloading it again. {error}".format(
+                file=cache_file, error=e), 'WARN')
+            try:
+                os.remove(cache_file)
+            except OSError:
+                pass
+            return False
+
+    def _move_tree(self, source, destination):
+        # merges an extracted tree into destination, replacing what an earlier deploy left there
+        for name in os.listdir(source):
+            source_path = os.path.join(source, name)
+            destination_path = os.path.join(destination, name)
+            source_is_dir = os.path.isdir(source_path) and not os.path.islink(source_path)
+            destination_is_dir = os.path.isdir(destination_path) and not os.path.islink(destination_path)
+
+            if source_is_dir and destination_is_dir:
+                self._move_tree(source_path, destination_path)
+                continue
+
+            if destination_is_dir:
+                shutil.rmtree(destination_path)
+            elif os.path.lexists(destination_path):
+                os.remove(destination_path)
+            os.replace(source_path, destination_path)
+
+    def _wants_path(self, name):
+        if not ArtiFactory.extract_paths:
+            return True
+
+        # a pattern matches the path itself or, for a directory, everything under it
+        name = name[2:] if name.startswith('./') else name
+        return any(fnmatch.fnmatch(name, pattern) or name.startswith(pattern.rstrip('/') + '/')
+                   for pattern in ArtiFactory.extract_paths)
+
+    def _get_extract_target(self, destination, name):
+        method = '_get_extract_target'
+
+        root = os.path.realpath(destination)
+        target = os.path.realpath(os.path.join(root, name))
+        if target != root and not target.startswith(root + os.sep):
+            commons.printMSG(ArtiFactory.clazz, method, "Skipping {} because it is outside of the archive".format(
+                name), 'WARN')
+            return None
+
+        return target
+
+    def _extract_tar(self, tar, destination):
+        method = '_extract_tar'
+
+        for member in tar:
+            if not self._wants_path(member.name):
+                continue
+
+            unsafe = commons.get_unsafe_tar_member(member, destination)
+            if unsafe is not None:
+                commons.printMSG(ArtiFactory.clazz, method, "Skipping {}".format(unsafe), 'WARN')
+                continue
+
+            if hasattr(tarfile, 'data_filter'):
+                tar.extract(member, destination, filter='data')
+            else:
+                tar.extract(member, destination)
+
+    def _extract_zip(self, download_path, destination):
+        workers = max(1, int(self._get_artifactory_setting('extract_workers', 1)))
+
+        with zipfile.ZipFile(download_path, "r") as z:
+            # the central directory lists every member up front, so directories are made first and files written
+            # in parallel.  zlib lets go of the GIL while it inflates.
+            files = []
+            for member in z.infolist():
+                target = self._get_extract_target(destination, member.filename)
+                if target is None or not self._wants_path(member.filename):
+                    continue
+                if member.is_dir():
+                    os.makedirs(target, exist_ok=True)
+                else:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    files.append((member, target))
+
+            def write_member(member, target):
+                with z.open(member) as source, open(target, 'wb') as target_file:
+                    shutil.copyfileobj(source, target_file, ArtiFactory.checksum_block_size)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(write_member, member, target) for member, target in files]
+                for future in futures:
+                    future.result()
 
     def download_and_extract_artifacts_locally(self, download_dir, extract=True):
         for extension in self.artifactory_extensions:
@@ -337,38 +991,39 @@ class ArtiFactory(Artifact_Storage):
         artifact_to_download = self.config.project_name + '-' + self.config.version_number + '.' + extension
 
         try:
-            artifact = self.get_artifact_url()
+            artifact = self._get_artifact_url(extension)
         except ArtifactException:
             exit(1)
 
         download_path = download_dir + artifact_to_download
+        stream_tar = extract and extension in ("tar.gz", "tar", "tgz")
 
         commons.printMSG(ArtiFactory.clazz, method, "artifact_to_download = {a} and download_path is {d}".format(
             a=artifact_to_download, d=download_path))
-        commons.printMSG(ArtiFactory.clazz, method, 'Downloading {artifact} to {download_path}'.format(artifact=
-                                                                                                       artifact,
-                                                                                                       download_path
-                                                                                                       =download_path))
         try:
-            self.download_artifact(artifact, download_path)
+            if stream_tar:
+                # tar archives are read front to back, so they are extracted while they download
+                commons.printMSG(ArtiFactory.clazz, method, 'Extracting {artifact} into {download_dir}'.format(
+                    artifact=artifact, download_dir=download_dir))
+                self._stream_and_extract_tar(artifact, download_dir)
+            else:
+                commons.printMSG(ArtiFactory.clazz, method, 'Downloading {artifact} to {download_path}'.format(
+                    artifact=artifact, download_path=download_path))
+                self.download_artifact(artifact, download_path)
         except ArtifactDownloadException as e:
             commons.printMSG(ArtiFactory.clazz, method, 'Failed to download {}'.format(artifact), 'ERROR')
-            commons.printMSG("URLError is {msg}".format(msg=e))
+            commons.printMSG(ArtiFactory.clazz, method, "URLError is {msg}".format(msg=e))
             os.system('stty sane')
             exit(1)
 
-        if extract:
-            # Unzip/untar file downloaded from Artifactory if required
-            if extension == "tar.gz" or extension == "tar" or extension == "tgz":
-                tar = tarfile.open(download_path)
-                tar.extractall(download_dir)
-                tar.close()
-                commons.printMSG(ArtiFactory.clazz, method, 'Deploying a tar from {}'.format(download_path))
-            if extension == "zip":
-                with zipfile.ZipFile(download_path, "r") as z:
-                    z.extractall(download_dir)
-
-                commons.printMSG(ArtiFactory.clazz, method, "Deploying a zip from {}".format(download_path))
-        print(download_path)
+        if stream_tar:
+            commons.printMSG(ArtiFactory.clazz, method, 'Deploying a tar from {}'.format(artifact))
+        if extract and extension == "zip":
+            # Unzip file downloaded from Artifactory if required
+            self._extract_zip(download_path, download_dir)
+
+            commons.printMSG(ArtiFactory.clazz, method, "Deploying a zip from {}".format(download_path))
+        commons.printMSG(ArtiFactory.clazz, method, 'Artifact is in {}'.format(download_dir if stream_tar
+                                                                                else download_path))
 
         commons.printMSG(ArtiFactory.clazz, method, 'end')
@@ -6,6 +6,7 @@ from abc import ABCMeta, abstractmethod
 import requests
 
 from flow.utils import commons
+from flow.utils import httpclient
 
 
 class Cloud(metaclass=ABCMeta):
@@ -26,11 +27,11 @@ class Cloud(metaclass=ABCMeta):
                 if os.getenv("GITHUB_TOKEN"):
                     headers = {'Authorization': ("Bearer " + os.getenv("GITHUB_TOKEN"))}
 
-                    resp = requests.get(custom_deploy_script, headers=headers, verify=False, timeout=self.http_timeout)
+                    resp = httpclient.get(custom_deploy_script, headers=headers, verify=False, timeout=self.http_timeout)
                 else:
                     commons.printMSG(Cloud.clazz, 'No GITHUB_TOKEN detected in environment. Attempting to access '
                                                   'deploy script anonymously.', 'WARN')
-                    resp = requests.get(custom_deploy_script, verify=False, timeout=self.http_timeout)
+                    resp = httpclient.get(custom_deploy_script, verify=False, timeout=self.http_timeout)
 
             except:
                 commons.printMSG(Cloud.clazz, method, "Failed retrieving custom deploy script from GitHub {}".format(
@@ -52,7 +53,7 @@ class Cloud(metaclass=ABCMeta):
                                                   "}".format(custom_deploy_script))
 
             try:
-                resp = requests.get(custom_deploy_script, verify=False, timeout=self.http_timeout)
+                resp = httpclient.get(custom_deploy_script, verify=False, timeout=self.http_timeout)
             except:
                 commons.printMSG(Cloud.clazz, method, "Failed retrieving custom web deploy script from {script}. "
                                                        "\r\n Response: {response}".format(script=custom_deploy_script,
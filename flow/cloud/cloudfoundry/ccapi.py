@@ -0,0 +1,141 @@
+#!/usr/bin/python
+# ccapi.py
+
+import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
+from flow.cloud.cloudfoundry.cfinventory import CfApp
+
+
+class CloudControllerException(Exception): pass
+
+
+class CloudControllerClient:
+    clazz = 'CloudControllerClient'
+    per_page = 5000
+
+    def __init__(self, api_endpoint, user, password, http_timeout=30, verify=False):
+        self.api_url = (api_endpoint if api_endpoint.startswith('http') else 'https://' + api_endpoint).rstrip('/')
+        self.user = user
+        self.password = password
+        self.http_timeout = http_timeout
+        self.verify = verify
+        self.token = None
+        self.space_guid = None
+        # (app name, host, domain, path) -> (route guid, destination guid), filled by get_routes_by_app
+        self.route_destinations = {}
+
+    def login(self):
+        method = 'login'
+
+        # the api root says where uaa lives, one password grant then serves every call of the deploy
+        root = self._request('GET', self.api_url + '/', authenticate=False).json()
+        token_url = root['links']['uaa']['href'].rstrip('/') + '/oauth/token'
+
+        resp = httpclient.post(token_url, data={'grant_type': 'password', 'username': self.user,
+                                                'password': self.password},
+                               auth=('cf', ''), headers={'Accept': commons.content_json}, verify=self.verify,
+                               timeout=self.http_timeout)
+        if resp.status_code != 200:
+            raise CloudControllerException("Make sure that your credentials are correct for {usr}. Response: "
+                                           "{response}".format(usr=self.user, response=resp.text))
+
+        self.token = resp.json()['access_token']
+        commons.printMSG(CloudControllerClient.clazz, method, "Logged in to {} as {}".format(self.api_url, self.user))
+
+    def target(self, org, space):
+        orgs = self._get_all('/v3/organizations', {'names': org})[0]
+        if not orgs:
+            raise CloudControllerException("Could not find org {}".format(org))
+
+        spaces = self._get_all('/v3/spaces', {'names': space, 'organization_guids': orgs[0]['guid']})[0]
+        if not spaces:
+            raise CloudControllerException("Could not find space {space} in org {org}".format(space=space, org=org))
+
+        self.space_guid = spaces[0]['guid']
+
+    def list_apps(self):
+        apps = self._get_all('/v3/apps', {'space_guids': self.space_guid})[0]
+        processes = self._get_all('/v3/processes', {'space_guids': self.space_guid, 'types': 'web'})[0]
+
+        instances_by_app = {process['links']['app']['href'].rsplit('/', 1)[-1]: process['instances']
+                            for process in processes}
+
+        # a process only knows how many instances it should run.  the running count would cost a stats call
+        # per app and nothing in a deploy needs it, so it is left unknown.
+        return [CfApp(app['name'], app['state'].lower(), desired_instances=instances_by_app.get(app['guid']),
+                      guid=app['guid']) for app in apps]
+
+    def get_routes_by_app(self, app_names_by_guid):
+        routes, included = self._get_all('/v3/routes', {'space_guids': self.space_guid, 'include': 'domain'})
+        domains = {domain['guid']: domain['name'] for domain in included.get('domains', [])}
+
+        routes_by_app = {}
+        self.route_destinations = {}
+        for route in routes:
+            domain = domains.get(route['relationships']['domain']['data']['guid'], '')
+            for destination in route.get('destinations', []):
+                app_name = app_names_by_guid.get(destination['app']['guid'])
+                if app_name is None:
+                    continue
+                key = (app_name, route['host'], domain, route.get('path', ''))
+                routes_by_app.setdefault(app_name, []).append(key[1:])
+                self.route_destinations[key] = (route['guid'], destination['guid'])
+
+        return routes_by_app
+
+    def scale(self, app_guid, instances):
+        self._request('POST', "/v3/apps/{}/processes/web/actions/scale".format(app_guid),
+                      json={'instances': instances})
+
+    def stop(self, app_guid):
+        self._request('POST', "/v3/apps/{}/actions/stop".format(app_guid))
+
+    def unmap_route(self, app_name, host, domain, path):
+        route_guid, destination_guid = self.route_destinations[(app_name, host, domain, path)]
+        self._request('DELETE', "/v3/routes/{route}/destinations/{destination}".format(route=route_guid,
+                                                                                      destination=destination_guid))
+
+    def delete_app(self, app_guid):
+        self._request('DELETE', "/v3/apps/{}".format(app_guid))
+
+    def _get_all(self, path, params):
+        # follows the pagination links and gathers included resources from every page
+        resources = []
+        included = {}
+        url = self.api_url + path
+        params = dict(params, per_page=CloudControllerClient.per_page)
+
+        while url is not None:
+            page = self._request('GET', url, params=params).json()
+            resources.extend(page.get('resources', []))
+            for kind, items in page.get('included', {}).items():
+                included.setdefault(kind, []).extend(items)
+
+            next_page = (page.get('pagination') or {}).get('next')
+            url = next_page['href'] if next_page else None
+            params = None
+
+        return resources, included
+
+    def _request(self, http_method, url, authenticate=True, **kwargs):
+        if not url.startswith('http'):
+            url = self.api_url + url
+
+        for attempt in range(2):
+            headers = {'Accept': commons.content_json}
+            if authenticate:
+                headers['Authorization'] = 'bearer ' + self.token
+
+            resp = httpclient.request(http_method, url, headers=headers, verify=self.verify,
+                                      timeout=self.http_timeout, **kwargs)
+
+            # tokens can run out during a long deploy, a fresh one is one password grant away
+            if resp.status_code != 401 or not authenticate or attempt == 1:
+                break
+            self.login()
+
+        if resp.status_code >= 400:
+            raise CloudControllerException("{method} {url} failed with {status}. Response: {response}".format(
+                method=http_method, url=url, status=resp.status_code, response=resp.text))
+
+        return resp
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# cfinventory.py
+
+import re
+
+
+class CfApp:
+
+    def __init__(self, name, state, version=None, instances=None, desired_instances=None, routes=None, guid=None):
+        self.name = name
+        self.state = state
+        self.version = version
+        self.instances = instances
+        self.desired_instances = desired_instances
+        self.routes = routes if routes is not None else []
+        self.guid = guid
+
+    def is_started(self):
+        return self.state == 'started'
+
+    def is_stopped(self):
+        return self.state == 'stopped'
+
+    def __repr__(self):
+        return "CfApp({name}, {state}, {instances}/{desired})".format(name=self.name, state=self.state,
+                                                                      instances=self.instances,
+                                                                      desired=self.desired_instances)
+
+
+class CfInventory:
+    instances_regex = re.compile(r'(?:(\w+):)?(\d+)/(\d+)')
+
+    def __init__(self, project_name, apps):
+        # only versioned apps of this project take part in a deployment, e.g. my-app-v1.2.3+4
+        version_regex = re.compile(r'^' + re.escape(project_name) + r'-(v\d+\.\d+\.\d+\S*)$')
+
+        self.apps = []
+        self.by_name = {}
+        self.by_version = {}
+        for app in apps:
+            match = version_regex.match(app.name)
+            if match is None:
+                continue
+            app.version = match.group(1)
+            self.apps.append(app)
+            self.by_name[app.name] = app
+            self.by_version[app.version] = app
+
+    def started(self):
+        return [app for app in self.apps if app.is_started()]
+
+    def stopped(self):
+        return [app for app in self.apps if app.is_stopped()]
+
+    @staticmethod
+    def _parse_table(output, first_column):
+        # cf prints aligned tables, so values are cut at the offsets of the header columns
+        rows = []
+        columns = None
+
+        for line in output.splitlines():
+            if columns is None:
+                if line.startswith(first_column + ' '):
+                    columns = [(match.start(), match.group(0)) for match in
+                               re.finditer(r'(?:^|(?<=\s\s))\S+(?: \S+)*', line)]
+                continue
+
+            if not line.strip():
+                continue
+
+            offsets = [start for start, _ in columns] + [None]
+            rows.append({name: line[start:end].strip() for (start, name), end in zip(columns, offsets[1:])})
+
+        return rows
+
+    @staticmethod
+    def parse_cf_routes(output):
+        # app name -> list of (host, domain, path) mapped to it
+        routes_by_app = {}
+
+        for row in CfInventory._parse_table(output, 'space'):
+            for app_name in row.get('apps', '').split(','):
+                if app_name.strip():
+                    routes_by_app.setdefault(app_name.strip(), []).append(
+                        (row.get('host', ''), row.get('domain', ''), row.get('path', '')))
+
+        return routes_by_app
+
+    @staticmethod
+    def parse_cf_apps(output):
+        # the last column holds the comma separated routes.  older clis have instances, memory and disk columns,
+        # newer ones a processes column.
+        apps = []
+
+        for row in CfInventory._parse_table(output, 'name'):
+            values = list(row.values())
+
+            instances = desired = None
+            match = CfInventory.instances_regex.search(values[2]) if len(values) > 2 else None
+            if match is not None:
+                instances, desired = int(match.group(2)), int(match.group(3))
+
+            routes = [route.strip() for route in values[-1].split(',') if route.strip()]
+            apps.append(CfApp(values[0], values[1].lower(), instances=instances, desired_instances=desired,
+                              routes=routes))
+
+        return apps
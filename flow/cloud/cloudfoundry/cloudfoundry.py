@@ -1,14 +1,27 @@
+import multiprocessing
+import multiprocessing.connection
 import os
+import shutil
 import subprocess
+import sys
 import tarfile
+import tempfile
+import threading
+import time
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from subprocess import TimeoutExpired
 import platform
 
+import requests
+
 from flow.buildconfig import BuildConfig
 from flow.cloud.cloud_abc import Cloud
+from flow.cloud.cloudfoundry.ccapi import CloudControllerClient, CloudControllerException
+from flow.cloud.cloudfoundry.cfinventory import CfInventory
 
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 
 
 class CloudFoundry(Cloud):
@@ -23,6 +36,11 @@ class CloudFoundry(Cloud):
     path_to_cf = None
     stopped_apps = None
     started_apps = None
+    inventory = None
+    backend = 'cli'
+    cc_client = None
+    targets = []
+    worker_cf_home = threading.local()
     config = BuildConfig
     http_timeout = 30
 
@@ -33,6 +51,8 @@ class CloudFoundry(Cloud):
         if config_override is not None:
             self.config = config_override
 
+        CloudFoundry.inventory = None
+
         if os.environ.get('WORKSPACE'):  # for Jenkins
             CloudFoundry.path_to_cf = os.environ.get('WORKSPACE') + '/'
         else:
@@ -86,11 +106,23 @@ class CloudFoundry(Cloud):
 
         try:
             self.config.json_config['projectInfo']['name']
+
+            # each entry of cf.targets overrides the apiEndpoint, domain, org, space or backend of cf
+            CloudFoundry.targets = [self._get_target(dict(self.config.build_env_info['cf'], **target))
+                                    for target in self.config.build_env_info['cf'].get('targets', [])]
+
+            for target in CloudFoundry.targets:
+                commons.printMSG(CloudFoundry.clazz, method, "Target {}".format(target['name']))
+
+            if CloudFoundry.targets:
+                return
+
             CloudFoundry.cf_org = self.config.build_env_info['cf']['org']
             CloudFoundry.cf_space = self.config.build_env_info['cf']['space']
             CloudFoundry.cf_api_endpoint = self.config.build_env_info['cf']['apiEndpoint']
             if 'domain' in self.config.build_env_info['cf']:  # this is not required bc could be passed in via manifest
                 CloudFoundry.cf_domain = self.config.build_env_info['cf']['domain']
+            CloudFoundry.backend = self.config.build_env_info['cf'].get('backend', 'cli')
 
             commons.printMSG(CloudFoundry.clazz, method, "CloudFoundry.cf_org {}".format(CloudFoundry.cf_org))
             commons.printMSG(CloudFoundry.clazz, method, "CloudFoundry.cf_space {}".format(CloudFoundry.cf_space))
@@ -103,6 +135,42 @@ class CloudFoundry(Cloud):
                              "The build config associated with cloudfoundry is missing key {}".format(str(e)), 'ERROR')
             exit(1)
 
+    def _get_target(self, target_info):
+        target = {'apiEndpoint': target_info['apiEndpoint'], 'org': target_info['org'],
+                  'space': target_info['space'], 'domain': target_info.get('domain'),
+                  'backend': target_info.get('backend', 'cli')}
+        target['name'] = target_info.get('name', "{apiEndpoint} {org}/{space}".format(**target))
+        return target
+
+    def _use_target(self, target):
+        CloudFoundry.cf_api_endpoint = target['apiEndpoint']
+        CloudFoundry.cf_org = target['org']
+        CloudFoundry.cf_space = target['space']
+        CloudFoundry.cf_domain = target['domain']
+        CloudFoundry.backend = target['backend']
+        CloudFoundry.inventory = None
+        CloudFoundry.cc_client = None
+
+    def _use_api(self):
+        # 'api' talks to the cloud controller v3 api directly and only keeps the cli for cf push
+        return CloudFoundry.backend == 'api'
+
+    def _cc_api_login(self):
+        method = '_cc_api_login'
+        commons.printMSG(CloudFoundry.clazz, method, 'begin')
+
+        CloudFoundry.cc_client = CloudControllerClient(CloudFoundry.cf_api_endpoint, CloudFoundry.cf_user,
+                                                       CloudFoundry.cf_pwd, http_timeout=self.http_timeout)
+
+        try:
+            CloudFoundry.cc_client.login()
+            CloudFoundry.cc_client.target(CloudFoundry.cf_org, CloudFoundry.cf_space)
+        except (CloudControllerException, requests.RequestException) as e:
+            commons.printMSG(CloudFoundry.clazz, method, str(e), 'ERROR')
+            exit(1)
+
+        commons.printMSG(CloudFoundry.clazz, method, 'end')
+
     def _check_cf_version(self):
         method = '_check_cf_version'
         commons.printMSG(CloudFoundry.clazz, method, 'begin')
@@ -133,87 +201,86 @@ class CloudFoundry(Cloud):
 
         commons.printMSG(CloudFoundry.clazz, method, 'end')
 
-    def _get_stopped_apps(self):
-        method = '_get_stopped_apps'
-        commons.printMSG(CloudFoundry.clazz, method, 'begin')
+    def _get_app_inventory(self):
+        method = '_get_app_inventory'
 
-        cmd = "{path}cf apps | grep {proj}*-v\d*\.\d*\.\d* | grep stopped | awk '{{print $1}}'".format(path=CloudFoundry.path_to_cf,
-                                                                                       proj=self.config.project_name)
+        # one listing of the space serves the started, stopped, scale and cleanup phases of a deploy
+        if CloudFoundry.inventory is not None:
+            return CloudFoundry.inventory
+
+        if self._use_api():
+            try:
+                CloudFoundry.inventory = CfInventory(self.config.project_name, CloudFoundry.cc_client.list_apps())
+            except (CloudControllerException, requests.RequestException) as e:
+                commons.printMSG(CloudFoundry.clazz, method, "Failed listing apps. {}".format(e), 'ERROR')
+                os.system('stty sane')
+                self._cf_logout()
+                exit(1)
+            return CloudFoundry.inventory
 
-        stopped_apps = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        cmd = "{path}cf apps".format(path=CloudFoundry.path_to_cf)
+        cf_apps = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 
-        get_stopped_apps_failed = False
+        get_apps_failed = False
 
         try:
-            CloudFoundry.stopped_apps, errs = stopped_apps.communicate(timeout=60)
+            cf_apps_output, errs = cf_apps.communicate(timeout=60)
 
-            for line in CloudFoundry.stopped_apps.splitlines():
-                commons.printMSG(CloudFoundry.clazz, method, "App Already Stopped: {}".format(line.decode('utf-8')))
-
-            if stopped_apps.returncode != 0:
+            if cf_apps.returncode != 0:
                 commons.printMSG(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {rtn}".format(
-                                 command=cmd, rtn=stopped_apps.returncode), 'ERROR')
-                get_stopped_apps_failed = True
+                                 command=cmd, rtn=cf_apps.returncode), 'ERROR')
+                get_apps_failed = True
 
         except TimeoutExpired:
             commons.printMSG(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'ERROR')
-            get_stopped_apps_failed = True
+            get_apps_failed = True
 
-        if get_stopped_apps_failed:
-            stopped_apps.kill()
+        if get_apps_failed:
+            cf_apps.kill()
             os.system('stty sane')
             self._cf_logout()
             exit(1)
 
-        commons.printMSG(CloudFoundry.clazz, method, 'end')
+        CloudFoundry.inventory = CfInventory(self.config.project_name,
+                                             CfInventory.parse_cf_apps(cf_apps_output.decode('utf-8')))
+        return CloudFoundry.inventory
 
-    def _get_started_apps(self, force_deploy=False):
-        method = '_get_started_apps'
+    def _get_stopped_apps(self):
+        method = '_get_stopped_apps'
         commons.printMSG(CloudFoundry.clazz, method, 'begin')
 
-        cmd = "{path}cf apps | grep {proj}*-v\d*\.\d*\.\d* | grep started | awk '{{print $1}}'".format(path=CloudFoundry.path_to_cf,
-                                                                                       proj=self.config.project_name)
+        CloudFoundry.stopped_apps = [app.name for app in self._get_app_inventory().stopped()]
 
-        started_apps = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        for app_name in CloudFoundry.stopped_apps:
+            commons.printMSG(CloudFoundry.clazz, method, "App Already Stopped: {}".format(app_name))
 
-        get_started_apps_failed = False
+        commons.printMSG(CloudFoundry.clazz, method, 'end')
 
-        try:
-            CloudFoundry.started_apps, errs = started_apps.communicate(timeout=60)
-
-            for line in CloudFoundry.started_apps.splitlines():
-                commons.printMSG(CloudFoundry.clazz, method, "Started App: {}".format(line.decode('utf-8')))
-                version_to_look_for = "{proj}-{ver}".format(proj=self.config.project_name,
-                                                            ver=self.config.version_number)
-
-                if line.decode('utf-8') == version_to_look_for and not force_deploy:
-                    commons.printMSG(CloudFoundry.clazz, method, "App version {} already exists and is running. "
-                                                                 "Cannot perform zero-downtime deployment.  To "
-                                                                 "override, set force flag = 'true'".format(
-                                                                  version_to_look_for), 'ERROR')
-                    get_started_apps_failed = True
-
-                elif line.decode('utf-8') == version_to_look_for and force_deploy:
-                    commons.printMSG(CloudFoundry.clazz, method, "Already found {} but force_deploy turned on. "
-                                                                 "Continuing with deployment.  Downtime will occur "
-                                                                 "during deployment.".format(version_to_look_for))
-            if started_apps.returncode != 0:
-                commons.printMSG(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {rtn}".format(
-                                 command=cmd, rtn=started_apps.returncode), 'ERROR')
+    def _get_started_apps(self, force_deploy=False):
+        method = '_get_started_apps'
+        commons.printMSG(CloudFoundry.clazz, method, 'begin')
 
-                get_started_apps_failed = True
+        CloudFoundry.started_apps = [app.name for app in self._get_app_inventory().started()]
 
-        except TimeoutExpired:
-            commons.printMSG(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'ERROR')
-            get_started_apps_failed = True
+        version_to_look_for = "{proj}-{ver}".format(proj=self.config.project_name, ver=self.config.version_number)
+
+        for app_name in CloudFoundry.started_apps:
+            commons.printMSG(CloudFoundry.clazz, method, "Started App: {}".format(app_name))
 
-        if get_started_apps_failed:
-            started_apps.kill()
-            # started_apps.communicate()
+        if version_to_look_for in CloudFoundry.started_apps and not force_deploy:
+            commons.printMSG(CloudFoundry.clazz, method, "App version {} already exists and is running. "
+                                                         "Cannot perform zero-downtime deployment.  To "
+                                                         "override, set force flag = 'true'".format(
+                                                          version_to_look_for), 'ERROR')
             os.system('stty sane')
             self._cf_logout()
             exit(1)
 
+        elif version_to_look_for in CloudFoundry.started_apps and force_deploy:
+            commons.printMSG(CloudFoundry.clazz, method, "Already found {} but force_deploy turned on. "
+                                                         "Continuing with deployment.  Downtime will occur "
+                                                         "during deployment.".format(version_to_look_for))
+
         commons.printMSG(CloudFoundry.clazz, method, 'end')
 
     def _determine_manifests(self):
@@ -310,159 +377,241 @@ class CloudFoundry(Cloud):
 
         commons.printMSG(CloudFoundry.clazz, method, 'end')
 
-    def _stop_old_app_servers(self):
-        method = '_stop_old_app_servers'
-        commons.printMSG(CloudFoundry.clazz, method, 'begin')
+    def _get_cli_workers(self):
+        if BuildConfig.settings is not None and BuildConfig.settings.has_option('cloudfoundry', 'cli_workers'):
+            return max(1, BuildConfig.settings.getint('cloudfoundry', 'cli_workers'))
 
-        stop_old_apps_failed = False
+        return 1
 
-        for line in CloudFoundry.started_apps.splitlines():
-            version_to_look_for = self.config.project_name+'-'+self.config.version_number
+    def _run_cf_command(self, cmd, timeout):
+        # returns the return code and output lines of a cf command.  a return code of None means it timed out.
+        env = None
+        if getattr(CloudFoundry.worker_cf_home, 'path', None) is not None:
+            env = dict(os.environ, CF_HOME=CloudFoundry.worker_cf_home.path)
 
-            if line.decode("utf-8") != version_to_look_for:
-                commons.printMSG(CloudFoundry.clazz, method, "Scaling down {}".format(line.decode("utf-8")))
+        process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
 
-                cmd = CloudFoundry.path_to_cf + "cf scale {} -i 1".format(line.decode("utf-8"))
+        try:
+            output, errs = process.communicate(timeout=timeout)
+        except TimeoutExpired:
+            process.kill()
+            process.communicate()
+            return None, []
 
-                cf_scale = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return process.returncode, output.decode('utf-8').splitlines()
 
-                try:
-                    cf_scale_output, errs = cf_scale.communicate(timeout=60)
+    def _stop_old_app_server(self, app_name):
+        output = ["Scaling down {}".format(app_name)]
+        failures = []
 
-                    for scale_line in cf_scale_output.splitlines():
-                        commons.printMSG(CloudFoundry.clazz, method, scale_line.decode('utf-8'))
+        # the inventory already knows the instance count, so apps down to one instance skip the scale
+        app = self._get_app_inventory().by_name.get(app_name)
 
-                    if cf_scale.returncode != 0:
-                        commons.printMSG(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {rtn}"
-                                                                     "".format(command=cmd, rtn=cf_scale.returncode),
-                                         'WARN')
-                        stop_old_apps_failed = True
+        if self._use_api():
+            try:
+                if app.desired_instances is None or app.desired_instances > 1:
+                    CloudFoundry.cc_client.scale(app.guid, 1)
+                CloudFoundry.cc_client.stop(app.guid)
+                output.append("Stopped {}".format(app_name))
+            except (CloudControllerException, requests.RequestException) as e:
+                failures.append(str(e))
+            return output, '\r\n'.join(failures) if failures else None
 
-                except TimeoutExpired:
-                    commons.printMSG(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'WARN')
-                    stop_old_apps_failed = True
+        commands = [CloudFoundry.path_to_cf + "cf stop %(project)s" % {'project': app_name}]
+        if app is None or app.desired_instances is None or app.desired_instances > 1:
+            commands.insert(0, CloudFoundry.path_to_cf + "cf scale {} -i 1".format(app_name))
 
-                stop_cmd = CloudFoundry.path_to_cf + "cf stop %(project)s" % {'project': line.decode("utf-8")}
-                commons.printMSG(CloudFoundry.clazz, method, stop_cmd)
-                cf_stop = subprocess.Popen(stop_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        for cmd in commands:
+            output.append(cmd)
+            rtn, lines = self._run_cf_command(cmd, 60)
+            output.extend(lines)
 
-                try:
-                    cf_stop_output, errs = cf_stop.communicate(timeout=60)
+            if rtn is None:
+                failures.append("Timed out calling {}".format(cmd))
+            elif rtn != 0:
+                failures.append("Failed calling {command}. Return code of {rtn}".format(command=cmd, rtn=rtn))
 
-                    for stop_line in cf_stop_output.splitlines():
-                        commons.printMSG(CloudFoundry.clazz, method, stop_line.decode("utf-8"))
+        return output, '\r\n'.join(failures) if failures else None
 
-                    if cf_scale.returncode != 0:
-                        commons.printMSG(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {rtn}"
-                                                                     "".format(command=cmd, rtn=cf_stop.returncode),
-                                         'WARN')
-                        stop_old_apps_failed = True
+    def _stop_old_app_servers(self):
+        method = '_stop_old_app_servers'
+        commons.printMSG(CloudFoundry.clazz, method, 'begin')
 
-                except TimeoutExpired:
-                    commons.printMSG(CloudFoundry.clazz, method, "Timed out calling".format(cmd), 'WARN')
-                    stop_old_apps_failed = True
-            else:
-                commons.printMSG(CloudFoundry.clazz, method, "Skipping scale down for {}".format(line.decode("utf-8")))
+        version_to_look_for = self.config.project_name+'-'+self.config.version_number
+        old_apps = []
 
-        if stop_old_apps_failed:
-            cf_stop.kill()
-            # cf_stop.communicate()
+        for app_name in CloudFoundry.started_apps:
+            if app_name != version_to_look_for:
+                old_apps.append(app_name)
+            else:
+                commons.printMSG(CloudFoundry.clazz, method, "Skipping scale down for {}".format(app_name))
+
+        failed = self._run_cf_commands(method, [(app_name, self._stop_old_app_server, (app_name,))
+                                                for app_name in old_apps], 'WARN')
+
+        if failed:
+            commons.printMSG(CloudFoundry.clazz, method, "{failed} of {total} old versions did not scale down or "
+                                                         "stop cleanly.\r\n{errors}".format(
+                                                          failed=len(failed), total=len(old_apps),
+                                                          errors='\r\n'.join(failure for app_failures in
+                                                                              failed.values()
+                                                                              for failure in app_failures)), 'WARN')
             os.system('stty sane')
             self._cf_logout()
 
         commons.printMSG(CloudFoundry.clazz, method, 'end')
 
-    def _unmap_delete_previous_versions(self):
-        method = '_unmap_delete_previous_versions'
-        commons.printMSG(CloudFoundry.clazz, method, 'begin')
+    def _get_routes_by_app(self):
+        method = '_get_routes_by_app'
 
-        unmap_delete_previous_versions_failed = False
+        # one listing of the space instead of a cf routes per app
+        if self._use_api():
+            try:
+                return CloudFoundry.cc_client.get_routes_by_app({app.guid: app.name for app in
+                                                                 self._get_app_inventory().apps})
+            except (CloudControllerException, requests.RequestException) as e:
+                commons.printMSG(CloudFoundry.clazz, method, "Failed listing routes. {}".format(e), 'ERROR')
+                os.system('stty sane')
+                self._cf_logout()
+                exit(1)
 
-        for line in CloudFoundry.stopped_apps.splitlines():
-            if "{proj}-{ver}".format(proj=self.config.project_name,
-                                     ver=self.config.version_number).lower() == line.decode("utf-8").lower():
-                commons.printMSG(CloudFoundry.clazz, method, "{} exists. Not removing routes for it.".format(
-                    line.decode("utf-8").lower()))
-            else:
-                cmd = "{path}cf routes | grep {old_app} | awk '{{print $2}}'".format(path=CloudFoundry.path_to_cf,
-                                                                                     old_app=line.decode("utf-8"))
-                commons.printMSG(CloudFoundry.clazz, method, cmd)
-                existing_routes = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        cmd = "{path}cf routes".format(path=CloudFoundry.path_to_cf)
+        commons.printMSG(CloudFoundry.clazz, method, cmd)
+        rtn, lines = self._run_cf_command(cmd, 120)
 
-                if CloudFoundry.cf_domain is not None:
-                    try:
-                        existing_routes_output, errs = existing_routes.communicate(timeout=120)
+        if rtn is None:
+            commons.printMSG(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'ERROR')
+            os.system('stty sane')
+            self._cf_logout()
+            exit(1)
+        elif rtn != 0:
+            commons.printMSG(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {rtn}".format(
+                command=cmd, rtn=rtn), 'ERROR')
+
+        return CfInventory.parse_cf_routes('\n'.join(lines))
+
+    def _unmap_route(self, app_name, host, domain, path):
+        if self._use_api():
+            return self._call_cc_api("Removing route {route} from {app}".format(route=host, app=app_name),
+                                     CloudFoundry.cc_client.unmap_route, app_name, host, domain, path)
 
-                        if existing_routes.returncode != 0:
-                            commons.printMSG(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {"
-                                                                         "rtn}".format(command=cmd,
-                                                                                       rtn=existing_routes.returncode),
-                                             'ERROR')
+        cmd = CloudFoundry.path_to_cf + "cf unmap-route {old_app} {domain} -n {host}".format(old_app=app_name,
+                                                                                           domain=domain, host=host)
+        if path:
+            cmd += " --path {}".format(path)
 
-                        for route_line in existing_routes_output.splitlines():
-                            commons.printMSG(CloudFoundry.clazz, method, "Removing route {route} from {line}".format(
-                                route=route_line.decode("utf-8"), line=line.decode("utf-8")))
+        output = ["Removing route {route} from {app}".format(route=host, app=app_name), cmd]
+        rtn, lines = self._run_cf_command(cmd, 120)
+        output.extend(lines)
 
-                            cmd = CloudFoundry.path_to_cf + "cf unmap-route %(old_app)s %(cf_domain)s -n %(route_line)s" % {'old_app': line.decode("utf-8"), 'cf_domain': CloudFoundry.cf_domain, 'route_line': route_line.decode("utf-8")}
+        if rtn is None:
+            return output, "Timed out calling {}".format(cmd)
+        elif rtn != 0:
+            return output, "Failed calling {command}. Return code of {rtn}".format(command=cmd, rtn=rtn)
 
-                            commons.printMSG(CloudFoundry.clazz, method, cmd)
+        return output, None
 
-                            unmap_route = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
-                                                           stderr=subprocess.STDOUT)
+    def _delete_app(self, app_name):
+        if self._use_api():
+            return self._call_cc_api("Deleting {}".format(app_name), CloudFoundry.cc_client.delete_app,
+                                     self._get_app_inventory().by_name[app_name].guid)
 
-                            try:
-                                unmap_route_output, errs = unmap_route.communicate(timeout=120)
+        cmd = CloudFoundry.path_to_cf + "cf delete %(project)s -f" % {'project': app_name}
 
-                                for unmapped_route in unmap_route_output.splitlines():
-                                    commons.printMSG(CloudFoundry.clazz, method, unmapped_route.decode("utf-8"))
+        output = [cmd]
+        rtn, lines = self._run_cf_command(cmd, 120)
+        output.extend(lines)
 
-                                if unmap_route.returncode != 0:
-                                    unmap_delete_previous_versions_failed = True
-                                    commons.printMSG(CloudFoundry.clazz, method, "Failed calling {command}. Return "
-                                                                                 "code of {rtn}".format(
-                                                                                    command=cmd,
-                                                                                    rtn=unmap_route.returncode),
-                                                     'ERROR')
+        if rtn is None:
+            return output, "Timed out calling {}".format(cmd)
+        elif rtn != 0:
+            return output, "Failed calling {command}. Return code of {rtn}".format(command=cmd, rtn=rtn)
 
-                            except TimeoutExpired:
-                                unmap_delete_previous_versions_failed = True
-                                commons.printMSG(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'ERROR')
+        return output, None
 
-                    except TimeoutExpired:
-                        commons.printMSG(CloudFoundry.clazz, method, "Timed out calling {}".format(cmd), 'ERROR')
-                        unmap_delete_previous_versions_failed = True
+    def _call_cc_api(self, description, function, *args):
+        try:
+            function(*args)
+        except (CloudControllerException, requests.RequestException) as e:
+            return [description], "{description} failed. {error}".format(description=description, error=e)
+
+        return [description], None
+
+    def _copy_cf_home(self, cf_homes):
+        # the cli rewrites config.json on every command, so each worker gets its own copy of the logged in session
+        source = os.path.join(os.environ.get('CF_HOME', os.path.expanduser('~')), '.cf', 'config.json')
+        cf_home = tempfile.mkdtemp(prefix='flow-cf-home-')
+        os.makedirs(os.path.join(cf_home, '.cf'))
+        if os.path.isfile(source):
+            shutil.copyfile(source, os.path.join(cf_home, '.cf', 'config.json'))
+
+        CloudFoundry.worker_cf_home.path = cf_home
+        cf_homes.append(cf_home)
+
+    def _run_cf_commands(self, method, tasks, level):
+        # runs (key, function, args) tasks on the bounded pool and returns the failures by key.  each worker drives
+        # one cf process at a time, which caps how many run against the space at once.  output is printed per task
+        # once it is done so parallel commands do not interleave.
+        failed = {}
+        workers = min(self._get_cli_workers(), max(len(tasks), 1))
+        cf_homes = []
+        initializer = self._copy_cf_home if workers > 1 and not self._use_api() else None
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers, initializer=initializer,
+                                    initargs=(cf_homes,) if initializer else ()) as executor:
+                futures = {executor.submit(function, *args): key for key, function, args in tasks}
 
-                if unmap_delete_previous_versions_failed is False:
-                    delete_cmd = CloudFoundry.path_to_cf + "cf delete %(project)s -f" % {'project': line.decode("utf-8")}
+                for future in as_completed(futures):
+                    output, failure = future.result()
 
-                    commons.printMSG(CloudFoundry.clazz, method, delete_cmd)
+                    for line in output:
+                        commons.printMSG(CloudFoundry.clazz, method, line)
 
-                    delete_app = subprocess.Popen(delete_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                    if failure is not None:
+                        commons.printMSG(CloudFoundry.clazz, method, failure, level)
+                        failed.setdefault(futures[future], []).append(failure)
+        finally:
+            for cf_home in cf_homes:
+                shutil.rmtree(cf_home, ignore_errors=True)
 
-                    try:
-                        delete_app_output, errs = delete_app.communicate(timeout=120)
-
-                        for deleted_app in delete_app_output.splitlines():
-                            commons.printMSG(CloudFoundry.clazz, method, deleted_app.decode("utf-8"))
-
-                        if delete_app.returncode != 0:
-                            commons.printMSG(CloudFoundry.clazz, method, "Failed calling {command}. Return code of {"
-                                                                         "rtn}".format(command=cmd,
-                                                                                       rtn=delete_app.returncode),
-                                             'ERROR')
-
-                    except TimeoutExpired:
-                        commons.printMSG(CloudFoundry.clazz, method, "Timed out calling".format(delete_cmd), 'ERROR')
-                        delete_app.kill()
-                        delete_app.communicate()
-                        os.system('stty sane')
-
-                if unmap_delete_previous_versions_failed:
-                    existing_routes.kill()
-                    # existing_routes.communicate()
-                    os.system('stty sane')
-                    self._cf_logout()
-                    exit(1)
+        return failed
+
+    def _unmap_delete_previous_versions(self):
+        method = '_unmap_delete_previous_versions'
+        commons.printMSG(CloudFoundry.clazz, method, 'begin')
+
+        current_app = "{proj}-{ver}".format(proj=self.config.project_name, ver=self.config.version_number).lower()
+        old_apps = []
+
+        for app_name in CloudFoundry.stopped_apps:
+            if current_app == app_name.lower():
+                commons.printMSG(CloudFoundry.clazz, method, "{} exists. Not removing routes for it.".format(
+                    app_name.lower()))
+            else:
+                old_apps.append(app_name)
+
+        routes_by_app = self._get_routes_by_app() if old_apps and CloudFoundry.cf_domain is not None else {}
+
+        # every route of every old version is unmapped at once, then the versions that lost all of their routes
+        # are deleted at once
+        unmaps = [(app_name, self._unmap_route, (app_name, host, domain, path))
+                  for app_name in old_apps for host, domain, path in routes_by_app.get(app_name, [])]
+        failed_unmaps = self._run_cf_commands(method, unmaps, 'ERROR')
+
+        deletes = [(app_name, self._delete_app, (app_name,)) for app_name in old_apps if app_name not in failed_unmaps]
+        failed_deletes = self._run_cf_commands(method, deletes, 'ERROR')
+
+        if failed_deletes:
+            commons.printMSG(CloudFoundry.clazz, method, "Failed deleting {}".format(', '.join(sorted(
+                failed_deletes))), 'ERROR')
+
+        if failed_unmaps:
+            commons.printMSG(CloudFoundry.clazz, method, "Failed removing routes from {}. They were not "
+                                                         "deleted.".format(', '.join(sorted(failed_unmaps))), 'ERROR')
+            os.system('stty sane')
+            self._cf_logout()
+            exit(1)
 
         commons.printMSG(CloudFoundry.clazz, method, 'end')
 
@@ -608,6 +757,148 @@ class CloudFoundry(Cloud):
 
         commons.printMSG(CloudFoundry.clazz, method, 'end')
 
+    def _get_target_workers(self):
+        if BuildConfig.settings is not None and BuildConfig.settings.has_option('cloudfoundry', 'target_workers'):
+            return max(1, BuildConfig.settings.getint('cloudfoundry', 'target_workers'))
+
+        return 1
+
+    def _deploy_target(self, target, force_deploy, manifest):
+        method = '_deploy_target'
+        commons.printMSG(CloudFoundry.clazz, method, "Deploying to {}".format(target['name']))
+
+        # the cf cli keeps its session in CF_HOME, so every target logs in to a home of its own
+        start = time.time()
+        previous_cf_home = os.environ.get('CF_HOME')
+        cf_home = tempfile.mkdtemp(prefix='flow-cf-home-')
+        os.environ['CF_HOME'] = cf_home
+        result = {'target': target['name'], 'status': 'deployed', 'seconds': 0.0, 'error': None}
+
+        try:
+            self._use_target(target)
+            self._deploy_to_space(force_deploy, manifest)
+        except SystemExit as e:
+            result['status'] = 'failed'
+            result['error'] = "exit code {}".format(e.code)
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] = "{}: {}".format(type(e).__name__, e)
+        finally:
+            if previous_cf_home is None:
+                os.environ.pop('CF_HOME', None)
+            else:
+                os.environ['CF_HOME'] = previous_cf_home
+            shutil.rmtree(cf_home, ignore_errors=True)
+
+        result['seconds'] = time.time() - start
+        return result
+
+    def _prefix_output(self, name):
+        # targets deploying side by side share the terminal, so every line printed by this process and the cf cli
+        # it runs goes through a pipe and comes out with the name of the target in front
+        sys.stdout.flush()
+        sys.stderr.flush()
+        read_fd, write_fd = os.pipe()
+        terminal = os.dup(1)
+        os.dup2(write_fd, 1)
+        os.dup2(write_fd, 2)
+        os.close(write_fd)
+        # print may not be writing to descriptor 1 directly, and a line at a time keeps the output live
+        sys.stdout = open(1, 'w', buffering=1, closefd=False)
+        sys.stderr = open(2, 'w', buffering=1, closefd=False)
+
+        def forward():
+            prefix = "[{}] ".format(name).encode('utf-8')
+            with os.fdopen(read_fd, 'rb') as pipe_in:
+                for line in pipe_in:
+                    os.write(terminal, prefix + line)
+            os.close(terminal)
+
+        forwarder = threading.Thread(target=forward, name='flow-target-output', daemon=True)
+        forwarder.start()
+        return forwarder
+
+    def _deploy_target_in_child(self, target, force_deploy, manifest, connection):
+        # pooled connections were inherited from the parent and must not be shared with it
+        httpclient.close()
+        forwarder = self._prefix_output(target['name'])
+
+        try:
+            result = self._deploy_target(target, force_deploy, manifest)
+        finally:
+            # the forwarder stops once nothing can write to the pipe anymore
+            sys.stdout.flush()
+            sys.stderr.flush()
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, 1)
+            os.dup2(devnull, 2)
+            os.close(devnull)
+            forwarder.join()
+
+        connection.send(result)
+        connection.close()
+
+    def _deploy_targets(self, force_deploy, manifest):
+        method = '_deploy_targets'
+        commons.printMSG(CloudFoundry.clazz, method, 'begin')
+
+        targets = list(CloudFoundry.targets)
+        results = []
+
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            commons.printMSG(CloudFoundry.clazz, method, 'Processes cannot be forked on this platform. Deploying '
+                                                         'to one target at a time.', 'WARN')
+            results = [self._deploy_target(target, force_deploy, manifest) for target in targets]
+        else:
+            # targets deploy in forked processes because the deployment state lives on the class.  the artifact in
+            # the push location was downloaded once and is shared by all of them.
+            context = multiprocessing.get_context('fork')
+            workers = self._get_target_workers()
+            running = {}
+
+            while targets or running:
+                while targets and len(running) < workers:
+                    target = targets.pop(0)
+                    reader, writer = context.Pipe(duplex=False)
+                    process = context.Process(target=self._deploy_target_in_child,
+                                              args=(target, force_deploy, manifest, writer))
+                    process.start()
+                    writer.close()
+                    running[reader] = (process, target, time.time())
+
+                for reader in multiprocessing.connection.wait(list(running)):
+                    process, target, start = running.pop(reader)
+                    try:
+                        result = reader.recv()
+                    except EOFError:
+                        result = None
+                    reader.close()
+                    process.join()
+
+                    if result is None:
+                        result = {'target': target['name'], 'status': 'failed', 'seconds': time.time() - start,
+                                  'error': "process ended with exit code {}".format(process.exitcode)}
+                    results.append(result)
+
+        self._report_targets(results)
+
+        commons.printMSG(CloudFoundry.clazz, method, 'end')
+
+    def _report_targets(self, results):
+        method = '_report_targets'
+
+        for result in sorted(results, key=lambda result: result['target']):
+            commons.printMSG(CloudFoundry.clazz, method, "{target}: {status} in {seconds:.1f}s{error}".format(
+                target=result['target'], status=result['status'], seconds=result['seconds'],
+                error=" ({})".format(result['error']) if result['error'] else ''))
+
+        failed = sorted(result['target'] for result in results if result['status'] != 'deployed')
+
+        if failed:
+            commons.printMSG(CloudFoundry.clazz, method, "{failed} of {total} targets failed: {targets}".format(
+                failed=len(failed), total=len(results), targets=', '.join(failed)), 'ERROR')
+            exit(1)
+
     def deploy(self, force_deploy=False, manifest=None):
         method = 'deploy'
         commons.printMSG(CloudFoundry.clazz, method, 'begin')
@@ -616,11 +907,25 @@ class CloudFoundry(Cloud):
 
         self.download_cf_cli()
 
-        self._cf_login_check()
+        if CloudFoundry.targets:
+            self._deploy_targets(force_deploy, manifest)
+        else:
+            self._deploy_to_space(force_deploy, manifest)
+
+        commons.printMSG(CloudFoundry.clazz, method, 'DEPLOYMENT SUCCESSFUL')
+
+        commons.printMSG(CloudFoundry.clazz, method, 'end')
+
+    def _deploy_to_space(self, force_deploy, manifest):
+        # login, push, stop and cleanup against the org and space targeted on the class
+        if self._use_api():
+            self._cc_api_login()
+        else:
+            self._cf_login_check()
 
-        self._cf_login()
+            self._cf_login()
 
-        self._check_cf_version()
+            self._check_cf_version()
 
         self._get_stopped_apps()
 
@@ -629,6 +934,10 @@ class CloudFoundry(Cloud):
         if manifest is None:
             manifest = self._determine_manifests()
 
+        if self._use_api():
+            # cf push still uploads the bits, so the cli gets its own session, but only right before the push
+            self._cf_login()
+
         self._cf_push(manifest)
 
         if not os.getenv("AUTO_STOP"):
@@ -639,7 +948,3 @@ class CloudFoundry(Cloud):
             # for backup and force_deploy is used when you need to redeploy/replace an instance
             # that is currently running
             self._unmap_delete_previous_versions()
-
-        commons.printMSG(CloudFoundry.clazz, method, 'DEPLOYMENT SUCCESSFUL')
-
-        commons.printMSG(CloudFoundry.clazz, method, 'end')
@@ -1,20 +1,26 @@
 #!/usr/bin/python
 # github.py
 
+import hashlib
+import io
 import json
 import os
 import re
-import shutil
 import subprocess
 import tarfile
-import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
 
 import requests
 from flow.buildconfig import BuildConfig
 from flow.coderepo.code_repo_abc import Code_Repo
+from flow.coderepo.github.ratelimiter import RateLimiter
+from flow.coderepo.github.semverindex import SemverIndex
+from flow.coderepo.localgit.localgit import LocalGit
 
 import flow.utils.commons as cicommons
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 from flow.utils.commons import Object
 
 
@@ -26,10 +32,50 @@ class GitHub(Code_Repo):
     token = None
     config = BuildConfig
     http_timeout = 10
+    max_retries = 5
+    rate_limiter = RateLimiter()
+    download_buffer_size = 1024 * 1024
+    backend = 'api'
+    local_git = None
+
+    cache_dir = None
+    page_fetch_workers = None
+    response_cache_max_mb = None
 
     all_tags_and_shas = []
+    semver_index = None
+    cached_tag_pages = None
     all_commits = []
+    commit_index = {}
+    commit_head_etag = None
+    commit_cache_loaded = False
     found_all_commits = False
+    graphql_tags_cursor = None
+    graphql_found_all_tags = False
+    graphql_commits_cursor = None
+
+    # tags and branch history share one query so a single round trip can answer both
+    graphql_history_query = """
+        query($owner: String!, $name: String!, $branch: String!, $tagsCursor: String, $commitsCursor: String,
+              $withTags: Boolean!, $withCommits: Boolean!) {
+          repository(owner: $owner, name: $name) {
+            refs(refPrefix: "refs/tags/", first: 100, after: $tagsCursor,
+                 orderBy: {field: TAG_COMMIT_DATE, direction: DESC}) @include(if: $withTags) {
+              pageInfo { hasNextPage endCursor }
+              nodes { name target { oid ... on Tag { target { oid } } } }
+            }
+            ref(qualifiedName: $branch) @include(if: $withCommits) {
+              target {
+                ... on Commit {
+                  history(first: 100, after: $commitsCursor) {
+                    pageInfo { hasNextPage endCursor }
+                    nodes { oid message }
+                  }
+                }
+              }
+            }
+          }
+        }"""
 
     def __init__(self, config_override=None, verify_repo=True):
         method = '__init__'
@@ -42,8 +88,6 @@ class GitHub(Code_Repo):
         if verify_repo is True:
             self._load_github_token()
 
-            #self._refresh_tags()
-
             self._verify_required_attributes()
 
             self._verify_repo_existence(GitHub.url, GitHub.org, GitHub.repo)
@@ -63,19 +107,6 @@ class GitHub(Code_Repo):
 
         commons.printMSG(GitHub.clazz, method, 'end')
 
-    def _refresh_tags(self):
-        method = '_refresh_tags'
-        commons.printMSG(GitHub.clazz, method, 'getting latest tags')
-
-        # TODO this didn't seem to work on Jenkins 
-        pull_tags_cmd = 'git pull --tags'
-        pull_tags = subprocess.Popen(pull_tags_cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-        pull_tags_outputs, pull_tags_errs = pull_tags.communicate(timeout=300)
-
-        for tag_line in pull_tags_outputs.splitlines():
-            commons.printMSG(GitHub.clazz, method, tag_line.decode("utf-8"))
-
     def _verify_required_attributes(self):
         method = '_verify_required_attributes'
 
@@ -84,11 +115,121 @@ class GitHub(Code_Repo):
             GitHub.url = self.config.json_config['github']['URL']
             GitHub.org = self.config.json_config['github']['org']
             GitHub.repo = self.config.json_config['github']['repo']
+            GitHub.backend = self.config.json_config['github'].get('backend', 'api')
         except KeyError as e:
             commons.printMSG(GitHub.clazz, method, "The build config associated with github is missing, {}."
                              .format(e), 'ERROR')
             exit(1)
 
+    def _get_local_git(self):
+        method = '_get_local_git'
+
+        if GitHub.backend != 'local':
+            return None
+
+        if GitHub.local_git is None:
+            GitHub.local_git = LocalGit(remote_repo=GitHub.org + '/' + GitHub.repo)
+
+            if GitHub.local_git.is_usable():
+                commons.printMSG(GitHub.clazz, method, 'Answering tag and commit lookups from the local checkout')
+            else:
+                commons.printMSG(GitHub.clazz, method, 'The local checkout cannot be used, falling back to the '
+                                                       'GitHub API', 'WARN')
+
+        return GitHub.local_git if GitHub.local_git.is_usable() else None
+
+    def _use_graphql(self):
+        method = '_use_graphql'
+
+        if GitHub.backend != 'graphql':
+            return False
+
+        if GitHub.token is None:
+            commons.printMSG(GitHub.clazz, method, 'The GitHub GraphQL API requires a token, falling back to the '
+                                                   'REST API', 'WARN')
+            return False
+
+        return True
+
+    def _get_graphql_url(self):
+        # https://api.github.com/repos -> https://api.github.com/graphql
+        # https://github.company.com/api/v3/repos -> https://github.company.com/api/graphql
+        url = GitHub.url.rstrip('/')
+        if url.endswith('/repos'):
+            url = url[:-len('/repos')]
+        if url.endswith('/v3'):
+            url = url[:-len('/v3')]
+        return url + '/graphql'
+
+    def _get_graphql_page(self, with_tags, with_commits):
+        method = '_get_graphql_page'
+
+        graphql_url = self._get_graphql_url()
+        headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json,
+                   'Authorization': ('bearer ' + GitHub.token)}
+        query = {
+            'query': GitHub.graphql_history_query,
+            'variables': {
+                'owner': GitHub.org,
+                'name': GitHub.repo,
+                'branch': 'refs/heads/' + self.config.build_env_info['associatedBranchName'],
+                'tagsCursor': GitHub.graphql_tags_cursor,
+                'commitsCursor': GitHub.graphql_commits_cursor,
+                'withTags': with_tags,
+                'withCommits': with_commits
+            }
+        }
+
+        attempt = 0
+
+        while True:
+            commons.printMSG(GitHub.clazz, method, "{url} tags: {tags} commits: {commits}".format(
+                url=graphql_url, tags=with_tags, commits=with_commits))
+
+            resp = self._send_github_request(method, 'POST', graphql_url, data=json.dumps(query), headers=headers)
+
+            # graphql reports query problems, including running out of points, in an errors list alongside a 200
+            errors = resp.json().get('errors') if resp.status_code == 200 else None
+            if errors and any(error.get('type') == 'RATE_LIMITED' for error in errors) and attempt < self.max_retries:
+                GitHub.rate_limiter.backoff(attempt)
+                attempt += 1
+                continue
+
+            if resp.status_code != 200 or errors:
+                commons.printMSG(GitHub.clazz, method, "Failed to access github location {url}\r\n Response: {"
+                                                       "rsp}".format(url=graphql_url, rsp=resp.text), "ERROR")
+                exit(1)
+
+            break
+
+        repository = resp.json()['data']['repository']
+
+        if with_tags:
+            refs = repository['refs']
+            for node in refs['nodes']:
+                # annotated tags point at a tag object, so use the commit the tag object points at
+                target = node['target'].get('target', node['target'])
+                GitHub.all_tags_and_shas.append((node['name'], target['oid']))
+            GitHub.graphql_tags_cursor = refs['pageInfo']['endCursor']
+            GitHub.graphql_found_all_tags = not refs['pageInfo']['hasNextPage']
+
+        if with_commits:
+            if repository['ref'] is None:
+                commons.printMSG(GitHub.clazz, method, "Branch {} was not found".format(
+                    self.config.build_env_info['associatedBranchName']), 'WARN')
+                GitHub.found_all_commits = True
+                return
+
+            history = repository['ref']['target']['history']
+            index = self._get_commit_index(GitHub.all_commits)
+            for node in history['nodes']:
+                if node['oid'] not in index:
+                    index[node['oid']] = len(GitHub.all_commits)
+                    GitHub.all_commits.append({'sha': node['oid'], 'commit': {'message': node['message']}})
+            GitHub.commit_index = index
+            GitHub.graphql_commits_cursor = history['pageInfo']['endCursor']
+            GitHub.found_all_commits = not history['pageInfo']['hasNextPage']
+
     def _verify_repo_existence(self, url, org, repo, token=None):
         method = '_verify_repo_existence'
         commons.printMSG(GitHub.clazz, method, 'begin')
@@ -107,7 +248,7 @@ class GitHub(Code_Repo):
         commons.printMSG(GitHub.clazz, method, repo_url)
 
         try:
-            resp = requests.get(repo_url, headers=headers, verify=False, timeout=self.http_timeout)
+            resp = self._get_with_response_cache(repo_url, headers)
         except requests.ConnectionError:
             commons.printMSG(GitHub.clazz, method, "Request to GitHub timed out.", "ERROR")
             exit(1)
@@ -167,7 +308,8 @@ class GitHub(Code_Repo):
             headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json}
 
         try:
-            resp = requests.post(release_url, tag_and_release_note_payload, headers=headers, params=url_params, verify=False, timeout=self.http_timeout)
+            resp = self._send_github_request(method, 'POST', release_url, resend_on_error=False,
+                                             data=tag_and_release_note_payload, headers=headers, params=url_params)
         except requests.ConnectionError:
             commons.printMSG(GitHub.clazz, method, 'Request to GitHub timed out.', 'ERROR')
             exit(1)
@@ -226,7 +368,7 @@ class GitHub(Code_Repo):
         headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json, 'Authorization': ('token ' + self.token)}
 
         try:
-            resp = requests.get(release_url_api, headers=headers, verify=False, timeout=self.http_timeout)
+            resp = self._get_with_response_cache(release_url_api, headers)
         except requests.ConnectionError:
             commons.printMSG(GitHub.clazz, method, 'Request to GitHub timed out.', 'ERROR')
             exit(1)
@@ -245,7 +387,8 @@ class GitHub(Code_Repo):
         }
         release_url_api = self.url + '/' + self.org + '/' + self.repo + '/releases/' + str(git_release_id)
         try:
-            resp = requests.patch(release_url_api, json=jsonMessage, headers=headers, verify=False, timeout=self.http_timeout)
+            resp = self._send_github_request(method, 'PATCH', release_url_api, resend_on_error=False, json=jsonMessage,
+                                             headers=headers)
         except requests.ConnectionError:
             commons.printMSG(GitHub.clazz, method, 'Request to GitHub timed out.', 'ERROR')
             exit(1)
@@ -367,6 +510,19 @@ class GitHub(Code_Repo):
         
         commons.printMSG(GitHub.clazz, method, "starting with {}".format(beginning_tag))
         commons.printMSG(GitHub.clazz, method, "Category: " + self.config.artifact_category.lower())  
+
+        # semver tags can be looked up by version instead of relying on the order the tags came back in
+        if beginning_tag is not None and SemverIndex.semver_regex.fullmatch(beginning_tag.strip()):
+            kind = 'release' if self.config.artifact_category.lower() == 'release' else 'snapshot'
+            index = self._update_semver_index(tags)
+            beginning_version = self.convert_semver_string_to_semver_tag_array(beginning_tag)
+            # like the walk below, a version that is not tagged has no previous tag
+            previous_tag = index.previous(beginning_version, kind) if index.exists(beginning_version) else None
+            commons.printMSG(GitHub.clazz, method, previous_tag if previous_tag is not None else
+                             'tag not found, or was the first tag')
+            commons.printMSG(GitHub.clazz, method, 'end')
+            return previous_tag
+
         found_tag = False
         for name, _ in tags:
             if found_tag:
@@ -384,85 +540,270 @@ class GitHub(Code_Repo):
         commons.printMSG(GitHub.clazz, method, 'tag not found, or was the first tag')
         return None
 
+    def _get_page_fetch_workers(self):
+        if GitHub.page_fetch_workers is not None:
+            return GitHub.page_fetch_workers
+
+        if BuildConfig.settings is not None and BuildConfig.settings.has_option('github', 'page_fetch_workers'):
+            return max(1, BuildConfig.settings.getint('github', 'page_fetch_workers'))
+
+        return 1
+
+    def _get_last_page(self, resp):
+        if 'last' not in resp.links:
+            return None
+
+        last_page = parse_qs(urlparse(resp.links['last']['url']).query).get('page')
+        return int(last_page[0]) if last_page else None
+
+    def _get_pages(self, first_page, get_page):
+        # yields each page in order.  once a response tells us the last page, the remaining pages are
+        # requested page_fetch_workers at a time, so a caller that stops early wastes at most one window.
+        workers = self._get_page_fetch_workers()
+        page = first_page
+        last_page = None
+
+        while True:
+            if workers > 1 and last_page is not None and page <= last_page:
+                window = list(range(page, min(page + workers, last_page + 1)))
+
+                with ThreadPoolExecutor(max_workers=len(window)) as executor:
+                    for result in executor.map(get_page, window):
+                        yield result
+                        if not result['has_next']:
+                            return
+
+                page += len(window)
+            else:
+                result = get_page(page)
+                yield result
+                if not result['has_next']:
+                    return
+
+                last_page = result['last_page']
+                page += 1
+
+    def _get_commit_index(self, commits):
+        if commits is GitHub.all_commits and len(GitHub.commit_index) == len(commits):
+            return GitHub.commit_index
+
+        index = {}
+        for position, commit in enumerate(commits):
+            index.setdefault(commit['sha'], position)
+        return index
+
+    def _load_cached_commits(self, commit_cache_file):
+        method = '_load_cached_commits'
+
+        cached = commons.read_json_file(commit_cache_file)
+
+        if cached is None or 'commits' not in cached:
+            return
+
+        GitHub.all_commits = [{'sha': sha, 'commit': {'message': message}} for sha, message in cached['commits']]
+        GitHub.commit_index = self._get_commit_index(GitHub.all_commits)
+        GitHub.commit_head_etag = cached.get('head_etag')
+        GitHub.found_all_commits = cached.get('found_all', False)
+
+        commons.printMSG(GitHub.clazz, method, "Loaded {} cached commits from {}".format(len(GitHub.all_commits),
+                                                                                        commit_cache_file))
+
+    def _save_cached_commits(self, commit_cache_file, branch):
+        if commit_cache_file is None:
+            return
+
+        commons.write_json_file(commit_cache_file, {'url': GitHub.url, 'org': GitHub.org, 'repo': GitHub.repo,
+                                                    'branch': branch, 'head_etag': GitHub.commit_head_etag,
+                                                    'found_all': GitHub.found_all_commits,
+                                                    'commits': [(commit['sha'], commit['commit']['message'])
+                                                                for commit in GitHub.all_commits]})
+
+    def _send_github_request(self, method, http_method, url, resend_on_error=True, **kwargs):
+        # paces requests against the rate limit and retries connection failures, server errors and throttling.
+        # this loop is the only retry layer, so the pooled session is asked not to retry underneath it.
+        # writes pass resend_on_error=False, a failed write may still have happened so only throttling sends it again.
+        attempt = 0
+
+        while True:
+            GitHub.rate_limiter.wait()
+
+            try:
+                resp = httpclient.request(http_method, url, retry=False, verify=False, timeout=self.http_timeout,
+                                          **kwargs)
+            except Exception as e:
+                commons.printMSG(GitHub.clazz, method, "Failed to access github location {}".format(e))
+                if resend_on_error and attempt < self.max_retries:
+                    GitHub.rate_limiter.backoff(attempt)
+                    attempt += 1
+                    continue
+                commons.printMSG(GitHub.clazz, method, "Failed to access github location {}".format(e), "ERROR")
+                exit(1)
+
+            throttled = GitHub.rate_limiter.update(resp)
+            if (throttled or (resend_on_error and resp.status_code >= 500)) and attempt < self.max_retries:
+                GitHub.rate_limiter.backoff(attempt)
+                attempt += 1
+                continue
+
+            return resp
+
+    def _get_github_page(self, repo_url, headers):
+        method = '_get_github_page'
+
+        commons.printMSG(GitHub.clazz, method, repo_url)
+
+        resp = self._send_github_request(method, 'GET', repo_url, headers=headers)
+
+        if resp.status_code != 200 and resp.status_code != 304:
+            commons.printMSG(GitHub.clazz, method, "Failed to access github location {url}\r\n Response: {"
+                                                   "rsp}".format(url=repo_url, rsp=resp.text), "ERROR")
+            exit(1)
+
+        return resp
+
+    def _log_throttled_time(self, method):
+        if GitHub.rate_limiter.throttled_seconds > 0:
+            commons.printMSG(GitHub.clazz, method, "Spent {:.1f}s waiting on GitHub rate limits so far".format(
+                GitHub.rate_limiter.throttled_seconds))
+
+    def _pull_new_commits(self, commits_url, headers):
+        method = '_pull_new_commits'
+
+        # walk from the tip of the branch until we reach the newest commit we already know about
+        cached_head = GitHub.all_commits[0]['sha']
+        new_commits = []
+        page = 1
+
+        while True:
+            page_headers = dict(headers)
+            if page == 1 and GitHub.commit_head_etag is not None:
+                page_headers['If-None-Match'] = GitHub.commit_head_etag
+
+            resp = self._get_github_page(commits_url + '&page=' + str(page), page_headers)
+
+            if resp.status_code == 304:
+                commons.printMSG(GitHub.clazz, method, 'No new commits since the last run')
+                return
+
+            if page == 1:
+                GitHub.commit_head_etag = resp.headers.get('ETag')
+
+            for commit in resp.json():
+                if commit['sha'] == cached_head:
+                    commons.printMSG(GitHub.clazz, method, '{} new commits since the last run'.format(
+                        len(new_commits)))
+                    GitHub.all_commits = new_commits + GitHub.all_commits
+                    GitHub.commit_index = self._get_commit_index(GitHub.all_commits)
+                    return
+                new_commits.append({'sha': commit['sha'], 'commit': {'message': commit['commit']['message']}})
+
+            if 'next' not in resp.links:
+                # the cached head is no longer part of the branch, so the history was rewritten.
+                commons.printMSG(GitHub.clazz, method, 'Cached commits are no longer on the branch, replacing them')
+                GitHub.all_commits = new_commits
+                GitHub.commit_index = self._get_commit_index(GitHub.all_commits)
+                GitHub.found_all_commits = True
+                return
+
+            page += 1
+
+    def _get_commit_page(self, commits_url, headers, page):
+        resp = self._get_github_page(commits_url + '&page=' + str(page), headers)
+
+        return {'page': page,
+                'items': [{'sha': commit['sha'], 'commit': {'message': commit['commit']['message']}}
+                          for commit in resp.json()],
+                'has_next': 'next' in resp.links,
+                'last_page': self._get_last_page(resp),
+                'etag': resp.headers.get('ETag')}
+
     def get_all_commits_from_github(self, start_from_sha=None):
         method = "get_all_commits_from_github"
         commons.printMSG(GitHub.clazz, method, 'begin')
 
-        if len(GitHub.all_commits) > 0:
-            if GitHub.found_all_commits:
-                commons.printMSG(GitHub.clazz, method, 'All commits pulled, returning cached results')
-                return GitHub.all_commits
-
-            foundSha = False
-            for commit in GitHub.all_commits:
-                if commit['sha'] == start_from_sha:
-                    foundSha = True
-                    commons.printMSG(GitHub.clazz, method, 'The beginning sha is in our cached list')
-            if foundSha:
-                commons.printMSG(GitHub.clazz, method, 'Returning cached results')
-                return GitHub.all_commits
-            commons.printMSG(GitHub.clazz, method, 'Beginning sha is not in our cached list, pulling more commits')
-
         per_page = 100
-        start_page = (len(GitHub.all_commits)//per_page)+1
-        finished = False
-        output = GitHub.all_commits
         branch = self.config.build_env_info['associatedBranchName']
-            
-        repo_url = GitHub.url + '/' + GitHub.org + '/' + GitHub.repo + '/commits?per_page=' + str(per_page) + '&page=' + str(start_page) + '&sha=' + str(branch)
+        commits_url = GitHub.url + '/' + GitHub.org + '/' + GitHub.repo + '/commits?per_page=' + str(per_page) + '&sha=' + str(branch)
         token = GitHub.token
         if token is not None:
             headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json,
                         'Authorization': ('token ' + token)}
         else:
             headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json}
-        
-        retries = 0
 
-        while not finished:
+        local_git = self._get_local_git()
+        if local_git is not None:
+            branch_ref = local_git.resolve_branch(branch)
+            if branch_ref is not None:
+                GitHub.all_commits = local_git.get_commits(branch_ref)
+                GitHub.commit_index = self._get_commit_index(GitHub.all_commits)
+                GitHub.found_all_commits = True
+                commons.printMSG(GitHub.clazz, method, 'end')
+                return GitHub.all_commits
+            commons.printMSG(GitHub.clazz, method, "Branch {} is not in the local checkout, using the GitHub "
+                                                   "API".format(branch), 'WARN')
 
-            commons.printMSG(GitHub.clazz, method, repo_url)
+        if self._use_graphql():
+            while not GitHub.found_all_commits and start_from_sha not in self._get_commit_index(GitHub.all_commits):
+                self._get_graphql_page(False, True)
 
-            try:
-                resp = requests.get(repo_url, headers=headers, verify=False, timeout=self.http_timeout)
-            except Exception as e:
-                commons.printMSG(GitHub.clazz, method, "Failed to access github location {}".format(e))
-                if retries < 2:
-                    time.sleep(retries * 5)
-                    retries += 1
-                    continue
-                commons.printMSG(GitHub.clazz, method, "Failed to access github location {}".format(e), "ERROR")
-                exit(1)
+            commons.printMSG(GitHub.clazz, method, '{} total commits'.format(len(GitHub.all_commits)))
+            commons.printMSG(GitHub.clazz, method, 'end')
+            return GitHub.all_commits
 
-            retries = 0
+        # commits saved by previous runs only need the newer commits added to the front
+        commit_cache_file = self._get_cache_file('commits', GitHub.url, GitHub.org, GitHub.repo, branch)
+        if not GitHub.commit_cache_loaded:
+            GitHub.commit_cache_loaded = True
+            self._load_cached_commits(commit_cache_file)
 
-            if 'next' in resp.links:
-                repo_url = resp.links['next']['url']
-            else:
+            if len(GitHub.all_commits) > 0:
+                self._pull_new_commits(commits_url, headers)
+                self._save_cached_commits(commit_cache_file, branch)
+
+        if len(GitHub.all_commits) > 0:
+            if GitHub.found_all_commits:
+                commons.printMSG(GitHub.clazz, method, 'All commits pulled, returning cached results')
+                return GitHub.all_commits
+
+            if start_from_sha in self._get_commit_index(GitHub.all_commits):
+                commons.printMSG(GitHub.clazz, method, 'The beginning sha is in our cached list')
+                commons.printMSG(GitHub.clazz, method, 'Returning cached results')
+                return GitHub.all_commits
+            commons.printMSG(GitHub.clazz, method, 'Beginning sha is not in our cached list, pulling more commits')
+
+        first_page = (len(GitHub.all_commits)//per_page)+1
+        output = GitHub.all_commits
+        index = self._get_commit_index(output)
+
+        for result in self._get_pages(first_page, lambda page: self._get_commit_page(commits_url, headers, page)):
+            if result['page'] == 1:
+                GitHub.commit_head_etag = result['etag']
+
+            if not result['has_next']:
                 GitHub.found_all_commits = True
-                finished = True
 
-            if resp.status_code != 200:
-                commons.printMSG(GitHub.clazz, method, "Failed to access github location {url}\r\n Response: {"
-                                                       "rsp}".format(url=repo_url, rsp=resp.text), "ERROR")
-                exit(1)
-            else:
-                #commons.printMSG(GitHub.clazz, method, resp.text)
-                #commons.printMSG(GitHub.clazz, method, resp.json())
-                simplified = []
-                for commit in resp.json():
-                    simplified.append({'sha': commit['sha'], 'commit': { 'message': commit['commit']['message'] } })
-                    if commit['sha'] == start_from_sha:
-                        commons.printMSG(GitHub.clazz, method, 'Found the beginning sha, stopping lookup')
-                        finished = True
-                output.extend(simplified)
+            found_beginning = False
+            for commit in result['items']:
+                # new commits pulled at the front shift the pages, so skip anything we already hold
+                if commit['sha'] not in index:
+                    index[commit['sha']] = len(output)
+                    output.append(commit)
+                if commit['sha'] == start_from_sha:
+                    commons.printMSG(GitHub.clazz, method, 'Found the beginning sha, stopping lookup')
+                    found_beginning = True
+
+            if found_beginning:
+                break
 
         commons.printMSG(GitHub.clazz, method, '{} total commits'.format(len(output)))
+        self._log_throttled_time(method)
         commons.printMSG(GitHub.clazz, method, 'end')
 
         GitHub.all_commits = output
+        GitHub.commit_index = index
 
-        
+        self._save_cached_commits(commit_cache_file, branch)
 
         return output
 
@@ -488,6 +829,137 @@ class GitHub(Code_Repo):
                 return True
         return False
     
+    def _get_cache_file(self, kind, *key_parts):
+        cache_dir = GitHub.cache_dir if GitHub.cache_dir is not None else commons.get_cache_directory(
+            BuildConfig.settings)
+
+        if not cache_dir:
+            return None
+
+        key = hashlib.sha1('/'.join(str(part) for part in key_parts).encode('utf-8')).hexdigest()
+        return os.path.join(cache_dir, 'github', "{kind}-{key}.json".format(kind=kind, key=key))
+
+    def _get_response_cache_max_bytes(self):
+        max_mb = GitHub.response_cache_max_mb
+        if max_mb is None and BuildConfig.settings is not None and \
+                BuildConfig.settings.has_option('github', 'response_cache_max_mb'):
+            max_mb = BuildConfig.settings.getfloat('github', 'response_cache_max_mb')
+
+        return int((max_mb if max_mb is not None else 50) * 1024 * 1024)
+
+    def _get_with_response_cache(self, url, headers):
+        method = '_get_with_response_cache'
+
+        # responses depend on who is asking, so the token is part of the key
+        token_key = hashlib.sha1(headers.get('Authorization', '').encode('utf-8')).hexdigest()
+        response_cache_file = self._get_cache_file('response', url, token_key)
+        cached = commons.read_json_file(response_cache_file)
+
+        request_headers = dict(headers)
+        if cached is not None:
+            if cached.get('etag'):
+                request_headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                request_headers['If-Modified-Since'] = cached['last_modified']
+
+        resp = self._send_github_request(method, 'GET', url, headers=request_headers)
+
+        if resp.status_code == 304 and cached is not None:
+            try:
+                # touching the entry keeps recently used responses at the back of the eviction queue
+                os.utime(response_cache_file)
+            except OSError as e:
+                # another run on the agent may have evicted the entry since it was read
+                commons.printMSG(GitHub.clazz, method, "Failed refreshing the cached response for {url}, requesting "
+                                                       "it again. {error}".format(url=url, error=e), 'WARN')
+                resp = self._send_github_request(method, 'GET', url, headers=headers)
+
+        if resp.status_code == 304 and cached is not None:
+            commons.printMSG(GitHub.clazz, method, "{} has not changed, using the cached response".format(url))
+            cached_resp = requests.Response()
+            cached_resp.status_code = 200
+            cached_resp.url = url
+            cached_resp.encoding = 'utf-8'
+            cached_resp.headers.update(cached['headers'])
+            cached_resp._content = cached['body'].encode('utf-8')
+            return cached_resp
+
+        if resp.status_code == 200 and response_cache_file is not None and \
+                (resp.headers.get('ETag') or resp.headers.get('Last-Modified')):
+            commons.write_json_file(response_cache_file, {
+                'url': url,
+                'etag': resp.headers.get('ETag'),
+                'last_modified': resp.headers.get('Last-Modified'),
+                'headers': {'Content-Type': resp.headers.get('Content-Type', cicommons.content_json)},
+                'body': resp.text
+            })
+            self._evict_cached_responses(os.path.dirname(response_cache_file))
+
+        return resp
+
+    def _evict_cached_responses(self, response_cache_dir):
+        method = '_evict_cached_responses'
+
+        try:
+            entries = []
+            for name in os.listdir(response_cache_dir):
+                if name.startswith('response-') and name.endswith('.json'):
+                    stat = os.stat(os.path.join(response_cache_dir, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+
+            total_size = sum(size for _, size, _ in entries)
+            max_size = self._get_response_cache_max_bytes()
+
+            # least recently used first
+            for _, size, name in sorted(entries):
+                if total_size <= max_size:
+                    break
+                os.remove(os.path.join(response_cache_dir, name))
+                total_size -= size
+        except OSError as e:
+            commons.printMSG(GitHub.clazz, method, "Failed trimming the response cache. {}".format(e), 'WARN')
+
+    def _load_cached_tag_pages(self, tag_cache_file):
+        method = '_load_cached_tag_pages'
+
+        cached = commons.read_json_file(tag_cache_file)
+
+        if cached is None or 'pages' not in cached:
+            return []
+
+        commons.printMSG(GitHub.clazz, method, "Loaded {} cached tag pages from {}".format(len(cached['pages']),
+                                                                                          tag_cache_file))
+        return cached['pages']
+
+    def _get_tag_page(self, per_page, headers, cached_pages, page):
+        method = '_get_tag_page'
+
+        repo_url = GitHub.url + '/' + GitHub.org + '/' + GitHub.repo + '/tags?per_page=' + str(per_page) + '&page=' + str(page)
+
+        cached_page = cached_pages[page-1] if page <= len(cached_pages) else None
+        page_headers = dict(headers)
+        if cached_page is not None and cached_page.get('etag'):
+            page_headers['If-None-Match'] = cached_page['etag']
+
+        resp = self._get_github_page(repo_url, page_headers)
+
+        if resp.status_code == 304:
+            commons.printMSG(GitHub.clazz, method, 'Page {} has not changed, using cached tags'.format(page))
+            return {'page': page,
+                    'items': [(name, sha) for name, sha in cached_page['tags']],
+                    'has_next': cached_page['has_next'],
+                    # a 304 carries no link header, so the page count comes from when the page was saved
+                    'last_page': cached_page.get('last_page'),
+                    'etag': cached_page['etag'],
+                    'from_cache': True}
+
+        return {'page': page,
+                'items': list(map(lambda obj: (obj['name'], obj['commit']['sha']), resp.json())),
+                'has_next': 'next' in resp.links,
+                'last_page': self._get_last_page(resp),
+                'etag': resp.headers.get('ETag'),
+                'from_cache': False}
+
     # if need_snapshot, need_release, and need_tag are all left as defaults,
     # this method will only pull one page of results.
     def get_all_tags_and_shas_from_github(self, need_snapshot=0, need_release=0, need_tag=None, need_base=False):
@@ -498,12 +970,31 @@ class GitHub(Code_Repo):
                 commons.printMSG(GitHub.clazz, method, 'Already pulled necessary tags, returning cached results')
                 return GitHub.all_tags_and_shas
             commons.printMSG(GitHub.clazz, method, 'Necessary tags are not in our cached list, pulling more tags')
-       
+
+        local_git = self._get_local_git()
+        if local_git is not None:
+            GitHub.all_tags_and_shas = local_git.get_tags_and_shas()
+            return GitHub.all_tags_and_shas
+
+        if self._use_graphql():
+            while not GitHub.graphql_found_all_tags:
+                # release notes usually only need the newest commits, so ride along for the first page of history
+                self._get_graphql_page(True, GitHub.graphql_commits_cursor is None and not GitHub.found_all_commits)
+                if self._verify_tags_found(GitHub.all_tags_and_shas, need_snapshot, need_release, need_tag,
+                                           need_base):
+                    break
+
+            commons.printMSG(GitHub.clazz, method, '{} total tags'.format(len(GitHub.all_tags_and_shas)))
+            return GitHub.all_tags_and_shas
+
+        # pages saved by previous runs are revalidated with their etag so unchanged pages come back as a 304
+        tag_cache_file = self._get_cache_file('tags', GitHub.url, GitHub.org, GitHub.repo)
+        if GitHub.cached_tag_pages is None:
+            GitHub.cached_tag_pages = self._load_cached_tag_pages(tag_cache_file)
+
         per_page = 100
-        start_page = (len(GitHub.all_tags_and_shas)//per_page)+1
-        finished = False
+        first_page = (len(GitHub.all_tags_and_shas)//per_page)+1
         output = GitHub.all_tags_and_shas
-        repo_url = GitHub.url + '/' + GitHub.org + '/' + GitHub.repo + '/tags?per_page=' + str(per_page) + '&page=' + str(start_page)
         token = GitHub.token
 
         if token is not None:
@@ -512,127 +1003,80 @@ class GitHub(Code_Repo):
         else:
             headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json}
 
-        retries = 0
-
-        while not finished:
-            commons.printMSG(GitHub.clazz, method, repo_url)
-
-            try:
-                resp = requests.get(repo_url, headers=headers, verify=False, timeout=self.http_timeout)
-            except Exception as e:
-                commons.printMSG(GitHub.clazz, method, "Failed to access github location {}".format(e))
-                if retries < 2:
-                    time.sleep(retries * 5)
-                    retries += 1
-                    continue
-                commons.printMSG(GitHub.clazz, method, "Failed to access github location {}".format(e), "ERROR")
-                exit(1)
-
-            retries = 0
+        # pages are fetched on worker threads while this loop rewrites the cached list, so they read a copy of it
+        cached_pages = list(GitHub.cached_tag_pages)
+        for result in self._get_pages(first_page,
+                                      lambda page: self._get_tag_page(per_page, headers, cached_pages, page)):
+            page = result['page']
+
+            if not result['from_cache']:
+                fetched_page = {'etag': result['etag'], 'has_next': result['has_next'],
+                                'last_page': result['last_page'], 'tags': result['items']}
+                if page <= len(GitHub.cached_tag_pages):
+                    GitHub.cached_tag_pages[page-1] = fetched_page
+                else:
+                    GitHub.cached_tag_pages.append(fetched_page)
 
-            if 'next' in resp.links:
-                repo_url = resp.links['next']['url']
-            else:
-                finished = True
+            output.extend(result['items'])
 
-            if resp.status_code != 200:
-                commons.printMSG(GitHub.clazz, method, "Failed to access github location {url}\r\n Response: {"
-                                                       "rsp}".format(url=repo_url, rsp=resp.text), "ERROR")
-                exit(1)
-            else:
-                #commons.printMSG(GitHub.clazz, method, resp.text)
-                #commons.printMSG(GitHub.clazz, method, resp.json())
-                simplified = list(map(lambda obj: (obj['name'], obj['commit']['sha']), resp.json()))
-                output.extend(simplified)
-                if self._verify_tags_found(output, need_snapshot, need_release, need_tag, need_base):
-                    commons.printMSG(GitHub.clazz, method, 'Found necessary tags, stopping lookup')
-                    finished = True
+            if not result['has_next']:
+                # anything cached past the last page belongs to tags that no longer exist
+                del GitHub.cached_tag_pages[page:]
+            elif self._verify_tags_found(output, need_snapshot, need_release, need_tag, need_base):
+                commons.printMSG(GitHub.clazz, method, 'Found necessary tags, stopping lookup')
+                break
 
         #commons.printMSG(GitHub.clazz, method, output)
 
+        if tag_cache_file is not None:
+            commons.write_json_file(tag_cache_file, {'url': GitHub.url, 'org': GitHub.org, 'repo': GitHub.repo,
+                                                     'pages': GitHub.cached_tag_pages})
+
         commons.printMSG(GitHub.clazz, method, '{} total tags'.format(len(output)))
+        self._log_throttled_time(method)
         commons.printMSG(GitHub.clazz, method, 'end')
         GitHub.all_tags_and_shas = output
 
         return output
 
-    def get_all_semver_tags(self, need_snapshot=0, need_release=0, need_tag=None, need_base=False):
-        method = "get_all_semver_tags"
-        all_tags_output = self.get_all_tags_and_shas_from_github(need_snapshot=need_snapshot, need_release=need_release, need_tag=need_tag, need_base=need_base)
+    def _get_semver_index(self, need_snapshot=0, need_release=0, need_tag=None, need_base=False):
+        all_tags = self.get_all_tags_and_shas_from_github(need_snapshot=need_snapshot, need_release=need_release,
+                                                          need_tag=need_tag, need_base=need_base)
 
-        all_tags = all_tags_output#.splitlines()
-        tag_data = []
+        return self._update_semver_index(all_tags)
 
-        for tag, _ in all_tags:
-            try:
-                tag_data.append(self.convert_semver_string_to_semver_tag_array(tag))
-            except Exception as e:
-                commons.printMSG(GitHub.clazz, method, "This tag didn't parse right skipping: {} ".format(tag))
+    def _update_semver_index(self, all_tags):
+        # only re-parses tags when the tag list changed since the last lookup
+        if GitHub.semver_index is None:
+            GitHub.semver_index = SemverIndex()
+        return GitHub.semver_index.update(all_tags)
 
-        tag_data.sort(reverse=True)
+    def get_all_semver_tags(self, need_snapshot=0, need_release=0, need_tag=None, need_base=False):
+        tag_data = self._get_semver_index(need_snapshot=need_snapshot, need_release=need_release, need_tag=need_tag,
+                                          need_base=need_base).sorted_descending()
         GitHub.all_tags_sorted = tag_data
         return tag_data
 
     def get_highest_semver_tag(self):
-        all_semver_tags = self.get_all_semver_tags()
-        # index 0 is the highest order number
-        if len(all_semver_tags) > 0:
-            return all_semver_tags[0]
-        else:
-            return None
+        return self._get_semver_index().highest()
 
     def get_highest_semver_release_tag(self):
-        all_semver_tags = self.get_all_semver_tags(need_release=1)
-        # index 0 is the highest order semver number
-        # since array is in order from highest version
-        # to lowest version, then start at 0
-        # and find the last release build
-        for tag in all_semver_tags:
-            if self._is_semver_tag_array_release_or_snapshot(tag) == 'release':
-                return tag
-
-        return None
+        return self._get_semver_index(need_release=1).highest_release()
 
     def get_highest_semver_snapshot_tag(self):
-        all_semver_tags = self.get_all_semver_tags(need_snapshot=1)
-        # index 0 is the highest order semver number
-        # since array is in order from highest version
-        # to lowest version, then start at 0
-        # and find the last snapshot build
-        for tag in all_semver_tags:
-            if self._is_semver_tag_array_release_or_snapshot(tag) == 'snapshot':
-                return tag
-
-        return None
+        return self._get_semver_index(need_snapshot=1).highest_snapshot()
 
     def get_highest_semver_array_snapshot_tag_from_base(self, base_release_version):
-        all_semver_tags = self.get_all_semver_tags(need_tag=self.convert_semver_tag_array_to_semver_string(base_release_version), need_base=True)
-        # index 0 is the highest order semver number
-        # since array is in order from highest version
-        # to lowest version, then start at 0
-
         # There are three options to this effort:
         # Found a snapshot that matches the base, then return the highest
         # Found only a release that matches the base, no snapshots, return release
-        # no base found, return base.
-
-        found_tag = None
-        for tag in all_semver_tags:
-            if tag[0] == base_release_version[0] and tag[1] == base_release_version[1] and tag[2] == base_release_version[2]:
-                # this could be a snapshot, or release, really don't care.
-                # both are fine.
-                found_tag = tag
-                break
-
-        return found_tag
+        # no base found, return None.
+        return self._get_semver_index(need_tag=self.convert_semver_tag_array_to_semver_string(base_release_version),
+                                      need_base=True).highest_from_base(base_release_version)
 
     def _does_semver_tag_exist(self, tag_array):
-        all_semver_tags = self.get_all_semver_tags(need_tag=self.convert_semver_tag_array_to_semver_string(tag_array))
-        # index 0 is the highest order number
-        if tag_array in all_semver_tags:
-            return True
-        else:
-            return False
+        return self._get_semver_index(need_tag=self.convert_semver_tag_array_to_semver_string(tag_array)).exists(
+            tag_array)
 
     def convert_semver_tag_array_to_semver_string(self, tag_array):
         if tag_array is None:
@@ -737,10 +1181,40 @@ class GitHub(Code_Repo):
 
         commons.printMSG(GitHub.clazz, method, ending_sha + ' , ' + beginning_sha)
 
+        local_git = self._get_local_git()
+        branch_ref = local_git.resolve_branch(self.config.build_env_info['associatedBranchName']) if \
+            local_git is not None else None
+
+        if branch_ref is not None and semver_array_beginning_version is not None:
+            # the local object database can answer the range directly, i.e. git log beginning..ending
+            ending_ref = ending_sha if semver_array_ending_version is not None else branch_ref
+            found_beginning = local_git.is_ancestor(beginning_sha, ending_ref)
+            trimmed_commits = local_git.get_commits(beginning_sha + '..' + ending_ref) if found_beginning else []
+        else:
+            trimmed_commits, found_beginning = self._get_commits_between_shas(semver_array_beginning_version,
+                                                                              semver_array_ending_version,
+                                                                              beginning_sha, ending_sha)
+
+        trimmed_commits = list(map(lambda commit: "{} {}".format(commit['sha'][0:7], commit['commit']['message']), trimmed_commits))
+
+        commons.printMSG(GitHub.clazz, method, "Number of commits found: {}".format(len(trimmed_commits)))
+        if not found_beginning:
+            branch = self.config.build_env_info['associatedBranchName']
+            commons.printMSG(GitHub.clazz, method, "The commit sha {} could not be found in the commit history of branch '{}', so no tracker stories will be pulled.".format(beginning_sha, branch), 'WARN')
+            commons.printMSG(GitHub.clazz, method, "This likely means tag {} was created on a branch other than {}.".format(semver_array_beginning_version, branch))
+            trimmed_commits = []
+        commons.printMSG(GitHub.clazz, method, 'end')
+        return trimmed_commits
+
+    def _get_commits_between_shas(self, semver_array_beginning_version, semver_array_ending_version, beginning_sha,
+                                  ending_sha):
+        method = 'get_all_git_commit_history_between_provided_tags'
+
         # get all commits here
         commits = self.get_all_commits_from_github(beginning_sha)
-        trimmed_commits = []
-        found_beginning = False
+        commit_index = self._get_commit_index(commits)
+        beginning_position = commit_index.get(beginning_sha)
+        found_beginning = beginning_position is not None
 
         if semver_array_beginning_version is None and semver_array_ending_version is None:  # Everything!
             commons.printMSG(GitHub.clazz, method, "No tag present. Pulling all git commit statements instead.")
@@ -748,34 +1222,17 @@ class GitHub(Code_Repo):
             found_beginning = True
         elif semver_array_ending_version is None:  # Everything since tag
             commons.printMSG(GitHub.clazz, method, "The first tag: {}".format(semver_array_beginning_version))
-            for commit in commits:
-                if commit['sha'] == beginning_sha:
-                    found_beginning = True
-                    break
-                trimmed_commits.append(commit)
+            trimmed_commits = commits[:beginning_position] if found_beginning else commits[:]
         else:  # Between two tags.  Mostly used when re-deploying old versions to send release notes
             commons.printMSG(GitHub.clazz, method, "The first tag: ".format(semver_array_beginning_version))
             commons.printMSG(GitHub.clazz, method, "The last tag: ".format(semver_array_ending_version))
-            found_end = False
-            for commit in commits:
-                if commit['sha'] == ending_sha:
-                    found_end = True
-                if commit['sha'] == beginning_sha:
-                    found_beginning = True
-                    break
-                if found_end == True:
-                    trimmed_commits.append(commit)
+            ending_position = commit_index.get(ending_sha)
+            if ending_position is not None and found_beginning and ending_position < beginning_position:
+                trimmed_commits = commits[ending_position:beginning_position]
+            else:
+                trimmed_commits = []
 
-        trimmed_commits = list(map(lambda commit: "{} {}".format(commit['sha'][0:7], commit['commit']['message']), trimmed_commits))
-
-        commons.printMSG(GitHub.clazz, method, "Number of commits found: {}".format(len(trimmed_commits)))
-        if not found_beginning:
-            branch = self.config.build_env_info['associatedBranchName']
-            commons.printMSG(GitHub.clazz, method, "The commit sha {} could not be found in the commit history of branch '{}', so no tracker stories will be pulled.".format(beginning_sha, branch), 'WARN')
-            commons.printMSG(GitHub.clazz, method, "This likely means tag {} was created on a branch other than {}.".format(semver_array_beginning_version, branch))
-            trimmed_commits = []
-        commons.printMSG(GitHub.clazz, method, 'end')
-        return trimmed_commits
+        return trimmed_commits, found_beginning
 
     def _is_semver_tag_array_release_or_snapshot(self, semver_array):
         # check the 0.0.0.x position.
@@ -799,10 +1256,8 @@ class GitHub(Code_Repo):
 
         commons.printMSG(GitHub.clazz, method, ("Attempting to download from github: {}".format(artifact_to_download)))
 
-        if not os.path.exists(os.path.join(self.config.push_location, 'unzipped')):
-            os.makedirs(os.path.join(self.config.push_location, 'unzipped'))
-
-        download_path = self.config.push_location + "/" + artifact
+        if not os.path.exists(self.config.push_location):
+            os.makedirs(self.config.push_location)
 
         if GitHub.token is not None:
             headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json, 'Authorization': ('token ' + GitHub.token)}
@@ -810,18 +1265,15 @@ class GitHub(Code_Repo):
             headers = {'Content-type': cicommons.content_json, 'Accept': cicommons.content_json}
 
         try:
-            download_resp = requests.get(artifact_to_download, headers=headers, verify=False)
+            download_resp = self._send_github_request(method, 'GET', artifact_to_download, headers=headers,
+                                                      stream=True)
+            download_resp.raise_for_status()
+            download_resp.raw.decode_content = True
 
-            with open(download_path, 'wb') as f:
-                for chunk in download_resp.iter_content(chunk_size=1024):
-                    if chunk:  # filter out keep-alive new chunks
-                        f.write(chunk)
-
-            tar = tarfile.open(self.config.push_location + '/' + artifact)
-            tar.extractall(os.path.join(self.config.push_location, 'unzipped'))
-            tar.close()
-
-            self._copy_unzipped_file_to_deployment_directory()
+            # decompress while downloading and write each entry straight to the deployment directory
+            stream = io.BufferedReader(download_resp.raw, buffer_size=GitHub.download_buffer_size)
+            with tarfile.open(fileobj=stream, mode='r|gz', bufsize=GitHub.download_buffer_size) as tar:
+                self._extract_tarball_stream(tar, self.config.push_location)
 
         except Exception as ex:
             commons.printMSG(GitHub.clazz, method, "Failed to download {art}.  Error: {e}".format(art=artifact, e=ex),
@@ -830,6 +1282,33 @@ class GitHub(Code_Repo):
 
         commons.printMSG(GitHub.clazz, method, "end")
 
+    def _extract_tarball_stream(self, tar, destination):
+        method = "_extract_tarball_stream"
+
+        destination = os.path.realpath(destination)
+        extract_args = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+        file_count = 0
+
+        for member in tar:
+            # github tar puts it in a parent directory.  Pull everything out of the parent directory
+            parts = member.name.replace('\\', '/').split('/', 1)
+            if len(parts) < 2 or not parts[1].strip('/'):
+                continue
+            member.name = parts[1]
+
+            # hard links name another entry in the archive, so they carry the parent directory too
+            if member.islnk():
+                member.linkname = member.linkname.split('/', 1)[-1]
+            unsafe = commons.get_unsafe_tar_member(member, destination)
+            if unsafe is not None:
+                raise Exception("Refusing to extract {}".format(unsafe))
+
+            tar.extract(member, destination, **extract_args)
+            if member.isfile():
+                file_count += 1
+
+        commons.printMSG(GitHub.clazz, method, "Extracted {} files to {}".format(file_count, destination))
+
     def _get_artifact_url(self):
         method = "_get_artifact_url"
 
@@ -845,7 +1324,7 @@ class GitHub(Code_Repo):
 
         commons.printMSG(GitHub.clazz, method, ("Retrieving Github information from " + tag_information_url))
 
-        resp = requests.get(tag_information_url, headers=headers, verify=False)
+        resp = self._get_with_response_cache(tag_information_url, headers)
 
         if resp.status_code != 200:
             commons.printMSG(GitHub.clazz, method, ("Failed to access github tag information at " + tag_information_url + "\r\n Response: " + resp.text), "ERROR")
@@ -864,34 +1343,3 @@ class GitHub(Code_Repo):
         #     self.repo + '/archive/' + \
         #     self.config.version_number + \
         #     'tar.gz'
-
-    def _copy_unzipped_file_to_deployment_directory(self):
-        method = "_copy_unzipped_file_to_deployment_directory"
-        commons.printMSG(GitHub.clazz, method, "begin")
-
-        try:
-            # github tar puts it in a parent directory.  Pull everything out of the parent directory
-            if len([name for name in os.listdir(os.path.join(self.config.push_location, 'unzipped')) if os.path.isdir(os.path.join(self.config.push_location, 'unzipped', name))]) == 1:
-                commons.printMSG(GitHub.clazz, method, "Github contents unzipped.  Copying out of parent directory. ")
-                for dir in os.listdir(os.path.join(self.config.push_location, 'unzipped')):
-                    if os.path.isdir(os.path.join(self.config.push_location, 'unzipped', dir)):
-                        self._copy_tree(os.path.join(self.config.push_location, 'unzipped', dir),
-                                        self.config.push_location+'/',
-                                        False, None)
-
-        except Exception as ex:
-            print(ex)
-            commons.printMSG(GitHub.clazz, method,
-                             ("failed to move files from", os.path.join(self.config.push_location, 'unzipped'), "to", self.config.push_location), "ERROR")
-            exit(1)
-
-        commons.printMSG(GitHub.clazz, method, "end")
-
-    def _copy_tree(self, src, dst, symlinks=False, ignore=None):
-        for item in os.listdir(src):
-            s = os.path.join(src, item)
-            d = os.path.join(dst, item)
-            if os.path.isdir(s):
-                shutil.copytree(s, d, symlinks, ignore)
-            else:
-                shutil.copy2(s, d)
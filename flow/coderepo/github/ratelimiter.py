@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# ratelimiter.py
+
+import random
+import threading
+import time
+
+import flow.utils.commons as commons
+
+
+class RateLimiter:
+    clazz = 'RateLimiter'
+
+    # once fewer calls than this are left, spread the rest evenly until the limit resets
+    low_water_mark = 100
+    # github asks for at least a minute between retries when a secondary limit has no Retry-After
+    secondary_limit_wait = 60
+    backoff_base = 1
+    backoff_cap = 120
+
+    def __init__(self, sleep=time.sleep, clock=time.time):
+        self.sleep = sleep
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.remaining = None
+        self.reset = None
+        self.blocked_until = 0
+        self.next_slot = 0
+        self.throttled_seconds = 0.0
+
+    def wait(self):
+        method = 'wait'
+
+        # reserve a slot under the lock so parallel page fetches queue up behind each other
+        with self.lock:
+            now = self.clock()
+            start = max(now, self.blocked_until, self.next_slot)
+            if self.remaining == 0 and self.reset is not None:
+                start = max(start, self.reset)
+
+            if self.remaining is not None and self.remaining < RateLimiter.low_water_mark and \
+                    self.reset is not None and self.reset > start:
+                self.next_slot = start + (self.reset - start) / max(self.remaining, 1)
+                self.remaining = max(self.remaining - 1, 0)
+            else:
+                self.next_slot = start
+
+            delay = start - now
+            if delay > 0:
+                self.throttled_seconds += delay
+
+        if delay > 0:
+            commons.printMSG(RateLimiter.clazz, method, "Holding off {:.1f}s for the GitHub rate limit".format(delay))
+            self.sleep(delay)
+
+    def update(self, resp):
+        method = 'update'
+
+        # returns True when github turned the request away because of a rate limit
+        with self.lock:
+            now = self.clock()
+
+            if resp.headers.get('X-RateLimit-Remaining') is not None:
+                self.remaining = int(resp.headers['X-RateLimit-Remaining'])
+            if resp.headers.get('X-RateLimit-Reset') is not None:
+                self.reset = float(resp.headers['X-RateLimit-Reset'])
+
+            if resp.status_code not in (403, 429):
+                return False
+
+            if resp.headers.get('Retry-After', '').isdigit():
+                wait = float(resp.headers['Retry-After'])
+            elif self.remaining == 0 and self.reset is not None:
+                wait = self.reset - now
+            elif resp.status_code == 429 or 'rate limit' in resp.text.lower():
+                wait = RateLimiter.secondary_limit_wait
+            else:
+                # a plain 403 is a permissions problem, not something waiting will fix
+                return False
+
+            self.blocked_until = max(self.blocked_until, now + max(wait, 0))
+
+        commons.printMSG(RateLimiter.clazz, method, "GitHub rate limit hit, retrying in {:.1f}s".format(wait), 'WARN')
+        return True
+
+    def backoff(self, attempt):
+        method = 'backoff'
+
+        # exponential with full jitter so builds that failed together do not retry together
+        delay = random.uniform(0, min(RateLimiter.backoff_cap, RateLimiter.backoff_base * (2 ** attempt)))
+
+        with self.lock:
+            self.throttled_seconds += delay
+
+        commons.printMSG(RateLimiter.clazz, method, "Retrying in {:.1f}s".format(delay))
+        self.sleep(delay)
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# semverindex.py
+
+import re
+from bisect import bisect_left, bisect_right, insort
+
+import flow.utils.commons as commons
+
+
+class SemverIndex:
+    clazz = 'SemverIndex'
+    semver_regex = re.compile(r'^v(\d+)\.(\d+).(\d+)(\+(\d+))?$')
+
+    def __init__(self):
+        self._reset(None)
+
+    def _reset(self, tags):
+        # versions are kept as (major, minor, bug, build) tuples in ascending order so lookups can bisect
+        self.tags = tags
+        self.size = 0
+        self.versions = []
+        self.releases = []
+        self.snapshots = []
+        self.names = {}
+
+    def update(self, tags):
+        # tag lists only ever grow while paging, so a bigger version of the same list just adds the new tags
+        if tags is not self.tags or len(tags) < self.size:
+            self._reset(tags)
+
+        if len(tags) == self.size:
+            return self
+
+        for name, _ in tags[self.size:]:
+            self._add(name)
+
+        self.size = len(tags)
+        return self
+
+    def _add(self, name):
+        method = '_add'
+
+        match = SemverIndex.semver_regex.fullmatch(name.strip())
+        if not match:
+            commons.printMSG(SemverIndex.clazz, method, "This tag didn't parse right skipping: {} ".format(name))
+            return
+
+        version = (int(match.group(1)), int(match.group(2)), int(match.group(3)),
+                   int(match.group(5)) if match.group(5) is not None else 0)
+
+        insort(self.versions, version)
+        insort(self.releases if version[3] == 0 else self.snapshots, version)
+        self.names.setdefault(version, name.strip())
+
+    def sorted_descending(self):
+        # fresh lists every time since callers are free to change what they get back
+        return [list(version) for version in reversed(self.versions)]
+
+    def highest(self):
+        return list(self.versions[-1]) if self.versions else None
+
+    def highest_release(self):
+        return list(self.releases[-1]) if self.releases else None
+
+    def highest_snapshot(self):
+        return list(self.snapshots[-1]) if self.snapshots else None
+
+    def highest_from_base(self, base_version):
+        # the highest version sharing major.minor.bug with the base, release or snapshot
+        base = tuple(base_version[:3])
+        position = bisect_right(self.versions, base + (float('inf'),))
+        if position > 0 and self.versions[position - 1][:3] == base:
+            return list(self.versions[position - 1])
+        return None
+
+    def exists(self, tag_array):
+        version = tuple(tag_array)
+        position = bisect_left(self.versions, version)
+        return position < len(self.versions) and self.versions[position] == version
+
+    def previous(self, tag_array, kind):
+        # the closest lower 'release' or 'snapshot' version, returned as the tag name it came from
+        versions = self.releases if kind == 'release' else self.snapshots
+        position = bisect_left(versions, tuple(tag_array))
+        return self.names[versions[position - 1]] if position > 0 else None
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# localgit.py
+
+import os
+import re
+import subprocess
+from subprocess import TimeoutExpired
+
+import flow.utils.commons as commons
+
+
+class LocalGitException(Exception): pass
+
+
+class LocalGit:
+    clazz = 'LocalGit'
+    git_timeout = 120
+
+    # separators that cannot show up in a sha or commit message
+    field_separator = '\x1f'
+    record_separator = '\x1e'
+
+    def __init__(self, repo_dir=None, remote_repo=None):
+        self.repo_dir = repo_dir if repo_dir is not None else os.getcwd()
+        # org/repo the origin remote has to point at, when given
+        self.remote_repo = remote_repo
+        self.tags = None
+        self._usable = None
+
+    def _git(self, *args):
+        method = '_git'
+
+        cmd = ['git'] + list(args)
+        git = subprocess.Popen(cmd, cwd=self.repo_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        try:
+            git_output, git_errs = git.communicate(timeout=self.git_timeout)
+        except TimeoutExpired:
+            git.kill()
+            git.communicate()
+            raise LocalGitException("Timed out calling {}".format(' '.join(cmd)))
+
+        if git.returncode != 0:
+            commons.printMSG(LocalGit.clazz, method, "Failed calling {command}. Return code of {rtn}. {err}".format(
+                command=' '.join(cmd), rtn=git.returncode, err=git_errs.decode('utf-8', 'replace').strip()))
+            raise LocalGitException("Failed calling {}".format(' '.join(cmd)))
+
+        return git_output.decode('utf-8', 'replace')
+
+    def is_usable(self):
+        method = 'is_usable'
+
+        if self._usable is not None:
+            return self._usable
+
+        self._usable = False
+
+        try:
+            if self._git('rev-parse', '--is-inside-work-tree').strip() != 'true':
+                commons.printMSG(LocalGit.clazz, method, "{} is not a git checkout".format(self.repo_dir))
+                return False
+
+            # older git clients echo the flag back instead of answering, so look for the shallow file too
+            git_dir = self._git('rev-parse', '--absolute-git-dir').strip()
+            is_shallow = self._git('rev-parse', '--is-shallow-repository').strip() == 'true' or \
+                os.path.isfile(os.path.join(git_dir, 'shallow'))
+        except (LocalGitException, OSError) as e:
+            commons.printMSG(LocalGit.clazz, method, "Local git is not available. {}".format(e), 'WARN')
+            return False
+
+        if is_shallow:
+            commons.printMSG(LocalGit.clazz, method, "{} is a shallow clone and cannot answer history "
+                                                     "lookups".format(self.repo_dir), 'WARN')
+            return False
+
+        if self.remote_repo is not None and not self._is_checkout_of(self.remote_repo):
+            return False
+
+        self._usable = True
+        return True
+
+    def _is_checkout_of(self, remote_repo):
+        method = '_is_checkout_of'
+
+        try:
+            remote_url = self._git('remote', 'get-url', 'origin').strip()
+        except LocalGitException:
+            commons.printMSG(LocalGit.clazz, method, "{} has no origin remote".format(self.repo_dir), 'WARN')
+            return False
+
+        # https://host/org/repo.git, git@host:org/repo.git and ssh://git@host/org/repo all end in org/repo
+        checkout_repo = '/'.join(re.split(r'[:/]', remote_url.rstrip('/'))[-2:])
+        if checkout_repo.endswith('.git'):
+            checkout_repo = checkout_repo[:-len('.git')]
+
+        if checkout_repo.lower() != remote_repo.lower():
+            commons.printMSG(LocalGit.clazz, method, "{dir} is a checkout of {checkout}, not {repo}".format(
+                dir=self.repo_dir, checkout=checkout_repo, repo=remote_repo), 'WARN')
+            return False
+
+        return True
+
+    def refresh_tags(self):
+        method = 'refresh_tags'
+        commons.printMSG(LocalGit.clazz, method, 'getting latest tags')
+
+        try:
+            for tag_line in self._git('fetch', '--tags', '--quiet').splitlines():
+                commons.printMSG(LocalGit.clazz, method, tag_line)
+        except LocalGitException as e:
+            commons.printMSG(LocalGit.clazz, method, "Could not fetch tags, using the tags already in the "
+                                                     "checkout. {}".format(e), 'WARN')
+
+    def get_tags_and_shas(self):
+        method = 'get_tags_and_shas'
+
+        # the tags are fetched and read once, every later lookup in the run gets the same list
+        if self.tags is not None:
+            return self.tags
+
+        self.refresh_tags()
+
+        # *objectname is the commit an annotated tag points to, objectname is the commit for lightweight tags
+        output = self._git('for-each-ref', '--sort=-v:refname',
+                           '--format=%(refname:short) %(objectname) %(*objectname)', 'refs/tags')
+
+        tags = []
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) >= 2:
+                tags.append((parts[0], parts[-1]))
+
+        commons.printMSG(LocalGit.clazz, method, '{} total tags'.format(len(tags)))
+        self.tags = tags
+        return tags
+
+    def resolve_branch(self, branch):
+        for ref in ('origin/' + branch, branch):
+            try:
+                self._git('rev-parse', '--verify', '--quiet', ref + '^{commit}')
+                return ref
+            except LocalGitException:
+                continue
+
+        return None
+
+    def is_ancestor(self, ancestor, descendant):
+        try:
+            self._git('merge-base', '--is-ancestor', ancestor, descendant)
+            return True
+        except LocalGitException:
+            return False
+
+    def get_commits(self, revision_range):
+        method = 'get_commits'
+
+        output = self._git('log', '--format=%H' + self.field_separator + '%B' + self.record_separator,
+                           revision_range)
+
+        commits = []
+        for record in output.split(self.record_separator):
+            record = record.lstrip('\n')
+            if not record:
+                continue
+            sha, message = record.split(self.field_separator, 1)
+            commits.append({'sha': sha, 'commit': {'message': message.rstrip('\n')}})
+
+        commons.printMSG(LocalGit.clazz, method, '{} commits in {}'.format(len(commits), revision_range))
+        return commits
@@ -9,6 +9,7 @@ from flow.buildconfig import BuildConfig
 from flow.communications.communications_abc import communications
 
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 from flow.utils.commons import Object
 
 
@@ -167,7 +168,7 @@ class Slack(communications):
         resp = None  # instantiated so it can be logged outside of the try below the except
 
         try:
-            resp = requests.post(Slack.slack_url, slack_message.to_JSON(), headers=headers, timeout=self.http_timeout)
+            resp = httpclient.post(Slack.slack_url, slack_message.to_JSON(), headers=headers, timeout=self.http_timeout)
         except requests.ConnectionError:
             commons.printMSG(Slack.clazz, method, "Request to Slack timed out.", "ERROR")
             exit(1)
@@ -303,8 +304,8 @@ class Slack(communications):
             commons.printMSG(Slack.clazz, method, Slack.slack_url)
 
             try:
-                resp = requests.post(Slack.slack_url, slack_message.to_JSON(), headers=headers,
-                                     timeout=Slack.http_timeout)
+                resp = httpclient.post(Slack.slack_url, slack_message.to_JSON(), headers=headers,
+                                       timeout=Slack.http_timeout)
             except requests.ConnectionError:
                 commons.printMSG(Slack.clazz, method, "Request to Slack timed out.", "ERROR")
             except Exception as e:
@@ -403,8 +404,8 @@ class Slack(communications):
         commons.printMSG(Slack.clazz, method, Slack.slack_url)
 
         try:
-            resp = requests.post(Slack.slack_url, slack_message.to_JSON(), headers=headers,
-                                 timeout=Slack.http_timeout)
+            resp = httpclient.post(Slack.slack_url, slack_message.to_JSON(), headers=headers,
+                                   timeout=Slack.http_timeout)
             if resp.status_code == 200:
                 commons.printMSG(Slack.clazz, method, "Successfully sent to slack. \r\n resp: {}".format(resp.text),
                                  "DEBUG")
@@ -6,6 +6,7 @@ from flow.buildconfig import BuildConfig
 from flow.projecttracking.project_tracking_abc import Project_Tracking
 
 import flow.utils.commons as commons
+import flow.utils.httpclient as httpclient
 from flow.utils.commons import Object
 
 
@@ -81,7 +82,7 @@ class Tracker(Project_Tracking):
         commons.printMSG(Tracker.clazz, method, tracker_story_details_url)
 
         try:
-            resp = requests.get(tracker_story_details_url, headers=headers, timeout=self.http_timeout)
+            resp = httpclient.get(tracker_story_details_url, headers=headers, timeout=self.http_timeout)
         except requests.ConnectionError:
             commons.printMSG(Tracker.clazz, method, 'Request to Tracker timed out.', 'ERROR')
             exit(1)
@@ -133,7 +134,7 @@ class Tracker(Project_Tracking):
         commons.printMSG(Tracker.clazz, method, label_to_post.to_JSON())
 
         try:
-            resp = requests.post(tracker_url, label_to_post.to_JSON(), headers=headers, timeout=self.http_timeout)
+            resp = httpclient.post(tracker_url, label_to_post.to_JSON(), headers=headers, timeout=self.http_timeout)
         except requests.ConnectionError:
             commons.printMSG(Tracker.clazz, method, 'Request to Tracker timed out.', 'WARN')
         except Exception as e:
@@ -6,6 +6,7 @@ import os
 import re
 import subprocess
 import sys
+import tempfile
 from enum import Enum
 
 from pydispatch import dispatcher
@@ -101,6 +102,70 @@ def write_to_file(path, text, open_func=open, mode="a"):
         f.write(text)
 
 
+def get_cache_directory(settings):
+    # FLOW_CACHE_DIR wins over settings.ini so build agents can point every job at a shared location.
+    if os.getenv('FLOW_CACHE_DIR'):
+        return os.path.expanduser(os.getenv('FLOW_CACHE_DIR'))
+
+    if settings is not None and settings.has_section('project') and settings.has_option('project', 'cache_dir'):
+        cache_dir = settings.get('project', 'cache_dir').strip()
+        if cache_dir:
+            return os.path.expanduser(cache_dir)
+
+    return None
+
+
+def read_json_file(path):
+    method = 'read_json_file'
+
+    if path is None or not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        printMSG(clazz, method, "Ignoring unreadable file {file}. {error}".format(file=path, error=e), 'WARN')
+        return None
+
+
+def write_json_file(path, data):
+    method = 'write_json_file'
+
+    # write to a temp file and rename so concurrent jobs on the same agent never see a half written file
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    except Exception as e:
+        printMSG(clazz, method, "Failed writing file {file}. {error}".format(file=path, error=e), 'WARN')
+
+
+def _is_within_directory(root, path):
+    return path == root or path.startswith(root + os.sep)
+
+
+def get_unsafe_tar_member(member, destination):
+    # returns why a tar member would be written, or would link, outside of destination.  None when it is safe.
+    # symlinks resolve from the directory they sit in, hard links from the root of the archive, and both have to
+    # stay inside destination.
+    root = os.path.realpath(destination)
+    path = os.path.join(root, member.name)
+
+    if os.path.isabs(member.name) or not _is_within_directory(root, os.path.realpath(path)):
+        return "{} is outside of {}".format(member.name, destination)
+
+    if member.issym() or member.islnk():
+        link_base = os.path.dirname(path) if member.issym() else root
+        if os.path.isabs(member.linkname) or \
+                not _is_within_directory(root, os.path.realpath(os.path.join(link_base, member.linkname))):
+            return "link {} points outside of {}".format(member.name, destination)
+
+    return None
+
+
 def get_files_of_type_from_directory(type, directory):
     out = os.listdir(directory)
     out = [os.path.join(directory, element) for element in out]
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# httpclient.py
+
+import atexit
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import flow.utils.commons as commons
+from flow.buildconfig import BuildConfig
+
+clazz = 'httpclient'
+
+# defaults used when settings.ini does not say otherwise
+default_timeout = 60
+default_pool_size = 10
+default_retries = 2
+default_backoff_factor = 0.5
+retry_status_codes = (502, 503, 504)
+retry_methods = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+_sessions = {}
+_stats = {}
+_lock = threading.Lock()
+_log_stats_registered = False
+
+
+def _get_setting(section, option, default, getter='get'):
+    settings = BuildConfig.settings
+    if settings is not None and settings.has_section(section) and settings.has_option(section, option):
+        return getattr(settings, getter)(section, option)
+    return default
+
+
+def get_default_timeout():
+    return _get_setting('project', 'http_timeout_default_seconds', default_timeout, 'getfloat')
+
+
+def _get_host(url):
+    parsed = urlparse(url)
+    return parsed.scheme + '://' + parsed.netloc
+
+
+def _create_session(retry=True):
+    # only reads are retried once they reached the server, so an upload, a delete or a POST is never sent twice.
+    # callers that run their own retry loop ask for a session without one so the two layers do not multiply.
+    if retry:
+        max_retries = Retry(total=_get_setting('http', 'retries', default_retries, 'getint'),
+                            backoff_factor=_get_setting('http', 'backoff_factor', default_backoff_factor, 'getfloat'),
+                            status_forcelist=retry_status_codes, allowed_methods=retry_methods,
+                            raise_on_status=False)
+    else:
+        max_retries = Retry(total=0, read=False, redirect=False, raise_on_status=False)
+    pool_size = _get_setting('http', 'pool_size', default_pool_size, 'getint')
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=max_retries)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(url, retry=True):
+    host = _get_host(url)
+
+    with _lock:
+        if (host, retry) not in _sessions:
+            _sessions[(host, retry)] = _create_session(retry)
+        if host not in _stats:
+            _stats[host] = {'requests': 0, 'errors': 0, 'seconds': 0.0}
+        return _sessions[(host, retry)]
+
+
+def request(http_method, url, retry=True, **kwargs):
+    session = get_session(url, retry)
+    host = _get_host(url)
+
+    if kwargs.get('timeout') is None:
+        kwargs['timeout'] = get_default_timeout()
+
+    start = time.time()
+    failed = True
+    try:
+        resp = session.request(http_method, url, **kwargs)
+        failed = resp.status_code >= 500
+        return resp
+    finally:
+        with _lock:
+            _stats[host]['requests'] += 1
+            _stats[host]['seconds'] += time.time() - start
+            if failed:
+                _stats[host]['errors'] += 1
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    return request('HEAD', url, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    return request('POST', url, data=data, **kwargs)
+
+
+def put(url, data=None, **kwargs):
+    return request('PUT', url, data=data, **kwargs)
+
+
+def patch(url, data=None, **kwargs):
+    return request('PATCH', url, data=data, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('DELETE', url, **kwargs)
+
+
+def get_stats():
+    with _lock:
+        return {host: dict(host_stats) for host, host_stats in _stats.items()}
+
+
+def log_stats():
+    method = 'log_stats'
+
+    for host, host_stats in sorted(get_stats().items()):
+        commons.printMSG(clazz, method, "{host} requests: {requests} errors: {errors} time: {seconds:.2f}s".format(
+            host=host, **host_stats))
+
+
+def log_stats_at_exit():
+    global _log_stats_registered
+
+    # many tasks end with exit(), so report connection reuse on the way out
+    if not _log_stats_registered:
+        _log_stats_registered = True
+        atexit.register(log_stats)
+
+
+def close():
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _stats.clear()
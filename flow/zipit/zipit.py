@@ -1,15 +1,19 @@
 #!/usr/bin/python
 # zipit.py
 
+import os
 import tarfile
+import threading
 
 import flow.utils.commons as commons
 
-from flow.artifactstorage.artifactory.artifactory import ArtiFactory
+from flow.artifactstorage.artifactory.artifactory import ArtiFactory, ArtifactException
+from flow.buildconfig import BuildConfig
 
 
 class ZipIt:
     clazz = 'ZipIt'
+    stream_block_size = 1024 * 1024
 
     def __init__(self, mode, name, contents):
         method = '__init__'
@@ -19,11 +23,20 @@ class ZipIt:
 
         if mode == 'artifactory':
             ZipIt.zip_contents = contents
-            self._zip_it(name, contents)
-            self._ship_it_artifactory(name)
+            if self._get_setting('stream_upload', 'false').lower() == 'true':
+                self._stream_it_artifactory(name, contents)
+            else:
+                self._zip_it(name, contents)
+                self._ship_it_artifactory(name)
 
         commons.printMSG(ZipIt.clazz, method, 'end')
 
+    def _get_setting(self, option, default):
+        if BuildConfig.settings is not None and BuildConfig.settings.has_option('zipit', option):
+            return BuildConfig.settings.get('zipit', option).strip()
+
+        return default
+
     def _zip_it(self, name, contents):
         method = '_zip_it'
         commons.printMSG(ZipIt.clazz, method, 'begin')
@@ -52,3 +65,47 @@ class ZipIt:
         ar.publish(file_with_path[-1], name)
 
         commons.printMSG(ZipIt.clazz, method, 'end')
+
+    def _stream_it_artifactory(self, name, contents):
+        method = '_stream_it_artifactory'
+        commons.printMSG(ZipIt.clazz, method, 'begin')
+
+        if not os.path.exists(contents):
+            commons.printMSG(ZipIt.clazz, method, "Could not locate files to zip. {}".format(contents), 'ERROR')
+            exit(1)
+
+        ar = ArtiFactory()
+        stream = self._tar_stream(name, contents, self._get_setting('compression', 'none').lower())
+        try:
+            ar.publish_stream(stream, name)
+        finally:
+            # closing the read end of the pipe stops the producer when the upload gave up early
+            stream.close()
+
+        commons.printMSG(ZipIt.clazz, method, 'end')
+
+    def _tar_stream(self, name, contents, compression):
+        # a producer thread writes the tar into a pipe while the upload reads the other end, so the archive never
+        # lands on disk.  with gz the compression runs on that thread, alongside the upload.
+        read_fd, write_fd = os.pipe()
+        errors = []
+
+        def produce():
+            try:
+                with os.fdopen(write_fd, 'wb') as pipe_out:
+                    with tarfile.open(fileobj=pipe_out, mode='w|gz' if compression == 'gz' else 'w|') as tar:
+                        tar.add(contents, name)
+            except Exception as e:
+                errors.append(e)
+
+        producer = threading.Thread(target=produce, name='zipit-tar-producer', daemon=True)
+        producer.start()
+
+        with os.fdopen(read_fd, 'rb') as pipe_in:
+            for block in iter(lambda: pipe_in.read(ZipIt.stream_block_size), b''):
+                yield block
+
+        producer.join()
+        if errors:
+            # not an OSError, so the http client reports it as it is instead of as a broken connection
+            raise ArtifactException("Failed building {name}. {error}".format(name=name, error=errors[0]))
@@ -1,13 +1,22 @@
+import configparser
+import hashlib
+import io
+import json
 import os
+import tarfile
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
+import requests
 import responses
 from flow.buildconfig import BuildConfig
 from requests.exceptions import HTTPError
 
-from flow.artifactstorage.artifactory.artifactory import ArtiFactory, ArtifactException
+from flow.artifactstorage.artifactory.artifactory import ArtiFactory, ArtifactDownloadException, ArtifactException
 
 mock_build_config_dict = {
     "projectInfo": {
@@ -424,3 +433,568 @@ def test_init_missing_artifactory(monkeypatch):
         mock_printmsg_fn.assert_called_with('ArtiFactory', '__init__', "The build config associated with artifactory is missing key 'artifact'", 'ERROR')
 
 
+
+
+upload_settings = '[artifactory]\nupload_workers = 2\n'
+download_settings = '[artifactory]\ndownload_workers = 2\ndownload_part_size_mb = 0.000004\n'
+extract_settings = '[artifactory]\nextract_workers = 3\n'
+
+
+def _setup_artifactory(monkeypatch, settings='', extension='zip', extensions=None, artifact=None, build_dir=None):
+    # every test starts from the unittest environment, with the settings.ini and artifact stanza it is about
+    parser = configparser.ConfigParser()
+    parser.read_string(settings)
+    monkeypatch.setattr(BuildConfig, 'settings', parser)
+    monkeypatch.setattr(ArtiFactory, 'artifactory_files', [])
+    monkeypatch.setattr(ArtiFactory, 'artifactory_extensions', [])
+    monkeypatch.setattr(ArtiFactory, 'retry_sleep', lambda seconds: None)
+    monkeypatch.delenv('ARTIFACTORY_TOKEN', raising=False)
+    monkeypatch.delenv('FLOW_CACHE_DIR', raising=False)
+    if build_dir is not None:
+        monkeypatch.setenv('ARTIFACT_BUILD_DIRECTORY', str(build_dir))
+        for build_extension in extensions or [extension]:
+            build_dir.join('testproject.' + build_extension).write(build_extension)
+
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['unittest']
+    _b.json_config = dict(mock_build_config_dict, artifact=dict(mock_build_config_dict['artifact'],
+                                                                **(artifact or {})))
+    _b.project_name = mock_build_config_dict['projectInfo']['name']
+    _b.version_number = 'v1.0.0'
+    _b.artifact_extension = extension
+    _b.artifact_extensions = extensions
+    return ArtiFactory(config_override=_b)
+
+
+@responses.activate
+def test_publish_build_artifact_uploads_every_file(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, upload_settings, None, ['jar', 'zip'], build_dir=tmpdir)
+    home_url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/'
+    responses.add(responses.PUT, home_url + 'testproject.jar', status=201)
+    responses.add(responses.PUT, home_url + 'testproject.zip', status=201)
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        art.publish_build_artifact()
+
+    assert sorted(call.request.url for call in responses.calls) == [home_url + 'testproject.jar',
+                                                                    home_url + 'testproject.zip']
+    progress = [call[0][2] for call in mock_printmsg_fn.call_args_list if str(call[0][2]).startswith('Uploaded ')]
+    assert len(progress) == 2
+
+
+@responses.activate
+def test_publish_build_artifact_reports_all_failures(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, upload_settings, None, ['jar', 'zip'], build_dir=tmpdir)
+    home_url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/'
+    responses.add(responses.PUT, home_url + 'testproject.jar', status=403, body='forbidden jar')
+    responses.add(responses.PUT, home_url + 'testproject.zip', status=403, body='forbidden zip')
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        with pytest.raises(SystemExit):
+            art.publish_build_artifact()
+
+    # both uploads were attempted and both failures show up in one error
+    assert len(responses.calls) == 2
+    errors = [call[0][2] for call in mock_printmsg_fn.call_args_list if call[0][3:] == ('ERROR',)]
+    assert len(errors) == 1
+    assert errors[0].startswith('2 of 2 uploads failed.')
+    assert 'forbidden jar' in errors[0] and 'forbidden zip' in errors[0]
+
+
+@responses.activate
+def test_publish_deploys_by_checksum(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, upload_settings, None, ['jar', 'zip'], build_dir=tmpdir)
+    file_url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.jar'
+    responses.add(responses.PUT, file_url, status=201)
+
+    with patch('flow.utils.commons.printMSG'):
+        art.publish(str(tmpdir.join('testproject.jar')), 'testproject.jar')
+
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.headers['X-Checksum-Deploy'] == 'true'
+    assert responses.calls[0].request.headers['X-Checksum-Sha1'] == hashlib.sha1(b'jar').hexdigest()
+    assert responses.calls[0].request.headers['X-Checksum-Sha256'] == hashlib.sha256(b'jar').hexdigest()
+    assert not responses.calls[0].request.body
+
+
+@responses.activate
+def test_publish_uploads_when_checksum_is_unknown(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, upload_settings, None, ['jar', 'zip'], build_dir=tmpdir)
+    file_url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.jar'
+    responses.add(responses.PUT, file_url, status=404)
+    responses.add(responses.PUT, file_url, status=201)
+
+    with patch('flow.utils.commons.printMSG'):
+        art.publish(str(tmpdir.join('testproject.jar')), 'testproject.jar')
+
+    assert len(responses.calls) == 2
+    upload = responses.calls[1].request
+    assert 'X-Checksum-Deploy' not in upload.headers
+    assert upload.headers['X-Checksum-Sha1'] == hashlib.sha1(b'jar').hexdigest()
+    # the body was a view of the mapped file and is released once the upload returns
+    assert upload.headers['Content-Length'] == '3'
+
+
+class _PutHandler(BaseHTTPRequestHandler):
+    # stands in for artifactory deploys, by checksum or with the bytes
+    def do_PUT(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server.requests.append(self.headers.get('X-Checksum-Deploy'))
+
+        if self.headers.get('X-Checksum-Deploy'):
+            found = hashlib.sha1(bytes(server.stored)).hexdigest() == self.headers['X-Checksum-Sha1']
+            status = 201 if found else 404
+        else:
+            server.stored = bytearray(body)
+            status = 201
+
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def put_server():
+    server = HTTPServer(('127.0.0.1', 0), _PutHandler)
+    server.requests = []
+    server.stored = bytearray()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('content', [b'0123456789' * 100000, b''])
+def test_publish_sends_the_mapped_file_in_one_put(monkeypatch, tmpdir, put_server, content):
+    art = _setup_artifactory(monkeypatch, upload_settings, None, ['jar', 'zip'], build_dir=tmpdir, artifact={
+        'artifactoryDomain': 'http://127.0.0.1:{}/artifactory'.format(put_server.server_port)})
+    put_server.stored = bytearray(b'something else')
+    tmpdir.join('testproject.tar').write_binary(content)
+
+    with patch('flow.utils.commons.printMSG'):
+        art.publish(str(tmpdir.join('testproject.tar')), 'testproject.tar')
+
+    # the checksum deploy goes first, then the whole file in a single request
+    assert put_server.requests == ['true', None]
+    assert bytes(put_server.stored) == content
+
+
+def _add_ranged_artifact(url, content, sha1=None, accept_ranges='bytes'):
+    headers = {'Content-Length': str(len(content)), 'X-Checksum-Sha1': sha1 or hashlib.sha1(content).hexdigest()}
+    if accept_ranges:
+        headers['Accept-Ranges'] = accept_ranges
+    responses.add(responses.HEAD, url, status=200, adding_headers=headers)
+
+    def ranged_get(request):
+        if 'Range' not in request.headers:
+            return 200, {}, content
+        start, end = map(int, request.headers['Range'].replace('bytes=', '').split('-'))
+        return 206, {}, content[start:end + 1]
+
+    responses.add_callback(responses.GET, url, callback=ranged_get)
+
+
+@responses.activate
+def test_download_artifact_in_parallel_ranges(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, download_settings)
+    url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject-v1.0.0.zip'
+    _add_ranged_artifact(url, b'0123456789')
+
+    with patch('flow.utils.commons.printMSG'):
+        art.download_artifact(url, str(tmpdir.join('testproject-v1.0.0.zip')))
+
+    assert tmpdir.join('testproject-v1.0.0.zip').read_binary() == b'0123456789'
+    assert sorted(call.request.headers['Range'] for call in responses.calls if call.request.method == 'GET') == \
+        ['bytes=0-3', 'bytes=4-7', 'bytes=8-9']
+    assert not tmpdir.join('.testproject-v1.0.0.zip.download.json').exists()
+
+
+@responses.activate
+def test_download_artifact_resumes_from_journal(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, download_settings)
+    url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject-v1.0.0.zip'
+    _add_ranged_artifact(url, b'0123456789')
+    tmpdir.join('testproject-v1.0.0.zip').write_binary(b'0123\x00\x00\x00\x0089')
+    tmpdir.join('.testproject-v1.0.0.zip.download.json').write(json.dumps({
+        'url': url, 'size': 10, 'sha1': hashlib.sha1(b'0123456789').hexdigest(), 'part_size': 4, 'done': [0, 2]}))
+
+    with patch('flow.utils.commons.printMSG'):
+        art.download_artifact(url, str(tmpdir.join('testproject-v1.0.0.zip')))
+
+    assert tmpdir.join('testproject-v1.0.0.zip').read_binary() == b'0123456789'
+    assert [call.request.headers['Range'] for call in responses.calls if call.request.method == 'GET'] == \
+        ['bytes=4-7']
+
+
+@responses.activate
+def test_download_artifact_checksum_mismatch(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, download_settings)
+    url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject-v1.0.0.zip'
+    _add_ranged_artifact(url, b'0123456789', sha1='0' * 40)
+
+    with patch('flow.utils.commons.printMSG'):
+        with pytest.raises(ArtifactDownloadException):
+            art.download_artifact(url, str(tmpdir.join('testproject-v1.0.0.zip')))
+
+    assert not tmpdir.join('testproject-v1.0.0.zip').exists()
+    assert not tmpdir.join('.testproject-v1.0.0.zip.download.json').exists()
+
+
+@responses.activate
+def test_download_artifact_without_range_support(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, download_settings)
+    url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject-v1.0.0.zip'
+    _add_ranged_artifact(url, b'0123456789', accept_ranges=None)
+
+    with patch('flow.utils.commons.printMSG'):
+        art.download_artifact(url, str(tmpdir.join('testproject-v1.0.0.zip')))
+
+    assert tmpdir.join('testproject-v1.0.0.zip').read_binary() == b'0123456789'
+    gets = [call.request for call in responses.calls if call.request.method == 'GET']
+    assert len(gets) == 1 and 'Range' not in gets[0].headers
+
+
+@responses.activate
+def test_download_artifact_reuses_cached_bytes(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, download_settings + 'download_cache_max_mb = 1\n')
+    monkeypatch.setenv('FLOW_CACHE_DIR', str(tmpdir.join('cache')))
+    url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject-v1.0.0.zip'
+    _add_ranged_artifact(url, b'0123456789')
+    tmpdir.mkdir('first')
+    tmpdir.mkdir('second')
+
+    with patch('flow.utils.commons.printMSG'):
+        art.download_artifact(url, str(tmpdir.join('first', 'testproject-v1.0.0.zip')))
+        downloads = len([call for call in responses.calls if call.request.method == 'GET'])
+        art.download_artifact(url, str(tmpdir.join('second', 'testproject-v1.0.0.zip')))
+
+    sha1 = hashlib.sha1(b'0123456789').hexdigest()
+    assert tmpdir.join('cache', 'artifactory', sha1[:2], sha1).read_binary() == b'0123456789'
+    assert tmpdir.join('second', 'testproject-v1.0.0.zip').read_binary() == b'0123456789'
+    # the second download only asked for the checksum
+    assert len([call for call in responses.calls if call.request.method == 'GET']) == downloads
+
+
+def test_evict_cached_artifacts_removes_least_recently_used(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, download_settings + 'download_cache_max_mb = {}\n'.format(15 / 1048576))
+    for age, name in enumerate(['newest', 'middle', 'oldest']):
+        entry = tmpdir.join('artifactory', name[:2], name)
+        entry.write('0123456789', ensure=True)
+        os.utime(str(entry), (1000 - age, 1000 - age))
+
+    art._evict_cached_artifacts(str(tmpdir.join('artifactory')))
+
+    assert tmpdir.join('artifactory', 'ne', 'newest').exists()
+    assert not tmpdir.join('artifactory', 'mi', 'middle').exists()
+    assert not tmpdir.join('artifactory', 'ol', 'oldest').exists()
+
+
+@responses.activate
+def test_download_artifacts_lists_storage_once(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, extension=None, extensions=['bob', 'vcl'])
+
+    responses.add(responses.GET, 'https://testdomain/artifactory/api/storage/release-repo/group/testproject/v1.0.0',
+                  body=response_body_artifactory, status=200, content_type='application/json')
+    home_url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/'
+    for extension in ['bob', 'vcl']:
+        responses.add(responses.HEAD, home_url + 'testproject.' + extension, status=200)
+        responses.add(responses.GET, home_url + 'testproject.' + extension, body=extension, status=200)
+
+    with patch('flow.utils.commons.printMSG'):
+        art.download_and_extract_artifacts_locally(str(tmpdir) + '/', extract=False)
+
+    assert tmpdir.join('testproject-v1.0.0.bob').read() == 'bob'
+    assert tmpdir.join('testproject-v1.0.0.vcl').read() == 'vcl'
+    assert len([call for call in responses.calls if '/api/storage/' in call.request.url]) == 1
+
+
+def _add_storage_listing(extension):
+    responses.add(responses.GET, 'https://testdomain/artifactory/api/storage/release-repo/group/testproject/v1.0.0',
+                  json={'children': [{'uri': '/testproject.' + extension, 'folder': False}]}, status=200)
+
+
+def _make_tar_gz(files, links=None):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+        for name, link_name in (links or {}).items():
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.SYMTYPE
+            info.linkname = link_name
+            tar.addfile(info)
+    return buffer.getvalue()
+
+
+def _add_tar_artifact(archive, sha1=None):
+    url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.tar.gz'
+    headers = {'X-Checksum-Sha1': sha1 or hashlib.sha1(archive).hexdigest()}
+    responses.add(responses.HEAD, url, status=200, headers=headers)
+    responses.add(responses.GET, url, body=archive, status=200, headers=headers)
+
+
+@responses.activate
+def test_tar_artifact_is_extracted_while_streaming(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, extract_settings, 'tar.gz',
+                             artifact={'extractPaths': ['manifest.yml', 'app']})
+    _add_storage_listing('tar.gz')
+    archive = _make_tar_gz({'manifest.yml': b'applications', 'app/main.py': b'main', 'docs/readme.md': b'docs'})
+    _add_tar_artifact(archive)
+
+    with patch('flow.utils.commons.printMSG'):
+        art.download_and_extract_artifacts_locally(str(tmpdir) + '/')
+
+    assert tmpdir.join('manifest.yml').read() == 'applications'
+    assert tmpdir.join('app', 'main.py').read() == 'main'
+    assert not tmpdir.join('docs').exists()
+    # the archive itself never touches the disk
+    assert not tmpdir.join('testproject-v1.0.0.tar.gz').exists()
+
+
+@responses.activate
+def test_tar_artifact_with_bad_checksum_fails(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, extract_settings, 'tar.gz')
+    _add_storage_listing('tar.gz')
+    archive = _make_tar_gz({'manifest.yml': b'applications'})
+    _add_tar_artifact(archive, sha1='0' * 40)
+    tmpdir.join('manifest.yml').write('previous')
+
+    with patch('flow.utils.commons.printMSG'), patch('os.system'):
+        with pytest.raises(SystemExit):
+            art.download_and_extract_artifacts_locally(str(tmpdir) + '/')
+
+    # nothing from the corrupt archive reached the deploy directory
+    assert tmpdir.join('manifest.yml').read() == 'previous'
+    assert os.listdir(str(tmpdir)) == ['manifest.yml']
+
+
+@responses.activate
+def test_tar_artifact_keeps_relative_links_inside_the_archive(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, extract_settings, 'tar.gz')
+    _add_storage_listing('tar.gz')
+    archive = _make_tar_gz({'app/lib/tool.js': b'tool'},
+                           links={'app/bin/tool': '../lib/tool.js', 'app/bin/escape': '../../../outside.txt'})
+    _add_tar_artifact(archive)
+
+    with patch('flow.utils.commons.printMSG'):
+        art.download_and_extract_artifacts_locally(str(tmpdir) + '/')
+
+    assert os.readlink(str(tmpdir.join('app', 'bin', 'tool'))) == '../lib/tool.js'
+    assert tmpdir.join('app', 'bin', 'tool').read() == 'tool'
+    assert not os.path.lexists(str(tmpdir.join('app', 'bin', 'escape')))
+
+
+@responses.activate
+def test_cached_tar_artifact_is_not_downloaded_again(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, extract_settings + 'download_cache_max_mb = 1\n', 'tar.gz')
+    _add_storage_listing('tar.gz')
+    monkeypatch.setenv('FLOW_CACHE_DIR', str(tmpdir.join('cache')))
+    archive = _make_tar_gz({'manifest.yml': b'applications'})
+    _add_tar_artifact(archive)
+    tmpdir.mkdir('first')
+    tmpdir.mkdir('second')
+
+    with patch('flow.utils.commons.printMSG'):
+        art.download_and_extract_artifacts_locally(str(tmpdir.join('first')) + '/')
+        art.download_and_extract_artifacts_locally(str(tmpdir.join('second')) + '/')
+
+    assert tmpdir.join('second', 'manifest.yml').read() == 'applications'
+    assert [call.request.method for call in responses.calls if call.request.url.endswith('.tar.gz')] == \
+        ['HEAD', 'GET', 'HEAD']
+
+
+@responses.activate
+def test_damaged_cached_tar_artifact_is_downloaded_again(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, extract_settings + 'download_cache_max_mb = 1\n', 'tar.gz')
+    _add_storage_listing('tar.gz')
+    monkeypatch.setenv('FLOW_CACHE_DIR', str(tmpdir.join('cache')))
+    archive = _make_tar_gz({'manifest.yml': b'applications'})
+    _add_tar_artifact(archive)
+    sha1 = hashlib.sha1(archive).hexdigest()
+    tmpdir.join('cache', 'artifactory', sha1[:2], sha1).write_binary(_make_tar_gz({'manifest.yml': b'tampered',
+                                                                                   'extra.txt': b'extra'}),
+                                                                     ensure=True)
+    tmpdir.mkdir('deploy')
+
+    with patch('flow.utils.commons.printMSG'):
+        art.download_and_extract_artifacts_locally(str(tmpdir.join('deploy')) + '/')
+
+    assert tmpdir.join('deploy', 'manifest.yml').read() == 'applications'
+    assert os.listdir(str(tmpdir.join('deploy'))) == ['manifest.yml']
+    assert tmpdir.join('cache', 'artifactory', sha1[:2], sha1).read_binary() == archive
+    assert [call.request.method for call in responses.calls if call.request.url.endswith('.tar.gz')] == \
+        ['HEAD', 'GET']
+
+
+def test_artifact_cache_is_off_without_a_size_limit(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, download_settings)
+    monkeypatch.setenv('FLOW_CACHE_DIR', str(tmpdir))
+
+    assert art._get_cached_artifact_file('a' * 40) is None
+
+
+@responses.activate
+def test_zip_artifact_members_are_written_in_parallel(monkeypatch, tmpdir):
+    art = _setup_artifactory(monkeypatch, extract_settings, 'zip')
+    _add_storage_listing('zip')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+        for number in range(20):
+            z.writestr('static/file{}.txt'.format(number), 'content {}'.format(number) * 100)
+        z.writestr('manifest.yml', 'applications')
+        z.writestr('../outside.txt', 'outside')
+    url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.zip'
+    responses.add(responses.HEAD, url, status=200)
+    responses.add(responses.GET, url, body=buffer.getvalue(), status=200)
+    tmpdir.mkdir('deploy')
+
+    with patch('flow.utils.commons.printMSG'):
+        art.download_and_extract_artifacts_locally(str(tmpdir.join('deploy')) + '/')
+
+    assert tmpdir.join('deploy', 'manifest.yml').read() == 'applications'
+    assert tmpdir.join('deploy', 'static', 'file7.txt').read() == 'content 7' * 100
+    assert len(tmpdir.join('deploy', 'static').listdir()) == 20
+    assert not tmpdir.join('outside.txt').exists()
+
+
+@responses.activate
+def test_resolve_artifacts_in_one_query(monkeypatch):
+    art = _setup_artifactory(monkeypatch)
+    responses.add(responses.POST, 'https://testdomain/artifactory/api/search/aql', status=200, json={'results': [
+        {'repo': 'release-repo', 'path': 'group/orders/v2.0.0', 'name': 'orders-v2.0.0.jar', 'size': 20,
+         'actual_sha1': 'b' * 40, 'sha256': 'd' * 64},
+        {'repo': 'release-repo', 'path': 'group/carts/v1.0.0', 'name': 'carts-v1.0.0.zip', 'size': 10,
+         'actual_sha1': 'a' * 40, 'sha256': 'c' * 64}]})
+
+    with patch('flow.utils.commons.printMSG'):
+        resolved = art.resolve_artifacts([('carts', 'v1.0.0', 'zip'), ('orders', 'v2.0.0', 'jar')])
+
+    assert len(responses.calls) == 1
+    query = responses.calls[0].request.body
+    assert query.startswith('items.find(') and '"group/carts/v1.0.0"' in query and '"*.jar"' in query
+    assert [artifact['url'] for artifact in resolved] == [
+        'https://testdomain/artifactory/release-repo/group/carts/v1.0.0/carts-v1.0.0.zip',
+        'https://testdomain/artifactory/release-repo/group/orders/v2.0.0/orders-v2.0.0.jar']
+    assert resolved[0]['size'] == 10 and resolved[0]['sha1'] == 'a' * 40 and resolved[0]['sha256'] == 'c' * 64
+
+
+@responses.activate
+def test_resolve_artifacts_missing_artifact(monkeypatch):
+    art = _setup_artifactory(monkeypatch)
+    responses.add(responses.POST, 'https://testdomain/artifactory/api/search/aql', status=200, json={'results': []})
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        with pytest.raises(ArtifactException):
+            art.resolve_artifacts([('carts', 'v1.0.0', 'zip')])
+
+    mock_printmsg_fn.assert_called_with('ArtiFactory', 'resolve_artifacts',
+                                        'Could not locate artifact group/carts/v1.0.0/*.zip', 'ERROR')
+
+
+@responses.activate
+def test_resolve_artifacts_read_timeout(monkeypatch):
+    art = _setup_artifactory(monkeypatch)
+    responses.add(responses.POST, 'https://testdomain/artifactory/api/search/aql',
+                  body=requests.ReadTimeout('read timed out'))
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        with pytest.raises(ArtifactException):
+            art.resolve_artifacts([('carts', 'v1.0.0', 'zip')])
+
+    mock_printmsg_fn.assert_called_with('ArtiFactory', 'resolve_artifacts', 'AQL search failed. read timed out',
+                                        'ERROR')
+
+
+@responses.activate
+def test_promote_build_artifact_copies_version_folder(monkeypatch):
+    art = _setup_artifactory(monkeypatch)
+    promote_url = 'https://testdomain/artifactory/api/copy/snapshot-repo/group/testproject/v1.0.0'
+    responses.add(responses.POST, promote_url, status=200, json={'messages': []})
+
+    with patch('flow.utils.commons.printMSG'):
+        art.promote_build_artifact()
+
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.url == promote_url + \
+        '?to=/release-repo/group/testproject/v1.0.0&suppressLayouts=1&failFast=1'
+
+
+@responses.activate
+def test_promote_build_artifact_failure(monkeypatch):
+    art = _setup_artifactory(monkeypatch, '[artifactory]\npromote_operation = move\n')
+    responses.add(responses.POST, 'https://testdomain/artifactory/api/move/snapshot-repo/group/testproject/v1.0.0',
+                  status=404, body='not found')
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        with pytest.raises(SystemExit):
+            art.promote_build_artifact()
+
+    mock_printmsg_fn.assert_called_with('ArtiFactory', 'promote_build_artifact',
+                                        'Promoting group/testproject/v1.0.0 to release-repo failed. Response: not found',
+                                        'ERROR')
+
+
+@responses.activate
+def test_promote_build_artifact_connection_failure(monkeypatch):
+    art = _setup_artifactory(monkeypatch)
+    responses.add(responses.POST, 'https://testdomain/artifactory/api/copy/snapshot-repo/group/testproject/v1.0.0',
+                  body=requests.ConnectionError('connection refused'))
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        with pytest.raises(SystemExit):
+            art.promote_build_artifact()
+
+    mock_printmsg_fn.assert_called_with('ArtiFactory', 'promote_build_artifact',
+                                        'Failed connecting to Artifactory. connection refused', 'ERROR')
+
+
+@responses.activate
+def test_promote_build_artifact_unexpected_error(monkeypatch):
+    art = _setup_artifactory(monkeypatch)
+    responses.add(responses.POST, 'https://testdomain/artifactory/api/copy/snapshot-repo/group/testproject/v1.0.0',
+                  body=requests.exceptions.ChunkedEncodingError('connection broken'))
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        with pytest.raises(SystemExit):
+            art.promote_build_artifact()
+
+    mock_printmsg_fn.assert_called_with('ArtiFactory', 'promote_build_artifact',
+                                        'Promoting group/testproject/v1.0.0 to release-repo failed. connection broken',
+                                        'ERROR')
+
+
+@responses.activate
+def test_publish_stream_hashes_while_uploading(monkeypatch):
+    art = _setup_artifactory(monkeypatch)
+    file_url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.tar'
+    received = []
+
+    def store(request):
+        received.append(b''.join(request.body))
+        return 201, {}, json.dumps({'checksums': {'sha1': hashlib.sha1(received[0]).hexdigest()}})
+
+    responses.add_callback(responses.PUT, file_url, callback=store)
+
+    with patch('flow.utils.commons.printMSG'):
+        art.publish_stream(iter([b'first ', b'second']), 'testproject.tar')
+
+    assert received == [b'first second']
+
+
+@responses.activate
+def test_publish_stream_checksum_mismatch(monkeypatch):
+    art = _setup_artifactory(monkeypatch)
+    file_url = 'https://testdomain/artifactory/release-repo/group/testproject/v1.0.0/testproject.tar'
+    responses.add(responses.PUT, file_url, status=201, json={'checksums': {'sha1': '0' * 40}})
+
+    with patch('flow.utils.commons.printMSG'):
+        with pytest.raises(SystemExit):
+            art.publish_stream(iter([b'first ', b'second']), 'testproject.tar')
@@ -0,0 +1,200 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import MagicMock
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import flow.utils.httpclient as httpclient
+from flow.buildconfig import BuildConfig
+from flow.cloud.cloudfoundry.ccapi import CloudControllerClient, CloudControllerException
+from flow.cloud.cloudfoundry.cloudfoundry import CloudFoundry
+
+
+class _FakeCloudController(BaseHTTPRequestHandler):
+    # just enough of the cloud controller v3 api and uaa for a deploy
+    def _send(self, status, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        if self.headers.get('Authorization') != 'bearer ' + self.server.token:
+            self._send(401, {'errors': [{'title': 'CF-InvalidAuthToken'}]})
+            return False
+        return True
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        server.requests.append(('GET', url.path))
+
+        if url.path == '/':
+            return self._send(200, {'links': {'uaa': {'href': server.url + '/uaa'}}})
+        if not self._authorized():
+            return
+
+        if url.path == '/v3/organizations':
+            return self._send(200, {'resources': [{'guid': 'org-guid'}] if query.get('names') == 'ci' else []})
+        if url.path == '/v3/spaces':
+            return self._send(200, {'resources': [{'guid': 'space-guid'}] if query.get('names') == 'development'
+                                    else []})
+        if url.path == '/v3/apps':
+            # two pages to make the client follow the pagination links
+            first_page = query.get('page') != '2'
+            apps = server.apps[:1] if first_page else server.apps[1:]
+            return self._send(200, {'resources': apps, 'pagination': {
+                'next': {'href': server.url + '/v3/apps?page=2'} if first_page else None}})
+        if url.path == '/v3/processes':
+            return self._send(200, {'resources': [
+                {'instances': instances, 'links': {'app': {'href': server.url + '/v3/apps/' + guid}}}
+                for guid, instances in server.instances.items()]})
+        if url.path == '/v3/routes':
+            return self._send(200, {'resources': server.routes,
+                                    'included': {'domains': [{'guid': 'domain-guid', 'name': 'apps-np.fake.com'}]}})
+        self._send(404)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server.requests.append(('POST', self.path))
+
+        if self.path == '/uaa/oauth/token':
+            form = parse_qs(body.decode('utf-8'))
+            if form.get('password') == ['secret']:
+                return self._send(200, {'access_token': server.token})
+            return self._send(401, {'error': 'unauthorized'})
+        if not self._authorized():
+            return
+        self._send(202 if self.path.endswith('/actions/scale') else 200, {})
+
+    def do_DELETE(self):
+        self.server.requests.append(('DELETE', self.path))
+        if self._authorized():
+            self._send(202 if self.path.startswith('/v3/apps/') else 204)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def cloud_controller():
+    server = HTTPServer(('127.0.0.1', 0), _FakeCloudController)
+    server.url = 'http://127.0.0.1:{}'.format(server.server_port)
+    server.token = 'token-1'
+    server.requests = []
+    server.apps = [{'guid': 'guid-280', 'name': 'CI-HelloWorld-v2.8.0+4', 'state': 'STOPPED'},
+                   {'guid': 'guid-290', 'name': 'CI-HelloWorld-v2.9.0+1', 'state': 'STARTED'},
+                   {'guid': 'guid-other', 'name': 'Other-App-v1.0.0+1', 'state': 'STARTED'}]
+    server.instances = {'guid-280': 1, 'guid-290': 2, 'guid-other': 1}
+    # route-new belongs to the version being pushed, which is not in the space yet
+    server.routes = [{'guid': 'route-old', 'host': 'hello-old', 'path': '/api',
+                      'relationships': {'domain': {'data': {'guid': 'domain-guid'}}},
+                      'destinations': [{'guid': 'destination-280', 'app': {'guid': 'guid-280'}}]},
+                     {'guid': 'route-new', 'host': 'ci-helloworld', 'path': '',
+                      'relationships': {'domain': {'data': {'guid': 'domain-guid'}}},
+                      'destinations': [{'guid': 'destination-291', 'app': {'guid': 'guid-291'}}]}]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    httpclient.close()
+
+
+def test_client_lists_apps_across_pages(cloud_controller):
+    client = CloudControllerClient(cloud_controller.url, 'deployer', 'secret')
+    client.login()
+    client.target('ci', 'development')
+
+    apps = client.list_apps()
+
+    assert [(app.name, app.state, app.instances, app.desired_instances, app.guid) for app in apps] == [
+        ('CI-HelloWorld-v2.8.0+4', 'stopped', None, 1, 'guid-280'),
+        ('CI-HelloWorld-v2.9.0+1', 'started', None, 2, 'guid-290'),
+        ('Other-App-v1.0.0+1', 'started', None, 1, 'guid-other')]
+
+
+def test_client_rejected_credentials(cloud_controller):
+    client = CloudControllerClient(cloud_controller.url, 'deployer', 'wrong')
+
+    with pytest.raises(CloudControllerException):
+        client.login()
+
+
+def test_client_logs_in_again_when_the_token_expires(cloud_controller):
+    client = CloudControllerClient(cloud_controller.url, 'deployer', 'secret')
+    client.login()
+    cloud_controller.token = 'token-2'
+
+    client.target('ci', 'development')
+
+    assert client.token == 'token-2'
+    assert client.space_guid == 'space-guid'
+
+
+def test_client_missing_space(cloud_controller):
+    client = CloudControllerClient(cloud_controller.url, 'deployer', 'secret')
+    client.login()
+
+    with pytest.raises(CloudControllerException, match='Could not find space qa in org ci'):
+        client.target('ci', 'qa')
+
+
+def test_deploy_steps_use_the_api_backend(monkeypatch, cloud_controller):
+    monkeypatch.setattr(BuildConfig, 'settings', None)
+    monkeypatch.setattr(CloudFoundry, 'backend', 'api')
+    monkeypatch.setattr(CloudFoundry, 'cf_domain', 'apps-np.fake.com')
+    monkeypatch.setattr(CloudFoundry, 'cf_api_endpoint', cloud_controller.url)
+    monkeypatch.setattr(CloudFoundry, 'cf_user', 'deployer')
+    monkeypatch.setattr(CloudFoundry, 'cf_pwd', 'secret')
+    monkeypatch.setattr(CloudFoundry, 'cf_org', 'ci')
+    monkeypatch.setattr(CloudFoundry, 'cf_space', 'development')
+
+    _b = MagicMock(BuildConfig)
+    _b.project_name = 'CI-HelloWorld'
+    _b.version_number = 'v2.9.1+2'
+
+    with patch('flow.utils.commons.printMSG'), patch('subprocess.Popen') as mocked_popen:
+        _cf = CloudFoundry(_b)
+        _cf._cc_api_login()
+        _cf._get_stopped_apps()
+        _cf._get_started_apps()
+        _cf._stop_old_app_servers()
+        _cf._unmap_delete_previous_versions()
+
+    # not a single cf process was started
+    assert not mocked_popen.called
+    calls = [request for request in cloud_controller.requests if request[0] != 'GET']
+    assert calls[1:] == [('POST', '/v3/apps/guid-290/processes/web/actions/scale'),
+                         ('POST', '/v3/apps/guid-290/actions/stop'),
+                         ('DELETE', '/v3/routes/route-old/destinations/destination-280'),
+                         ('DELETE', '/v3/apps/guid-280')]
+
+
+def test_api_backend_logs_the_cli_in_right_before_the_push(monkeypatch):
+    monkeypatch.setattr(CloudFoundry, 'backend', 'api')
+    monkeypatch.delenv('AUTO_STOP', raising=False)
+
+    _b = MagicMock(BuildConfig)
+    _b.project_name = 'CI-HelloWorld'
+    _b.version_number = 'v2.9.1+2'
+
+    steps = MagicMock()
+    with patch('flow.utils.commons.printMSG'):
+        _cf = CloudFoundry(_b)
+        for step in ['_cc_api_login', '_cf_login', '_get_stopped_apps', '_get_started_apps', '_cf_push',
+                     '_stop_old_app_servers', '_unmap_delete_previous_versions']:
+            monkeypatch.setattr(_cf, step, getattr(steps, step))
+        _cf._deploy_to_space(False, 'manifest.yml')
+
+    assert [name for name, _, _ in steps.mock_calls] == ['_cc_api_login', '_get_stopped_apps', '_get_started_apps',
+                                                          '_cf_login', '_cf_push', '_stop_old_app_servers',
+                                                          '_unmap_delete_previous_versions']
@@ -1,9 +1,11 @@
+import configparser
 import os
 import subprocess
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
+from flow.cloud.cloudfoundry.cfinventory import CfInventory
 from flow.cloud.cloudfoundry.cloudfoundry import CloudFoundry
 
 from flow.buildconfig import BuildConfig
@@ -96,7 +98,29 @@ mock_build_config_missing_org_dict = {
     }
 }
 
-mock_started_apps_already_started = 'CI-HelloWorld-v2.9.0+1'
+mock_started_apps_already_started = """Getting apps in org ci / space development as user...
+OK
+
+name                     requested state   instances   memory   disk   urls
+CI-HelloWorld-v2.9.0+1   started           1/1         1G       1G     ci-helloworld.apps-np.fake.com
+"""
+
+mock_cf_apps = """Getting apps in org ci / space development as user...
+OK
+
+name                     requested state   instances   memory   disk   urls
+CI-HelloWorld-v2.8.0+4   stopped           0/1         1G       1G
+CI-HelloWorld-v2.9.0+1   started           2/2         1G       1G     ci-helloworld.apps-np.fake.com, hello.apps-np.fake.com
+CI-HelloWorld-v2.9.1+2   started           1/1         1G       1G     ci-helloworld-v291.apps-np.fake.com
+Other-App                started           1/1         1G       1G     other.apps-np.fake.com
+"""
+
+mock_cf_apps_v7 = """Getting apps in org ci / space development as user...
+
+name                     requested state   processes           routes
+CI-HelloWorld-v2.8.0+4   stopped           web:0/1
+CI-HelloWorld-v2.9.0+1   started           web:2/2, worker:1/1   ci-helloworld.apps-np.fake.com
+"""
 
 def test_verify_required_attributes_missing_user(monkeypatch):
     if os.getenv('DEPLOYMENT_USER'):
@@ -247,9 +271,8 @@ def test_get_started_apps_already_started_failed_cmd():
 
                     with patch.object(_cf, '_cf_logout'):
                         _cf._get_started_apps('true')
-        mock_printmsg_fn.assert_any_call('CloudFoundry', '_get_started_apps', "Failed calling cf apps | grep "
-                                                                              "CI-HelloWorld*-v\\d*\\.\\d*\\.\\d* | grep started | awk '{"
-                                                                              "print $1}'. Return code of 1", 'ERROR')
+        mock_printmsg_fn.assert_any_call('CloudFoundry', '_get_app_inventory', "Failed calling cf apps. Return code "
+                                                                               "of 1", 'ERROR')
 
 
 def test_find_deployable_multiple_files():
@@ -315,3 +338,314 @@ def test_find_deployable_one_file():
 
     mock_printmsg_fn.assert_any_call('Cloud', 'find_deployable', 'Looking for a jar in fake_push_dir')
 
+
+
+def test_get_apps_from_one_inventory():
+    with patch('flow.utils.commons.printMSG'):
+        with patch.object(subprocess, 'Popen') as mocked_popen:
+            mocked_popen.return_value.returncode = 0
+            mocked_popen.return_value.communicate.return_value = (mock_cf_apps.encode(), None)
+            _b = MagicMock(BuildConfig)
+            _b.project_name = 'CI-HelloWorld'
+            _b.version_number = 'v2.9.1+2'
+            _cf = CloudFoundry(_b)
+
+            _cf._get_stopped_apps()
+            _cf._get_started_apps(True)
+
+    # both lists came from a single cf apps call
+    assert mocked_popen.call_count == 1
+    assert CloudFoundry.stopped_apps == ['CI-HelloWorld-v2.8.0+4']
+    assert CloudFoundry.started_apps == ['CI-HelloWorld-v2.9.0+1', 'CI-HelloWorld-v2.9.1+2']
+
+    app = CloudFoundry.inventory.by_version['v2.9.0+1']
+    assert app.instances == 2 and app.desired_instances == 2
+    assert app.routes == ['ci-helloworld.apps-np.fake.com', 'hello.apps-np.fake.com']
+
+
+def test_parse_cf_apps_newer_cli():
+    apps = CfInventory.parse_cf_apps(mock_cf_apps_v7)
+
+    assert [(app.name, app.state, app.instances, app.desired_instances) for app in apps] == [
+        ('CI-HelloWorld-v2.8.0+4', 'stopped', 0, 1), ('CI-HelloWorld-v2.9.0+1', 'started', 2, 2)]
+    assert apps[0].routes == []
+    assert apps[1].routes == ['ci-helloworld.apps-np.fake.com']
+
+
+def _setup_old_versions(monkeypatch):
+    settings = configparser.ConfigParser()
+    settings.read_string('[cloudfoundry]\ncli_workers = 3\n')
+    monkeypatch.setattr(BuildConfig, 'settings', settings)
+
+    _b = MagicMock(BuildConfig)
+    _b.project_name = 'CI-HelloWorld'
+    _b.version_number = 'v2.9.1+2'
+    _cf = CloudFoundry(_b)
+    CloudFoundry.inventory = CfInventory('CI-HelloWorld', CfInventory.parse_cf_apps(mock_cf_apps))
+    CloudFoundry.started_apps = [app.name for app in CloudFoundry.inventory.started()]
+    return _cf
+
+
+def test_stop_old_app_servers_in_parallel(monkeypatch):
+    _cf = _setup_old_versions(monkeypatch)
+    CloudFoundry.started_apps.append('CI-HelloWorld-v2.7.0+1')
+    commands = []
+
+    def run(cmd, timeout):
+        commands.append(cmd)
+        return 0, ['OK']
+
+    with patch('flow.utils.commons.printMSG'):
+        with patch.object(_cf, '_run_cf_command', side_effect=run), patch.object(_cf, '_cf_logout') as logout:
+            _cf._stop_old_app_servers()
+
+    # v2.9.0+1 runs two instances so it is scaled first, the unknown v2.7.0+1 is scaled to be safe
+    assert sorted(commands) == ['cf scale CI-HelloWorld-v2.7.0+1 -i 1', 'cf scale CI-HelloWorld-v2.9.0+1 -i 1',
+                                'cf stop CI-HelloWorld-v2.7.0+1', 'cf stop CI-HelloWorld-v2.9.0+1']
+    assert not logout.called
+
+
+def test_stop_old_app_servers_reports_all_failures(monkeypatch):
+    _cf = _setup_old_versions(monkeypatch)
+    CloudFoundry.started_apps.append('CI-HelloWorld-v2.7.0+1')
+
+    def run(cmd, timeout):
+        return (None, []) if 'v2.7.0' in cmd else (1, ['FAILED'])
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        with patch.object(_cf, '_run_cf_command', side_effect=run), patch.object(_cf, '_cf_logout') as logout, \
+                patch('os.system'):
+            _cf._stop_old_app_servers()
+
+    summary = [call[0][2] for call in mock_printmsg_fn.call_args_list if str(call[0][2]).startswith('2 of 2 old')]
+    assert len(summary) == 1
+    assert 'Timed out calling cf stop CI-HelloWorld-v2.7.0+1' in summary[0]
+    assert 'Failed calling cf stop CI-HelloWorld-v2.9.0+1. Return code of 1' in summary[0]
+    assert logout.called
+
+
+def test_cli_workers_use_their_own_cf_home(monkeypatch, tmp_path):
+    _cf = _setup_old_versions(monkeypatch)
+    tmp_path.joinpath('.cf').mkdir()
+    tmp_path.joinpath('.cf', 'config.json').write_text('{"AccessToken": "bearer token"}')
+    monkeypatch.setenv('CF_HOME', str(tmp_path))
+    popen_envs = []
+
+    def popen(cmd, **kwargs):
+        popen_envs.append(kwargs['env']['CF_HOME'])
+        with open(os.path.join(kwargs['env']['CF_HOME'], '.cf', 'config.json')) as config:
+            assert config.read() == '{"AccessToken": "bearer token"}'
+        process = MagicMock()
+        process.communicate.return_value = (b'OK', None)
+        process.returncode = 0
+        return process
+
+    def stop(cmd):
+        return _cf._run_cf_command(cmd, 60)[1], None
+
+    tasks = [('app{}'.format(number), stop, ('cf stop app{}'.format(number),)) for number in range(6)]
+
+    with patch('flow.utils.commons.printMSG'), patch('subprocess.Popen', side_effect=popen):
+        assert _cf._run_cf_commands('test', tasks, 'WARN') == {}
+
+    # at most one copy per worker, none of them the shared home, and all cleaned up afterwards
+    assert len(popen_envs) == 6
+    assert 1 <= len(set(popen_envs)) <= 3
+    assert str(tmp_path) not in popen_envs
+    assert not any(os.path.exists(cf_home) for cf_home in popen_envs)
+
+
+mock_cf_routes = """Getting routes for org ci / space development as user...
+
+space         host            domain             port   path    type   apps                                            service
+development   ci-helloworld   apps-np.fake.com                         CI-HelloWorld-v2.9.1+2
+development   hello-old       apps-np.fake.com          /api           CI-HelloWorld-v2.7.0+1,CI-HelloWorld-v2.8.0+4
+development   hello-old       apps.fake.com                            CI-HelloWorld-v2.8.0+4
+"""
+
+
+def _setup_cleanup(monkeypatch):
+    _cf = _setup_old_versions(monkeypatch)
+    monkeypatch.setattr(CloudFoundry, 'cf_domain', 'apps-np.fake.com')
+    CloudFoundry.stopped_apps = ['CI-HelloWorld-v2.7.0+1', 'CI-HelloWorld-v2.8.0+4', 'CI-HelloWorld-v2.9.1+2']
+    return _cf
+
+
+def test_unmap_delete_previous_versions_lists_routes_once(monkeypatch):
+    _cf = _setup_cleanup(monkeypatch)
+    commands = []
+
+    def run(cmd, timeout):
+        commands.append(cmd)
+        return (0, mock_cf_routes.splitlines()) if cmd == 'cf routes' else (0, ['OK'])
+
+    with patch('flow.utils.commons.printMSG'):
+        with patch.object(_cf, '_run_cf_command', side_effect=run):
+            _cf._unmap_delete_previous_versions()
+
+    assert commands.count('cf routes') == 1
+    assert sorted(commands[1:4]) == ['cf unmap-route CI-HelloWorld-v2.7.0+1 apps-np.fake.com -n hello-old --path /api',
+                                     'cf unmap-route CI-HelloWorld-v2.8.0+4 apps-np.fake.com -n hello-old --path /api',
+                                     'cf unmap-route CI-HelloWorld-v2.8.0+4 apps.fake.com -n hello-old']
+    assert sorted(commands[4:]) == ['cf delete CI-HelloWorld-v2.7.0+1 -f', 'cf delete CI-HelloWorld-v2.8.0+4 -f']
+
+
+def test_unmap_delete_previous_versions_isolates_cf_home(monkeypatch, tmp_path):
+    _cf = _setup_cleanup(monkeypatch)
+    tmp_path.joinpath('.cf').mkdir()
+    tmp_path.joinpath('.cf', 'config.json').write_text('{}')
+    monkeypatch.setenv('CF_HOME', str(tmp_path))
+    cf_homes = {}
+
+    def popen(cmd, **kwargs):
+        cf_homes[cmd] = (kwargs['env'] or os.environ)['CF_HOME']
+        process = MagicMock()
+        process.communicate.return_value = (mock_cf_routes.encode('utf-8') if cmd == 'cf routes' else b'OK', None)
+        process.returncode = 0
+        return process
+
+    with patch('flow.utils.commons.printMSG'), patch('subprocess.Popen', side_effect=popen):
+        _cf._unmap_delete_previous_versions()
+
+    # the single listing runs in the shared session, the concurrent unmaps and deletes never do
+    assert cf_homes.pop('cf routes') == str(tmp_path)
+    assert len(cf_homes) == 5
+    assert str(tmp_path) not in cf_homes.values()
+
+
+def test_unmap_delete_previous_versions_keeps_apps_with_failed_unmaps(monkeypatch):
+    _cf = _setup_cleanup(monkeypatch)
+    commands = []
+
+    def run(cmd, timeout):
+        commands.append(cmd)
+        if cmd == 'cf routes':
+            return 0, mock_cf_routes.splitlines()
+        return (1, ['FAILED']) if cmd.endswith('apps.fake.com -n hello-old') else (0, ['OK'])
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        with pytest.raises(SystemExit):
+            with patch.object(_cf, '_run_cf_command', side_effect=run), patch.object(_cf, '_cf_logout'), \
+                    patch('os.system'):
+                _cf._unmap_delete_previous_versions()
+
+    assert [cmd for cmd in commands if 'delete' in cmd] == ['cf delete CI-HelloWorld-v2.7.0+1 -f']
+    mock_printmsg_fn.assert_called_with('CloudFoundry', '_unmap_delete_previous_versions',
+                                        'Failed removing routes from CI-HelloWorld-v2.8.0+4. They were not deleted.',
+                                        'ERROR')
+
+
+mock_build_config_targets_dict = {
+    "projectInfo": {
+        "name": "testproject"
+    },
+    "environments": {
+        "unittest": {
+            "cf": {
+                "apiEndpoint": "api.run-east.fake.com",
+                "domain": "apps-east.fake.com",
+                "org": "ci",
+                "targets": [
+                    {"space": "development"},
+                    {"name": "west", "apiEndpoint": "api.run-west.fake.com", "domain": "apps-west.fake.com",
+                     "space": "development"}
+                ]
+            }
+        }
+    }
+}
+
+
+def test_verify_required_attributes_targets(monkeypatch):
+    monkeypatch.setattr(CloudFoundry, 'targets', [])
+    monkeypatch.setenv('DEPLOYMENT_USER', 'DUMMY')
+    monkeypatch.setenv('DEPLOYMENT_PWD', 'DUMMY')
+
+    with patch('flow.utils.commons.printMSG'):
+        _b = MagicMock(BuildConfig)
+        _b.build_env_info = mock_build_config_targets_dict['environments']['unittest']
+        _b.json_config = mock_build_config_targets_dict
+
+        _cf = CloudFoundry(_b)
+        _cf._verify_required_attributes()
+
+    assert CloudFoundry.targets == [
+        {'name': 'api.run-east.fake.com ci/development', 'apiEndpoint': 'api.run-east.fake.com',
+         'domain': 'apps-east.fake.com', 'org': 'ci', 'space': 'development', 'backend': 'cli'},
+        {'name': 'west', 'apiEndpoint': 'api.run-west.fake.com', 'domain': 'apps-west.fake.com', 'org': 'ci',
+         'space': 'development', 'backend': 'cli'}]
+
+
+def _setup_targets(monkeypatch, tmp_path, workers):
+    settings = configparser.ConfigParser()
+    settings.read_string('[cloudfoundry]\ntarget_workers = {}\n'.format(workers))
+    monkeypatch.setattr(BuildConfig, 'settings', settings)
+    for attribute in ('cf_api_endpoint', 'cf_org', 'cf_space', 'cf_domain', 'backend', 'cc_client'):
+        monkeypatch.setattr(CloudFoundry, attribute, getattr(CloudFoundry, attribute))
+    monkeypatch.setattr(CloudFoundry, 'targets', [
+        {'name': 'east', 'apiEndpoint': 'api.run-east.fake.com', 'domain': 'apps-east.fake.com', 'org': 'ci',
+         'space': 'development', 'backend': 'cli'},
+        {'name': 'west', 'apiEndpoint': 'api.run-west.fake.com', 'domain': 'apps-west.fake.com', 'org': 'ci',
+         'space': 'development', 'backend': 'cli'}])
+
+    def deploy_to_space(force_deploy, manifest):
+        # runs in the child, so what it saw is written down for the test to check
+        with open(str(tmp_path / CloudFoundry.cf_api_endpoint), 'w') as f:
+            f.write(os.environ['CF_HOME'])
+        if CloudFoundry.cf_domain == 'apps-west.fake.com':
+            exit(1)
+
+    _cf = CloudFoundry(MagicMock(BuildConfig))
+    return _cf, deploy_to_space
+
+
+def test_deploy_targets_in_separate_cf_homes(monkeypatch, tmp_path):
+    _cf, deploy_to_space = _setup_targets(monkeypatch, tmp_path, 2)
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        with pytest.raises(SystemExit):
+            with patch.object(_cf, '_deploy_to_space', side_effect=deploy_to_space):
+                _cf._deploy_targets(False, 'development.manifest.yml')
+
+    cf_homes = [(tmp_path / endpoint).read_text() for endpoint in ('api.run-east.fake.com', 'api.run-west.fake.com')]
+    assert cf_homes[0] != cf_homes[1]
+    assert not any(os.path.exists(cf_home) for cf_home in cf_homes)
+
+    report = [call[0][2] for call in mock_printmsg_fn.call_args_list if call[0][1] == '_report_targets']
+    assert report[0].startswith('east: deployed in ')
+    assert report[1].startswith('west: failed in ') and report[1].endswith('(exit code 1)')
+    mock_printmsg_fn.assert_called_with('CloudFoundry', '_report_targets', '1 of 2 targets failed: west', 'ERROR')
+
+
+def test_deploy_targets_prefix_their_output(monkeypatch, tmp_path, capfd):
+    _cf, _ = _setup_targets(monkeypatch, tmp_path, 2)
+
+    def deploy_to_space(force_deploy, manifest):
+        print('pushing to ' + CloudFoundry.cf_domain)
+        # the cf cli writes straight to the inherited descriptors
+        subprocess.check_call(['echo', 'cf output'])
+
+    with patch.object(_cf, '_deploy_to_space', side_effect=deploy_to_space):
+        _cf._deploy_targets(False, 'development.manifest.yml')
+
+    lines = capfd.readouterr().out.splitlines()
+    assert '[east] pushing to apps-east.fake.com' in lines
+    assert '[west] pushing to apps-west.fake.com' in lines
+    assert '[east] cf output' in lines
+    assert '[west] cf output' in lines
+
+
+def test_deploy_targets_without_fork(monkeypatch, tmp_path):
+    _cf, deploy_to_space = _setup_targets(monkeypatch, tmp_path, 1)
+    monkeypatch.setattr('multiprocessing.get_all_start_methods', lambda: ['spawn'])
+    monkeypatch.delenv('CF_HOME', raising=False)
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        with pytest.raises(SystemExit):
+            with patch.object(_cf, '_deploy_to_space', side_effect=deploy_to_space):
+                _cf._deploy_targets(False, 'development.manifest.yml')
+
+    # one target after the other in this process, and CF_HOME is put back afterwards
+    assert 'CF_HOME' not in os.environ
+    assert CloudFoundry.cf_domain == 'apps-west.fake.com'
+    mock_printmsg_fn.assert_called_with('CloudFoundry', '_report_targets', '1 of 2 targets failed: west', 'ERROR')
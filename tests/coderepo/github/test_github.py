@@ -1,11 +1,21 @@
+import hashlib
+import io
 import json
 import os
+import subprocess
+import tarfile
+import threading
+import time
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pytest
 import responses
+import flow.coderepo.github.github as github_module
 from flow.coderepo.github.github import GitHub
+from flow.coderepo.github.ratelimiter import RateLimiter
+from flow.coderepo.github.semverindex import SemverIndex
+from flow.coderepo.localgit.localgit import LocalGit
 
 from flow.buildconfig import BuildConfig
 
@@ -701,3 +711,619 @@ def test_get_all_git_commit_history_between_provided_tags_beginning_tag_not_foun
     mock_printmsg_fn.assert_any_call('GitHub', 'get_all_git_commit_history_between_provided_tags', "Version tag not "
                                                                                                    "found v1.99.98",
                                      'ERROR')
+
+
+def _reset_github_tag_state(monkeypatch, cache_dir):
+    monkeypatch.setattr(GitHub, 'url', 'https://fakegithub.com/api/v3/repos')
+    monkeypatch.setattr(GitHub, 'org', 'Org-GitHub')
+    monkeypatch.setattr(GitHub, 'repo', 'Repo-GitHub')
+    monkeypatch.setattr(GitHub, 'token', None)
+    monkeypatch.setattr(GitHub, 'cache_dir', cache_dir)
+    monkeypatch.setattr(GitHub, 'all_tags_and_shas', [])
+    monkeypatch.setattr(GitHub, 'cached_tag_pages', None)
+
+
+@responses.activate
+def test_get_all_tags_and_shas_from_github_revalidates_cached_pages(monkeypatch, tmpdir):
+    tags_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tags?per_page=100&page=1"
+    _reset_github_tag_state(monkeypatch, str(tmpdir))
+
+    responses.add(responses.GET, tags_url, status=200, headers={'ETag': '"abc"'},
+                  json=[{'name': 'v1.0.0+1', 'commit': {'sha': 'sha2'}}, {'name': 'v1.0.0', 'commit': {'sha': 'sha1'}}])
+
+    _github = GitHub(verify_repo=False)
+    assert _github.get_all_tags_and_shas_from_github() == [('v1.0.0+1', 'sha2'), ('v1.0.0', 'sha1')]
+
+    # simulate a later pipeline on the same agent
+    _reset_github_tag_state(monkeypatch, str(tmpdir))
+    responses.reset()
+    responses.add(responses.GET, tags_url, status=304)
+
+    assert _github.get_all_tags_and_shas_from_github() == [('v1.0.0+1', 'sha2'), ('v1.0.0', 'sha1')]
+    assert responses.calls[0].request.headers['If-None-Match'] == '"abc"'
+
+
+@responses.activate
+def test_get_all_tags_and_shas_from_github_refreshes_changed_pages(monkeypatch, tmpdir):
+    tags_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tags?per_page=100&page=1"
+    _reset_github_tag_state(monkeypatch, str(tmpdir))
+
+    responses.add(responses.GET, tags_url, status=200, headers={'ETag': '"abc"'},
+                  json=[{'name': 'v1.0.0', 'commit': {'sha': 'sha1'}}])
+    GitHub(verify_repo=False).get_all_tags_and_shas_from_github()
+
+    _reset_github_tag_state(monkeypatch, str(tmpdir))
+    responses.reset()
+    responses.add(responses.GET, tags_url, status=200, headers={'ETag': '"def"'},
+                  json=[{'name': 'v1.0.0+1', 'commit': {'sha': 'sha2'}}, {'name': 'v1.0.0', 'commit': {'sha': 'sha1'}}])
+
+    _github = GitHub(verify_repo=False)
+    assert _github.get_all_tags_and_shas_from_github() == [('v1.0.0+1', 'sha2'), ('v1.0.0', 'sha1')]
+    assert GitHub.cached_tag_pages[0]['etag'] == '"def"'
+
+
+def _reset_github_commit_state(monkeypatch, cache_dir):
+    _reset_github_tag_state(monkeypatch, cache_dir)
+    monkeypatch.setattr(GitHub, 'all_commits', [])
+    monkeypatch.setattr(GitHub, 'commit_index', {})
+    monkeypatch.setattr(GitHub, 'commit_head_etag', None)
+    monkeypatch.setattr(GitHub, 'commit_cache_loaded', False)
+    monkeypatch.setattr(GitHub, 'found_all_commits', False)
+
+
+@responses.activate
+def test_get_all_commits_from_github_only_pulls_new_commits(monkeypatch, tmpdir):
+    commits_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/commits?per_page=100&sha=develop&page=1"
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['develop']
+    _reset_github_commit_state(monkeypatch, str(tmpdir))
+
+    responses.add(responses.GET, commits_url, status=200, headers={'ETag': '"abc"'},
+                  json=[{'sha': 'sha2', 'commit': {'message': 'second'}},
+                        {'sha': 'sha1', 'commit': {'message': 'first'}}])
+    GitHub(config_override=_b, verify_repo=False).get_all_commits_from_github('sha1')
+
+    _reset_github_commit_state(monkeypatch, str(tmpdir))
+    responses.reset()
+    responses.add(responses.GET, commits_url, status=200, headers={'ETag': '"def"'},
+                  json=[{'sha': 'sha3', 'commit': {'message': 'third'}},
+                        {'sha': 'sha2', 'commit': {'message': 'second'}},
+                        {'sha': 'sha1', 'commit': {'message': 'first'}}])
+
+    commits = GitHub(config_override=_b, verify_repo=False).get_all_commits_from_github('sha1')
+
+    assert [commit['sha'] for commit in commits] == ['sha3', 'sha2', 'sha1']
+    assert GitHub.commit_index == {'sha3': 0, 'sha2': 1, 'sha1': 2}
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.headers['If-None-Match'] == '"abc"'
+
+
+def test_fetch_commit_history_between_two_tags():
+    _github = GitHub(verify_repo=False)
+    commits = [{'sha': sha, 'commit': {'message': sha}} for sha in ['e', 'd', 'c', 'b', 'a']]
+    _github.get_all_commits_from_github = MagicMock(return_value=commits)
+    _github.get_all_tags_and_shas_from_github = MagicMock(return_value=[("v1.1.0", "d"), ("v1.0.0", "b")])
+    commits_array = _github.get_all_git_commit_history_between_provided_tags([1, 0, 0, 0], [1, 1, 0, 0])
+    assert commits_array == ['d d', 'c c']
+
+
+def _add_tag_pages(tags_url, pages):
+    for page, names in enumerate(pages, start=1):
+        links = []
+        if page < len(pages):
+            links.append('<{url}{next}>; rel="next"'.format(url=tags_url, next=page + 1))
+        links.append('<{url}{last}>; rel="last"'.format(url=tags_url, last=len(pages)))
+        responses.add(responses.GET, tags_url + str(page), status=200, headers={'Link': ', '.join(links)},
+                      json=[{'name': name, 'commit': {'sha': name + '-sha'}} for name in names])
+
+
+@responses.activate
+def test_get_all_tags_and_shas_from_github_concurrent_pages_in_order(monkeypatch):
+    tags_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tags?per_page=100&page="
+    _reset_github_tag_state(monkeypatch, '')
+    monkeypatch.setattr(GitHub, 'page_fetch_workers', 3)
+    _add_tag_pages(tags_url, [['v1.0.0+4'], ['v1.0.0+3'], ['v1.0.0+2'], ['v1.0.0+1'], ['v1.0.0']])
+
+    tags = GitHub(verify_repo=False).get_all_tags_and_shas_from_github(need_release=1)
+
+    assert [name for name, _ in tags] == ['v1.0.0+4', 'v1.0.0+3', 'v1.0.0+2', 'v1.0.0+1', 'v1.0.0']
+    assert len(responses.calls) == 5
+
+
+@responses.activate
+def test_get_all_tags_and_shas_from_github_concurrent_pages_stop_early(monkeypatch):
+    tags_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tags?per_page=100&page="
+    _reset_github_tag_state(monkeypatch, '')
+    monkeypatch.setattr(GitHub, 'page_fetch_workers', 2)
+    _add_tag_pages(tags_url, [['v1.0.0+2'], ['v1.0.0'], ['v0.9.0'], ['v0.8.0'], ['v0.7.0'], ['v0.6.0']])
+
+    tags = GitHub(verify_repo=False).get_all_tags_and_shas_from_github(need_release=1)
+
+    assert [name for name, _ in tags] == ['v1.0.0+2', 'v1.0.0']
+    # the first page is read alone, then at most one window of pages is requested.  pages in the window that
+    # have not started when we stop are cancelled, so the last one may or may not go out
+    assert 2 <= len(responses.calls) <= 3
+
+
+@responses.activate
+def test_get_all_tags_and_shas_from_github_concurrent_pages_after_cached_first_page(monkeypatch, tmpdir):
+    tags_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tags?per_page=100&page="
+    _reset_github_tag_state(monkeypatch, str(tmpdir))
+    monkeypatch.setattr(GitHub, 'page_fetch_workers', 2)
+    _add_tag_pages(tags_url, [['v1.0.0+2'], ['v1.0.0+1'], ['v1.0.0']])
+    responses.replace(responses.GET, tags_url + '1', status=200,
+                      json=[{'name': 'v1.0.0+2', 'commit': {'sha': 'v1.0.0+2-sha'}}],
+                      headers={'ETag': '"abc"', 'Link': '<{url}2>; rel="next", <{url}3>; rel="last"'.format(url=tags_url)})
+    GitHub(verify_repo=False).get_all_tags_and_shas_from_github(need_release=1)
+
+    # a later pipeline on the same agent gets a 304 for the first page, which has no link header
+    _reset_github_tag_state(monkeypatch, str(tmpdir))
+    responses.replace(responses.GET, tags_url + '1', status=304)
+    executor = MagicMock(wraps=github_module.ThreadPoolExecutor)
+    monkeypatch.setattr(github_module, 'ThreadPoolExecutor', executor)
+
+    tags = GitHub(verify_repo=False).get_all_tags_and_shas_from_github(need_release=1)
+
+    assert [name for name, _ in tags] == ['v1.0.0+2', 'v1.0.0+1', 'v1.0.0']
+    executor.assert_called_once_with(max_workers=2)
+
+
+@responses.activate
+def test_get_all_tags_and_shas_from_github_workers_read_a_copy_of_the_cached_pages(monkeypatch, tmpdir):
+    tags_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tags?per_page=100&page="
+    _reset_github_tag_state(monkeypatch, str(tmpdir))
+    monkeypatch.setattr(GitHub, 'page_fetch_workers', 2)
+    for page in (1, 2, 3):
+        links = '<{url}{next}>; rel="next", <{url}3>; rel="last"'.format(url=tags_url, next=page + 1)
+        responses.add(responses.GET, tags_url + str(page), status=200,
+                      headers={'ETag': '"page-{}"'.format(page), 'Link': links if page < 3 else ''},
+                      json=[{'name': 'v1.0.{}'.format(3 - page), 'commit': {'sha': 'sha{}'.format(page)}}])
+    GitHub(verify_repo=False).get_all_tags_and_shas_from_github(need_tag='v0.0.0')
+
+    # a tag was deleted, so page 2 is now the last one and the cache is cut down while page 3 is in flight
+    _reset_github_tag_state(monkeypatch, str(tmpdir))
+    responses.reset()
+    responses.add(responses.GET, tags_url + '1', status=304)
+    responses.add(responses.GET, tags_url + '2', status=200, headers={'ETag': '"page-2b"'},
+                  json=[{'name': 'v1.0.0', 'commit': {'sha': 'sha3'}}])
+    responses.add(responses.GET, tags_url + '3', status=304)
+    get_tag_page = GitHub._get_tag_page
+    page_3_started = threading.Event()
+
+    def slow_page_3(self, *args):
+        if args[-1] == 2:
+            # hold page 2 back until page 3 is in flight, otherwise the pool cancels page 3 once page 2 is the last
+            page_3_started.wait(1)
+        if args[-1] == 3:
+            page_3_started.set()
+            for _ in range(100):
+                if len(GitHub.cached_tag_pages) == 2:
+                    break
+                time.sleep(0.01)
+        return get_tag_page(self, *args)
+
+    monkeypatch.setattr(GitHub, '_get_tag_page', slow_page_3)
+
+    tags = GitHub(verify_repo=False).get_all_tags_and_shas_from_github(need_tag='v0.0.0')
+
+    assert [name for name, _ in tags] == ['v1.0.2', 'v1.0.0']
+    page_3 = [call.request for call in responses.calls if call.request.url.endswith('page=3')]
+    assert page_3[0].headers['If-None-Match'] == '"page-3"'
+
+
+def test_fetch_commit_history_between_tags_from_local_checkout(monkeypatch, tmpdir):
+    repo_dir = str(tmpdir)
+    git = ['git', '-c', 'user.name=flow', '-c', 'user.email=flow@example.com']
+    subprocess.check_call(git + ['init', '-q', '-b', 'develop'], cwd=repo_dir)
+    for message in ['first', 'second', 'third']:
+        subprocess.check_call(git + ['commit', '-q', '--allow-empty', '-m', message], cwd=repo_dir)
+        if message == 'first':
+            subprocess.check_call(git + ['tag', 'v1.0.0'], cwd=repo_dir)
+
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['develop']
+    _b.json_config = mock_build_config_dict
+    _reset_github_commit_state(monkeypatch, '')
+    monkeypatch.setattr(GitHub, 'backend', 'local')
+    monkeypatch.setattr(GitHub, 'local_git', LocalGit(repo_dir))
+
+    with patch('flow.utils.commons.printMSG'):
+        _github = GitHub(config_override=_b, verify_repo=False)
+        _github.get_all_commits_from_github = MagicMock()
+        commits = _github.get_all_git_commit_history_between_provided_tags([1, 0, 0, 0])
+
+    assert [commit[8:] for commit in commits] == ['third', 'second']
+    _github.get_all_commits_from_github.assert_not_called()
+
+
+def _reset_github_graphql_state(monkeypatch):
+    _reset_github_commit_state(monkeypatch, '')
+    monkeypatch.setattr(GitHub, 'backend', 'graphql')
+    monkeypatch.setattr(GitHub, 'token', 'fake-token')
+    monkeypatch.setattr(GitHub, 'graphql_tags_cursor', None)
+    monkeypatch.setattr(GitHub, 'graphql_found_all_tags', False)
+    monkeypatch.setattr(GitHub, 'graphql_commits_cursor', None)
+
+
+def _graphql_page(nodes, has_next, cursor):
+    return {'pageInfo': {'hasNextPage': has_next, 'endCursor': cursor}, 'nodes': nodes}
+
+
+def test_get_graphql_url():
+    _github = GitHub(verify_repo=False)
+
+    with patch.object(GitHub, 'url', 'https://fakegithub.com/api/v3/repos'):
+        assert _github._get_graphql_url() == 'https://fakegithub.com/api/graphql'
+    with patch.object(GitHub, 'url', 'https://api.github.com/repos/'):
+        assert _github._get_graphql_url() == 'https://api.github.com/graphql'
+
+
+@responses.activate
+def test_graphql_tags_and_commits_share_a_round_trip(monkeypatch):
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['develop']
+    _reset_github_graphql_state(monkeypatch)
+
+    responses.add(responses.POST, 'https://fakegithub.com/api/graphql', status=200, json={'data': {'repository': {
+        'refs': _graphql_page([{'name': 'v1.0.0+1', 'target': {'oid': 'tag-object', 'target': {'oid': 'sha2'}}},
+                               {'name': 'v1.0.0', 'target': {'oid': 'sha1'}}], False, 'tags-1'),
+        'ref': {'target': {'history': _graphql_page([{'oid': 'sha3', 'message': 'third'},
+                                                      {'oid': 'sha2', 'message': 'second'}], True, 'commits-1')}}
+    }}})
+    responses.add(responses.POST, 'https://fakegithub.com/api/graphql', status=200, json={'data': {'repository': {
+        'ref': {'target': {'history': _graphql_page([{'oid': 'sha1', 'message': 'first'}], False, 'commits-2')}}
+    }}})
+
+    with patch('flow.utils.commons.printMSG'):
+        _github = GitHub(config_override=_b, verify_repo=False)
+        commits = _github.get_all_git_commit_history_between_provided_tags([1, 0, 0, 0])
+
+    assert GitHub.all_tags_and_shas == [('v1.0.0+1', 'sha2'), ('v1.0.0', 'sha1')]
+    assert commits == ['sha3 third', 'sha2 second']
+    assert len(responses.calls) == 2
+
+    first_query = json.loads(responses.calls[0].request.body)
+    assert first_query['variables']['withTags'] is True
+    assert first_query['variables']['withCommits'] is True
+    assert first_query['variables']['branch'] == 'refs/heads/develop'
+    assert responses.calls[0].request.headers['Authorization'] == 'bearer fake-token'
+
+    second_query = json.loads(responses.calls[1].request.body)
+    assert second_query['variables']['withTags'] is False
+    assert second_query['variables']['commitsCursor'] == 'commits-1'
+
+
+@responses.activate
+def test_graphql_tags_stop_once_found(monkeypatch):
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['develop']
+    _reset_github_graphql_state(monkeypatch)
+    monkeypatch.setattr(GitHub, 'found_all_commits', True)
+
+    responses.add(responses.POST, 'https://fakegithub.com/api/graphql', status=200, json={'data': {'repository': {
+        'refs': _graphql_page([{'name': 'v1.0.0+1', 'target': {'oid': 'sha2'}}], True, 'tags-1')
+    }}})
+    responses.add(responses.POST, 'https://fakegithub.com/api/graphql', status=200, json={'data': {'repository': {
+        'refs': _graphql_page([{'name': 'v1.0.0', 'target': {'oid': 'sha1'}}], True, 'tags-2')
+    }}})
+
+    with patch('flow.utils.commons.printMSG'):
+        tags = GitHub(config_override=_b, verify_repo=False).get_all_tags_and_shas_from_github(need_release=1)
+
+    assert tags == [('v1.0.0+1', 'sha2'), ('v1.0.0', 'sha1')]
+    assert len(responses.calls) == 2
+    assert json.loads(responses.calls[1].request.body)['variables']['tagsCursor'] == 'tags-1'
+
+
+@responses.activate
+def test_graphql_errors_exit(monkeypatch):
+    _b = MagicMock(BuildConfig)
+    _b.build_env_info = mock_build_config_dict['environments']['develop']
+    _reset_github_graphql_state(monkeypatch)
+
+    responses.add(responses.POST, 'https://fakegithub.com/api/graphql', status=200,
+                  json={'data': None, 'errors': [{'message': 'Could not resolve to a Repository'}]})
+
+    with patch('flow.utils.commons.printMSG'):
+        with pytest.raises(SystemExit):
+            GitHub(config_override=_b, verify_repo=False).get_all_tags_and_shas_from_github()
+
+
+def test_semver_index_only_parses_new_tags():
+    _github = GitHub(verify_repo=False)
+    tags = [('v1.0.0+2', 'sha'), ('v1.0.0', 'sha'), ('not-a-version', 'sha'), ('v0.9.0+1', 'sha')]
+    _github.get_all_tags_and_shas_from_github = MagicMock(return_value=tags)
+
+    with patch.object(SemverIndex, '_add', autospec=True, side_effect=SemverIndex._add) as mock_add:
+        assert _github.get_highest_semver_tag() == [1, 0, 0, 2]
+        assert _github.get_highest_semver_release_tag() == [1, 0, 0, 0]
+        assert mock_add.call_count == 4
+
+        # another page of tags showing up only parses the new page
+        tags.append(('v1.1.0', 'sha'))
+        assert _github.get_highest_semver_release_tag() == [1, 1, 0, 0]
+        assert _github.get_all_semver_tags() == [[1, 1, 0, 0], [1, 0, 0, 2], [1, 0, 0, 0], [0, 9, 0, 1]]
+        assert mock_add.call_count == 5
+
+
+def test_semver_index_lookups():
+    index = SemverIndex().update([('v1.2.0+3', 'sha'), ('v1.2.0', 'sha'), ('v1.10.0+1', 'sha'), ('v1.2.0+12', 'sha'),
+                                  ('v1.1.0', 'sha'), ('v1.1.0+4', 'sha')])
+
+    assert index.highest_from_base([1, 2, 0, 0]) == [1, 2, 0, 12]
+    assert index.highest_from_base([1, 3, 0, 0]) is None
+    assert index.exists([1, 10, 0, 1]) is True
+    assert index.exists([1, 10, 0, 0]) is False
+    assert index.previous([1, 2, 0, 12], 'snapshot') == 'v1.2.0+3'
+    assert index.previous([1, 10, 0, 1], 'snapshot') == 'v1.2.0+12'
+    assert index.previous([1, 2, 0, 0], 'release') == 'v1.1.0'
+    assert index.previous([1, 1, 0, 0], 'release') is None
+
+
+def test_get_git_previous_tag_uses_version_order():
+    _github = GitHub(verify_repo=False)
+    old_artifact_category = _github.config.artifact_category
+    # tags listed by commit date rather than by version
+    _github.get_all_tags_and_shas_from_github = MagicMock(return_value=[
+        ('v1.2.0+1', 'sha'), ('v1.10.0+1', 'sha'), ('v1.9.0+2', 'sha'), ('v1.9.0', 'sha')])
+
+    _github.config.artifact_category = 'snapshot'
+    assert _github.get_git_previous_tag('v1.10.0+1') == 'v1.9.0+2'
+    # a version that was never tagged has no previous tag, even when lower versions exist
+    assert _github.get_git_previous_tag('v1.9.5+1') is None
+
+    _github.config.artifact_category = old_artifact_category
+
+
+def _github_tarball(entries):
+    tar_bytes = io.BytesIO()
+    with tarfile.open(fileobj=tar_bytes, mode='w:gz') as tar:
+        for name, content in entries:
+            info = tarfile.TarInfo(name)
+            if content is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            else:
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+    return tar_bytes.getvalue()
+
+
+@responses.activate
+def test_download_code_at_version_streams_into_push_location(tmpdir):
+    tarball_url = 'https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tarball/v1.0.0'
+    responses.add(responses.GET, tarball_url, status=200, content_type='application/x-gzip',
+                  body=_github_tarball([('Org-GitHub-Repo-GitHub-abc123/', None),
+                                        ('Org-GitHub-Repo-GitHub-abc123/README.md', b'readme'),
+                                        ('Org-GitHub-Repo-GitHub-abc123/src/', None),
+                                        ('Org-GitHub-Repo-GitHub-abc123/src/app.py', b'print(1)')]))
+
+    _b = MagicMock(BuildConfig)
+    _b.version_number = 'v1.0.0'
+    _b.push_location = str(tmpdir.join('fordeployment'))
+
+    with patch('flow.utils.commons.printMSG'):
+        _github = GitHub(config_override=_b, verify_repo=False)
+        _github._get_artifact_url = MagicMock(return_value=tarball_url)
+        _github.download_code_at_version()
+
+    assert sorted(os.listdir(_b.push_location)) == ['README.md', 'src']
+    assert tmpdir.join('fordeployment', 'src', 'app.py').read() == 'print(1)'
+
+
+@responses.activate
+def test_download_code_at_version_rejects_paths_outside_push_location(tmpdir):
+    tarball_url = 'https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tarball/v1.0.0'
+    responses.add(responses.GET, tarball_url, status=200, content_type='application/x-gzip',
+                  body=_github_tarball([('Org-GitHub-Repo-GitHub-abc123/../../escaped.txt', b'nope')]))
+
+    _b = MagicMock(BuildConfig)
+    _b.version_number = 'v1.0.0'
+    _b.push_location = str(tmpdir.join('fordeployment'))
+
+    with patch('flow.utils.commons.printMSG'):
+        _github = GitHub(config_override=_b, verify_repo=False)
+        _github._get_artifact_url = MagicMock(return_value=tarball_url)
+        with pytest.raises(SystemExit):
+            _github.download_code_at_version()
+
+    assert not tmpdir.join('escaped.txt').exists()
+
+
+@responses.activate
+def test_get_artifact_url_revalidates_cached_release(monkeypatch, tmpdir):
+    release_url = 'https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/releases/tags/v1.0.0'
+    _reset_github_tag_state(monkeypatch, str(tmpdir))
+    _b = MagicMock(BuildConfig)
+    _b.version_number = 'v1.0.0'
+
+    responses.add(responses.GET, release_url, status=200, headers={'ETag': '"abc"'},
+                  json={'tarball_url': 'https://fakegithub.com/tarball/v1.0.0'})
+    responses.add(responses.GET, release_url, status=304)
+
+    with patch('flow.utils.commons.printMSG'):
+        _github = GitHub(config_override=_b, verify_repo=False)
+        assert _github._get_artifact_url() == 'https://fakegithub.com/tarball/v1.0.0'
+        assert _github._get_artifact_url() == 'https://fakegithub.com/tarball/v1.0.0'
+
+    assert 'If-None-Match' not in responses.calls[0].request.headers
+    assert responses.calls[1].request.headers['If-None-Match'] == '"abc"'
+
+
+@responses.activate
+def test_response_cache_requests_again_when_the_entry_cannot_be_touched(monkeypatch, tmpdir):
+    release_url = 'https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/releases/tags/v1.0.0'
+    _reset_github_tag_state(monkeypatch, str(tmpdir))
+
+    responses.add(responses.GET, release_url, status=200, headers={'ETag': '"abc"'}, json={'name': 'old'})
+    responses.add(responses.GET, release_url, status=304)
+    responses.add(responses.GET, release_url, status=200, headers={'ETag': '"def"'}, json={'name': 'new'})
+
+    _github = GitHub(verify_repo=False)
+    with patch('flow.utils.commons.printMSG'):
+        _github._get_with_response_cache(release_url, {})
+        # another run evicted the entry after it was read
+        with patch('os.utime', side_effect=FileNotFoundError):
+            resp = _github._get_with_response_cache(release_url, {})
+
+    assert resp.json() == {'name': 'new'}
+    assert responses.calls[1].request.headers['If-None-Match'] == '"abc"'
+    assert 'If-None-Match' not in responses.calls[2].request.headers
+
+
+@responses.activate
+def test_response_cache_evicts_least_recently_used(monkeypatch, tmpdir):
+    _reset_github_tag_state(monkeypatch, str(tmpdir))
+    monkeypatch.setattr(GitHub, 'response_cache_max_mb', 1.5)
+    body = 'x' * (1024 * 1024)
+
+    for name in ['first', 'second']:
+        responses.add(responses.GET, 'https://fakegithub.com/' + name, status=200, headers={'ETag': name}, body=body)
+
+    _github = GitHub(verify_repo=False)
+    with patch('flow.utils.commons.printMSG'):
+        _github._get_with_response_cache('https://fakegithub.com/first', {})
+        os.utime(_github._get_cache_file('response', 'https://fakegithub.com/first',
+                                         hashlib.sha1(b'').hexdigest()), (0, 0))
+        _github._get_with_response_cache('https://fakegithub.com/second', {})
+
+    cached = os.listdir(str(tmpdir.join('github')))
+    assert cached == [os.path.basename(_github._get_cache_file('response', 'https://fakegithub.com/second',
+                                                               hashlib.sha1(b'').hexdigest()))]
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_rate_limiter_spreads_the_last_calls_until_reset():
+    clock = _FakeClock()
+    limiter = RateLimiter(sleep=clock.sleep, clock=clock.time)
+    limiter.update(MagicMock(status_code=200, headers={'X-RateLimit-Remaining': '2', 'X-RateLimit-Reset': '1010'}))
+
+    with patch('flow.utils.commons.printMSG'):
+        limiter.wait()
+        limiter.wait()
+        limiter.wait()
+
+    assert clock.sleeps == [5.0, 5.0]
+    assert limiter.throttled_seconds == 10.0
+
+
+def test_rate_limiter_honors_retry_after():
+    clock = _FakeClock()
+    limiter = RateLimiter(sleep=clock.sleep, clock=clock.time)
+
+    with patch('flow.utils.commons.printMSG'):
+        assert limiter.update(MagicMock(status_code=403, headers={'Retry-After': '30'}, text='')) is True
+        assert limiter.update(MagicMock(status_code=403, headers={}, text='Resource not accessible')) is False
+        limiter.wait()
+
+    assert clock.sleeps == [30.0]
+
+
+@responses.activate
+def test_get_all_tags_and_shas_from_github_waits_out_secondary_rate_limit(monkeypatch):
+    tags_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tags?per_page=100&page=1"
+    _reset_github_tag_state(monkeypatch, '')
+    clock = _FakeClock()
+    monkeypatch.setattr(GitHub, 'rate_limiter', RateLimiter(sleep=clock.sleep, clock=clock.time))
+
+    responses.add(responses.GET, tags_url, status=403, headers={'Retry-After': '60'},
+                  json={'message': 'You have exceeded a secondary rate limit.'})
+    responses.add(responses.GET, tags_url, status=200, json=[{'name': 'v1.0.0', 'commit': {'sha': 'sha1'}}])
+
+    with patch('flow.utils.commons.printMSG'):
+        tags = GitHub(verify_repo=False).get_all_tags_and_shas_from_github()
+
+    assert tags == [('v1.0.0', 'sha1')]
+    assert len(responses.calls) == 2
+    assert sum(clock.sleeps) == pytest.approx(60)
+    assert GitHub.rate_limiter.throttled_seconds == pytest.approx(60)
+
+
+@responses.activate
+def test_get_all_tags_and_shas_from_github_does_not_retry_forbidden(monkeypatch):
+    tags_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/tags?per_page=100&page=1"
+    _reset_github_tag_state(monkeypatch, '')
+    clock = _FakeClock()
+    monkeypatch.setattr(GitHub, 'rate_limiter', RateLimiter(sleep=clock.sleep, clock=clock.time))
+
+    responses.add(responses.GET, tags_url, status=403, json={'message': 'Must have admin rights to Repository.'})
+
+    with patch('flow.utils.commons.printMSG'):
+        with pytest.raises(SystemExit):
+            GitHub(verify_repo=False).get_all_tags_and_shas_from_github()
+
+    assert len(responses.calls) == 1
+    assert clock.sleeps == []
+
+
+def _release_github():
+    with patch('flow.utils.commons.execute_command', return_value="master\n"):
+        _b = MagicMock(BuildConfig)
+        _b.build_env_info = mock_build_config_dict['environments']['develop']
+        _b.json_config = mock_build_config_dict
+        _b.project_name = mock_build_config_dict['projectInfo']['name']
+        _github = GitHub(config_override=_b, verify_repo=False)
+        _github._verify_required_attributes()
+    return _github
+
+
+@responses.activate
+def test_add_tag_and_release_notes_to_github_waits_out_secondary_rate_limit(monkeypatch):
+    release_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/releases"
+    clock = _FakeClock()
+    monkeypatch.setattr(GitHub, 'rate_limiter', RateLimiter(sleep=clock.sleep, clock=clock.time))
+
+    responses.add(responses.POST, release_url, status=403, headers={'Retry-After': '60'},
+                  json={'message': 'You have exceeded a secondary rate limit.'})
+    responses.add(responses.POST, release_url, status=201)
+
+    with patch('flow.utils.commons.printMSG'):
+        _release_github().add_tag_and_release_notes_to_github([0, 0, 0, 1])
+
+    assert len(responses.calls) == 2
+    assert GitHub.rate_limiter.throttled_seconds == pytest.approx(60)
+
+
+@responses.activate
+def test_add_tag_and_release_notes_to_github_does_not_resend_after_server_error(monkeypatch):
+    release_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub/releases"
+    clock = _FakeClock()
+    monkeypatch.setattr(GitHub, 'rate_limiter', RateLimiter(sleep=clock.sleep, clock=clock.time))
+
+    responses.add(responses.POST, release_url, status=502)
+
+    with patch('flow.utils.commons.printMSG'):
+        with pytest.raises(SystemExit):
+            _release_github().add_tag_and_release_notes_to_github([0, 0, 0, 1])
+
+    assert len(responses.calls) == 1
+    assert clock.sleeps == []
+
+
+@responses.activate
+def test_verify_repo_existence_is_paced_by_the_rate_limiter(monkeypatch, tmpdir):
+    repo_url = "https://fakegithub.com/api/v3/repos/Org-GitHub/Repo-GitHub"
+    clock = _FakeClock()
+    monkeypatch.setattr(GitHub, 'rate_limiter', RateLimiter(sleep=clock.sleep, clock=clock.time))
+    monkeypatch.setattr(GitHub, 'cache_dir', str(tmpdir))
+
+    responses.add(responses.GET, repo_url, status=429, headers={'Retry-After': '30'})
+    responses.add(responses.GET, repo_url, status=200, json={'name': 'Repo-GitHub'})
+
+    with patch('flow.utils.commons.printMSG'):
+        _release_github()._verify_repo_existence("https://fakegithub.com/api/v3/repos", 'Org-GitHub', 'Repo-GitHub')
+
+    assert len(responses.calls) == 2
+    assert GitHub.rate_limiter.throttled_seconds == pytest.approx(30)
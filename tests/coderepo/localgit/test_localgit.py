@@ -0,0 +1,124 @@
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+from flow.coderepo.localgit.localgit import LocalGit, LocalGitException
+
+
+def _git(cwd, *args):
+    subprocess.check_call(['git', '-c', 'user.name=flow', '-c', 'user.email=flow@example.com'] + list(args),
+                          cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _rev_parse(cwd, ref):
+    return subprocess.check_output(['git', 'rev-parse', ref], cwd=cwd).decode('utf-8').strip()
+
+
+@pytest.fixture
+def git_repo(tmpdir):
+    repo_dir = str(tmpdir.mkdir('repo'))
+    _git(repo_dir, 'init', '-q', '-b', 'develop')
+    _git(repo_dir, 'commit', '-q', '--allow-empty', '-m', 'first commit')
+    _git(repo_dir, 'tag', 'v1.0.0+1')
+    _git(repo_dir, 'commit', '-q', '--allow-empty', '-m', 'second commit\n\nwith a body')
+    _git(repo_dir, 'tag', '-a', 'v1.0.0+2', '-m', 'annotated')
+    _git(repo_dir, 'commit', '-q', '--allow-empty', '-m', 'third commit')
+    return repo_dir
+
+
+def test_is_usable(git_repo):
+    with patch('flow.utils.commons.printMSG'):
+        assert LocalGit(git_repo).is_usable() is True
+
+
+def test_is_usable_not_a_checkout(tmpdir):
+    with patch('flow.utils.commons.printMSG'):
+        assert LocalGit(str(tmpdir.mkdir('empty'))).is_usable() is False
+
+
+def test_is_usable_shallow_clone(git_repo, tmpdir):
+    shallow_dir = str(tmpdir.join('shallow'))
+    _git(str(tmpdir), 'clone', '-q', '--depth', '1', 'file://' + git_repo, shallow_dir)
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        assert LocalGit(shallow_dir).is_usable() is False
+        mock_printmsg_fn.assert_any_call('LocalGit', 'is_usable', "{} is a shallow clone and cannot answer history "
+                                                                  "lookups".format(shallow_dir), 'WARN')
+
+
+def test_get_tags_and_shas_peels_annotated_tags(git_repo):
+    with patch('flow.utils.commons.printMSG'):
+        tags = LocalGit(git_repo).get_tags_and_shas()
+
+    assert tags == [('v1.0.0+2', _rev_parse(git_repo, 'HEAD~1')), ('v1.0.0+1', _rev_parse(git_repo, 'HEAD~2'))]
+
+
+def test_get_commits_between_tag_and_branch(git_repo):
+    local_git = LocalGit(git_repo)
+
+    with patch('flow.utils.commons.printMSG'):
+        branch_ref = local_git.resolve_branch('develop')
+        commits = local_git.get_commits(_rev_parse(git_repo, 'v1.0.0+1') + '..' + branch_ref)
+
+    assert branch_ref == 'develop'
+    assert commits == [
+        {'sha': _rev_parse(git_repo, 'HEAD'), 'commit': {'message': 'third commit'}},
+        {'sha': _rev_parse(git_repo, 'HEAD~1'), 'commit': {'message': 'second commit\n\nwith a body'}}
+    ]
+
+
+def test_resolve_branch_missing(git_repo):
+    with patch('flow.utils.commons.printMSG'):
+        assert LocalGit(git_repo).resolve_branch('does-not-exist') is None
+
+
+def test_is_ancestor(git_repo):
+    local_git = LocalGit(git_repo)
+
+    with patch('flow.utils.commons.printMSG'):
+        assert local_git.is_ancestor('v1.0.0+1', 'develop') is True
+        assert local_git.is_ancestor('develop', 'v1.0.0+1') is False
+
+
+def test_get_commits_bad_range(git_repo):
+    with patch('flow.utils.commons.printMSG'):
+        with pytest.raises(LocalGitException):
+            LocalGit(git_repo).get_commits('nope..develop')
+
+
+@pytest.mark.parametrize('remote_url', ['https://github.com/Org-GitHub/Repo-GitHub.git',
+                                        'git@github.com:org-github/repo-github.git',
+                                        'ssh://git@github.company.com/Org-GitHub/Repo-GitHub'])
+def test_is_usable_checkout_of_the_configured_repo(git_repo, remote_url):
+    _git(git_repo, 'remote', 'add', 'origin', remote_url)
+
+    with patch('flow.utils.commons.printMSG'):
+        assert LocalGit(git_repo, 'Org-GitHub/Repo-GitHub').is_usable() is True
+
+
+def test_is_usable_checkout_of_another_repo(git_repo):
+    _git(git_repo, 'remote', 'add', 'origin', 'https://github.com/Org-GitHub/Other-Repo.git')
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn:
+        assert LocalGit(git_repo, 'Org-GitHub/Repo-GitHub').is_usable() is False
+        mock_printmsg_fn.assert_any_call('LocalGit', '_is_checkout_of', "{} is a checkout of Org-GitHub/Other-Repo, "
+                                                                        "not Org-GitHub/Repo-GitHub".format(git_repo),
+                                         'WARN')
+
+
+def test_is_usable_checkout_without_origin(git_repo):
+    with patch('flow.utils.commons.printMSG'):
+        assert LocalGit(git_repo, 'Org-GitHub/Repo-GitHub').is_usable() is False
+
+
+def test_get_tags_and_shas_fetches_once(git_repo):
+    local_git = LocalGit(git_repo)
+
+    with patch('flow.utils.commons.printMSG'), patch.object(local_git, 'refresh_tags') as mock_refresh_tags:
+        tags = local_git.get_tags_and_shas()
+        _git(git_repo, 'tag', 'v1.0.0+3')
+
+        assert local_git.get_tags_and_shas() is tags
+
+    mock_refresh_tags.assert_called_once_with()
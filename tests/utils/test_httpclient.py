@@ -0,0 +1,97 @@
+import configparser
+
+import responses
+
+import flow.utils.httpclient as httpclient
+from flow.buildconfig import BuildConfig
+
+
+def setup_function():
+    httpclient.close()
+
+
+@responses.activate
+def test_sessions_are_shared_per_host():
+    responses.add(responses.GET, 'https://fakegithub.com/one', status=200)
+    responses.add(responses.GET, 'https://fakegithub.com/two', status=200)
+    responses.add(responses.GET, 'https://faketracker.com/one', status=503)
+
+    session = httpclient.get_session('https://fakegithub.com/one')
+    httpclient.get('https://fakegithub.com/one')
+    httpclient.get('https://fakegithub.com/two')
+    httpclient.get('https://faketracker.com/one')
+
+    assert httpclient.get_session('https://fakegithub.com/two') is session
+    assert httpclient.get_session('https://faketracker.com/one') is not session
+
+    stats = httpclient.get_stats()
+    assert stats['https://fakegithub.com']['requests'] == 2
+    assert stats['https://fakegithub.com']['errors'] == 0
+    assert stats['https://faketracker.com']['requests'] == 1
+    assert stats['https://faketracker.com']['errors'] == 1
+
+
+def test_default_timeout_from_settings(monkeypatch):
+    settings = configparser.ConfigParser()
+    settings.read_string('[project]\nhttp_timeout_default_seconds = 15\n[http]\npool_size = 3\nretries = 4\n')
+    monkeypatch.setattr(BuildConfig, 'settings', settings)
+
+    assert httpclient.get_default_timeout() == 15
+
+    adapter = httpclient.get_session('https://fakegithub.com').get_adapter('https://fakegithub.com')
+    assert adapter._pool_maxsize == 3
+    assert adapter.max_retries.total == 4
+
+
+def test_default_timeout_without_settings(monkeypatch):
+    monkeypatch.setattr(BuildConfig, 'settings', None)
+
+    assert httpclient.get_default_timeout() == httpclient.default_timeout
+
+
+@responses.activate
+def test_request_fills_in_default_timeout(monkeypatch):
+    monkeypatch.setattr(BuildConfig, 'settings', None)
+    responses.add(responses.GET, 'https://fakegithub.com/one', status=200)
+    captured = {}
+    session = httpclient.get_session('https://fakegithub.com')
+    original_request = session.request
+
+    def spy(method, url, **kwargs):
+        captured.update(kwargs)
+        return original_request(method, url, **kwargs)
+
+    monkeypatch.setattr(session, 'request', spy)
+
+    httpclient.get('https://fakegithub.com/one')
+    assert captured['timeout'] == httpclient.default_timeout
+
+    httpclient.get('https://fakegithub.com/one', timeout=5)
+    assert captured['timeout'] == 5
+
+
+def test_session_without_retries_is_separate(monkeypatch):
+    monkeypatch.setattr(BuildConfig, 'settings', None)
+
+    session = httpclient.get_session('https://fakegithub.com', retry=False)
+
+    assert session is not httpclient.get_session('https://fakegithub.com')
+    assert session.get_adapter('https://fakegithub.com').max_retries.total == 0
+    assert httpclient.get_session('https://fakegithub.com').get_adapter('https://fakegithub.com').max_retries.total == \
+        httpclient.default_retries
+
+
+@responses.activate
+def test_only_reads_are_retried(monkeypatch):
+    monkeypatch.setattr(BuildConfig, 'settings', None)
+    monkeypatch.setattr(httpclient, 'default_backoff_factor', 0)
+    for http_method in (responses.GET, responses.PUT, responses.DELETE, responses.POST):
+        responses.add(http_method, 'https://fakeartifactory.com/one', status=503)
+
+    assert httpclient.get('https://fakeartifactory.com/one').status_code == 503
+    assert len(responses.calls) == httpclient.default_retries + 1
+
+    for send in (httpclient.put, httpclient.delete, httpclient.post):
+        responses.calls.reset()
+        assert send('https://fakeartifactory.com/one').status_code == 503
+        assert len(responses.calls) == 1
@@ -0,0 +1,142 @@
+import configparser
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+
+import pytest
+import requests
+
+import flow.utils.httpclient as httpclient
+from flow.artifactstorage.artifactory.artifactory import ArtiFactory
+from flow.buildconfig import BuildConfig
+from flow.zipit.zipit import ZipIt
+
+
+class _ChunkedPutHandler(BaseHTTPRequestHandler):
+    # stands in for artifactory receiving a chunked upload
+    protocol_version = 'HTTP/1.1'
+    timeout = 5
+
+    def do_PUT(self):
+        body = b''
+        try:
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                chunk = self.rfile.read(size + 2)[:-2]
+                if size == 0:
+                    break
+                body += chunk
+        except (ValueError, OSError):
+            # the client gave up before the last chunk
+            self.close_connection = True
+            return
+
+        self.server.uploads.append((self.path, body))
+        data = json.dumps({'checksums': {'sha1': hashlib.sha1(body).hexdigest()}}).encode('utf-8')
+        self.send_response(201)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upload_server():
+    server = HTTPServer(('127.0.0.1', 0), _ChunkedPutHandler)
+    server.uploads = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    httpclient.close()
+    server.shutdown()
+    server.server_close()
+
+
+def _setup_stream(monkeypatch, tmpdir, domain):
+    settings = configparser.ConfigParser()
+    settings.read_string('[zipit]\nstream_upload = true\ncompression = gz\n')
+    monkeypatch.setattr(BuildConfig, 'settings', settings)
+    monkeypatch.setattr(BuildConfig, 'json_config', {'artifact': {
+        'artifactoryDomain': domain, 'artifactoryRepoKey': 'release-repo',
+        'artifactoryRepoKeySnapshot': 'snapshot-repo', 'artifactoryGroup': 'group'}}, raising=False)
+    monkeypatch.setattr(BuildConfig, 'build_env_info', {'artifactCategory': 'release'})
+    monkeypatch.setattr(BuildConfig, 'project_name', 'testproject', raising=False)
+    monkeypatch.setattr(BuildConfig, 'version_number', 'v1.0.0', raising=False)
+    monkeypatch.setattr(BuildConfig, 'artifact_extension', 'tar', raising=False)
+    monkeypatch.setattr(BuildConfig, 'artifact_extensions', None, raising=False)
+    monkeypatch.setattr(ArtiFactory, 'artifactory_extensions', [])
+    monkeypatch.delenv('ARTIFACTORY_TOKEN', raising=False)
+    monkeypatch.chdir(str(tmpdir))
+
+    tmpdir.mkdir('build').join('app.py').write('print(1)')
+    tmpdir.join('build', 'big.bin').write_binary(os.urandom(3 * 1024 * 1024))
+    return str(tmpdir.join('build'))
+
+
+def _producer_running():
+    return any(thread.name == 'zipit-tar-producer' for thread in threading.enumerate())
+
+
+def _wait_for_producer():
+    deadline = time.time() + 5
+    while _producer_running() and time.time() < deadline:
+        time.sleep(0.01)
+    return not _producer_running()
+
+
+def test_stream_upload_sends_the_tar(monkeypatch, tmpdir, upload_server):
+    contents = _setup_stream(monkeypatch, tmpdir, 'http://127.0.0.1:{}/artifactory'.format(upload_server.server_port))
+
+    with patch('flow.utils.commons.printMSG'):
+        ZipIt('artifactory', 'testproject.tar.gz', contents)
+
+    path, body = upload_server.uploads[0]
+    assert path == '/artifactory/release-repo/group/testproject/v1.0.0/testproject.tar.gz'
+    with tarfile.open(fileobj=io.BytesIO(body), mode='r:gz') as tar:
+        assert tar.extractfile('testproject.tar.gz/app.py').read() == b'print(1)'
+    # nothing was written to the working directory
+    assert sorted(os.listdir(str(tmpdir))) == ['build']
+
+
+def test_stream_upload_reports_producer_errors(monkeypatch, tmpdir, upload_server):
+    contents = _setup_stream(monkeypatch, tmpdir, 'http://127.0.0.1:{}/artifactory'.format(upload_server.server_port))
+
+    with patch('flow.utils.commons.printMSG') as mock_printmsg_fn, \
+            patch('tarfile.TarFile.add', side_effect=FileNotFoundError('app.py went missing')):
+        with pytest.raises(SystemExit):
+            ZipIt('artifactory', 'testproject.tar.gz', contents)
+
+    errors = [call[0][2] for call in mock_printmsg_fn.call_args_list if call[0][3:] == ('ERROR',)]
+    assert 'app.py went missing' in errors[0]
+    # the upload never finished, so nothing was stored
+    assert upload_server.uploads == []
+
+
+def test_stream_upload_closes_the_pipe_when_the_upload_fails(monkeypatch, tmpdir):
+    contents = _setup_stream(monkeypatch, tmpdir, 'http://127.0.0.1:1/artifactory')
+    puts = []
+
+    def put(url, data=None, **kwargs):
+        puts.append(kwargs)
+        next(data)
+        raise requests.ConnectionError('connection reset')
+
+    open_fds = len(os.listdir('/proc/self/fd'))
+
+    with patch('flow.utils.commons.printMSG'), patch('flow.utils.httpclient.put', side_effect=put):
+        with pytest.raises(SystemExit):
+            ZipIt('artifactory', 'testproject.tar.gz', contents)
+
+    # a generator can only be sent once, so the client must not retry it
+    assert puts[0]['retry'] is False
+    assert _wait_for_producer()
+    assert len(os.listdir('/proc/self/fd')) == open_fds